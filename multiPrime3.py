@@ -18,6 +18,14 @@ def aggregate_input(wildcards):
 #The values of the wildcard i is this time used to expand the pattern "post/{sample}/{i}.txt",
 #such that the rule intermediate is executed for each of the determined clusters.
 
+def aggregate_msa(wildcards):
+	checkpoint_output = checkpoints.extract_cluster_fa.get(**wildcards).output[1]
+	return expand(config["results_dir"] + "/Clusters_msa/{i}.tmsa",
+		i=glob_wildcards(os.path.join(checkpoint_output, "{i}.fa")).i)
+#All clusters are designed by one multiPrime-core run (batch mode, one process pool),
+#which writes Clusters_primer/{i}.top.primer.out for each cluster and lists the clusters it could not design
+#in Clusters_primer/failed.txt: get_multiPrime fails for those clusters only.
+
 rule all:
 	## LOCAL ##
 #	'''
@@ -186,15 +194,18 @@ rule alignment_by_muscle:
 #-------------------------------------------------------------------------------------------
 rule multiPrime:
 	input:
-		rules.alignment_by_muscle.output
+		aggregate_msa
 	output:
-		config["results_dir"] + "/Clusters_primer/{i}.top.primer.out"
+		config["results_dir"] + "/Clusters_primer/failed.txt"
 	log:
-		config["log_dir"] + "/multiPrime_{i}.log"
+		config["log_dir"] + "/multiPrime.log"
+	threads:
+		config["core_number"]
 	resources:
 		mem_mb = 10000
 	params:
 		script = config["scripts_dir"],
+		out_dir = config["results_dir"] + "/Clusters_primer",
 		dege_number = config["dege_number"],
 		degeneracy = config["degeneracy"],
 		primer_len = config["primer_len"],
@@ -207,17 +218,17 @@ rule multiPrime:
 		"Step7: Design primers by multiPrime .."
 	shell:
 		'''
-		python {params.script}/multiPrime-core_V16.py -i {input} -n {params.dege_number} \
+		python {params.script}/multiPrime-core_V16.py -b -n {params.dege_number} \
 			-d {params.degeneracy} -v {params.variation} -c {params.coordinate} \
 			-g {params.GC} -s {params.min_PCR_size} -l {params.primer_len} \
-			-o {output} -f {params.coverage} -p 1 2>&1 > {log}
+			-o {params.out_dir} -f {params.coverage} -p {threads} {input} 2>&1 > {log}
 		'''
 #-------------------------------------------------------------------------------------------
 # get_degePrimer rule 8: Dependency packages - pandas, biopython, math, operator,functools
 #-------------------------------------------------------------------------------------------
 rule get_multiPrime:
 	input:
-		primer = config["results_dir"] + "/Clusters_primer/{i}.top.primer.out",
+		failed = rules.multiPrime.output,
 		ref_fa = config["results_dir"] + "/Clusters_fa/{i}.tfa"
 	output:
 		config["results_dir"] + "/Clusters_cprimer/{i}.candidate.primers.txt"
@@ -227,6 +238,7 @@ rule get_multiPrime:
 		mem_mb = 10000
 	params:
 		script = config["scripts_dir"],
+		primer = config["results_dir"] + "/Clusters_primer/{i}.top.primer.out",
 		fraction = config["coverage"],
 		size = config["PRODUCT_size"],
 		# maxseq=config["max_seq"],
@@ -238,7 +250,10 @@ rule get_multiPrime:
 		"Step8: Filter candidate primeri pairs for each cluster (hairpin, dimer (F-R) check) .."
 	shell:
 		'''
-		python {params.script}/get_multiPrime.py -i {input.primer} -r {input.ref_fa} \
+		if cut -f 1 {input.failed} | grep -x "{wildcards.i}" > /dev/null; then
+			echo "No candidate primers for {wildcards.i}, see {input.failed}" > {log}; exit 1
+		fi
+		python {params.script}/get_multiPrime.py -i {params.primer} -r {input.ref_fa} \
 			-f {params.fraction} -s {params.size} -g {params.gc_content} -e {params.end} \
 			-d {params.distance} -a {params.adaptor} -m 0\
 			-o {output} -p 1 2>&1 > {log}
@@ -0,0 +1,116 @@
+#!/bin/python
+"""
+Column-major store of a multi-alignment.
+Bases are kept as 4-bit IUPAC masks (see iupac.py) in a (alignment length x sequence number) uint8 matrix,
+so the columns of one primer window are a contiguous block. Non-gap ranks and the columns of non-gap bases
+are computed once per sequence, which makes flank filling independent of the alignment length.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import numpy as np
+from iupac import ENCODE_TABLE, DECODE_TABLE
+
+
+class AlignmentStore(object):
+    def __init__(self, ids, sequences):
+        self.ids = list(ids)
+        self.id_array = np.array(self.ids, dtype=object)
+        self.number = len(self.ids)
+        self.length = max([len(seq) for seq in sequences]) if sequences else 0
+        # columns[j, s]: mask of sequence s at alignment column j. Shorter sequences are padded with gaps.
+        self.columns = np.zeros((self.length, self.number), dtype=np.uint8)
+        for s, seq in enumerate(sequences):
+            self.columns[:len(seq), s] = ENCODE_TABLE[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+        self.build_index()
+
+    def build_index(self):
+        non_gap = self.columns != 0
+        # rank[j, s]: number of non-gap bases of sequence s in columns [0, j).
+        rank_type = np.uint16 if self.length < 2 ** 16 else np.uint32
+        self.rank = np.zeros((self.length + 1, self.number), dtype=rank_type)
+        np.cumsum(non_gap, axis=0, out=self.rank[1:])
+        self.total = self.rank[-1].astype(np.int64)
+        # ungapped sequences, one after another. offset[s] is the first index of sequence s,
+        # select[i] is the alignment column of bases[i].
+        self.offset = np.zeros(self.number + 1, dtype=np.int64)
+        np.cumsum(self.total, out=self.offset[1:])
+        seq_index, column_index = np.nonzero(non_gap.T)
+        self.bases = self.columns[column_index, seq_index]
+        self.select = column_index.astype(np.int32)
+
+    # length - len(sequence.lstrip("-")) of each sequence
+    def seq_start(self):
+        start = np.full(self.number, self.length, dtype=np.int64)
+        has_base = self.total > 0
+        start[has_base] = self.select[self.offset[:-1][has_base]]
+        return start
+
+    # len(sequence.rstrip("-")) of each sequence
+    def seq_stop(self):
+        stop = np.zeros(self.number, dtype=np.int64)
+        has_base = self.total > 0
+        stop[has_base] = self.select[self.offset[1:][has_base] - 1] + 1
+        return stop
+
+    def window_masks(self, start, length):
+        # Masks of columns [start, start + length), one row per sequence. Leading (trailing) gaps are replaced with the
+        # nearest upstream (downstream) bases if the sequence has enough of them; windows with gaps only are kept.
+        stop = start + length
+        block = self.columns[start:stop]
+        masks = block.T.copy()
+        before, until = self.rank[start], self.rank[stop]
+        inside = until > before
+        for s in np.nonzero((block[0] == 0) & inside)[0]:
+            first = self.offset[s] + before[s]
+            lead = self.select[first] - start
+            if before[s] >= lead:
+                masks[s, :lead] = self.bases[first - lead:first]
+        for s in np.nonzero((block[-1] == 0) & inside)[0]:
+            last = self.offset[s] + until[s]
+            trail = stop - 1 - self.select[last - 1]
+            if self.total[s] - until[s] >= trail:
+                masks[s, length - trail:] = self.bases[last:last + trail]
+        return masks
+
+    def window_gap_numbers(self, starts, length):
+        # (windows x sequences) number of gaps in the windows [start, start + length) after flank filling, as counted
+        # on window_masks, from the rank index only: no window is sliced.
+        starts = np.asarray(starts, dtype=np.int64)
+        before = self.rank[starts].astype(np.int64)
+        until = self.rank[starts + length].astype(np.int64)
+        gaps = length - (until - before)
+        if len(self.select) == 0:
+            return gaps
+        inside = until > before
+        # leading gaps are filled if the sequence has as many bases upstream
+        first = np.minimum(self.offset[:-1] + before, len(self.select) - 1)
+        lead = self.select[first] - starts[:, None]
+        gaps -= np.where(inside & (before >= lead), lead, 0)
+        # trailing gaps are filled if the sequence has as many bases downstream
+        last = np.maximum(self.offset[:-1] + until - 1, 0)
+        trail = starts[:, None] + length - 1 - self.select[last]
+        gaps -= np.where(inside & (self.total - until >= trail), trail, 0)
+        return gaps
+
+    def window(self, start, length):
+        # sequences of window_masks
+        text = DECODE_TABLE[self.window_masks(start, length)].tobytes().decode("ascii")
+        return [text[i:i + length] for i in range(0, len(text), length)]
+
+
+def distinct_rows(masks, rows):
+    # Distinct windows among the given rows of window_masks, in order of first occurrence.
+    # Return sequences, number of rows and row indexes (ascending) of each distinct window.
+    if len(rows) == 0:
+        return [], [], []
+    block = np.ascontiguousarray(masks[rows])
+    keys = block.view(np.dtype((np.void, block.shape[1]))).ravel()
+    _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first, kind="stable")
+    # rows grouped by distinct window, in row order
+    members = np.split(rows[np.argsort(inverse.ravel(), kind="stable")], np.cumsum(counts)[:-1])
+    length = block.shape[1]
+    text = DECODE_TABLE[block[first[order]]].tobytes().decode("ascii")
+    sequences = [text[i:i + length] for i in range(0, len(text), length)]
+    return sequences, counts[order].tolist(), [members[g] for g in order]
@@ -0,0 +1,405 @@
+#!/bin/python
+"""
+Benchmark of the primer design pipeline on the fixtures of test_data and on scaled variants of them.
+
+Each step runs as in the workflow (one subprocess per run, parameters of multiPrime3.yaml):
+    multiPrime-core      window scanning of test_data/comparison/1000_fasta.msa       windows / s
+    get_multiPrime       primer pairing of the multiPrime-core output                  pairs / s
+    get_Maxprimerset     primer set selection of test_data/test.results/Clusters_cprimer  candidate pairs / s
+    extract_PCR_product  final_maxprimers_set.xls against the sequences of 1000_fasta  primer pairs x sequences / s
+    finDimer             dimer check of the candidate primers of Clusters_cprimer      primer pairs / s
+Scale k: the input sequences (or candidate lines, primers) are used k times, copies 2..k with 0.1% random substitutions
+(seeded, so every run gets the same inputs). Steps with processes (-p / -n) are run for each worker count.
+
+The report (JSON) has, for each step, scale and worker count: the best wall time of the repeats, the number of items
+processed, the throughput, the peak RSS of the largest process (KB) and the speedup versus the first worker count.
+With -b, throughput and peak RSS are compared with those of a baseline report (e.g. a previous -o), and the exit
+status is 1 if any of them is worse than the tolerance.
+
+A reference report is kept in test_data/benchmark/baseline.json, made from the scripts directory by:
+    python benchmark.py -r 3 -o ../test_data/benchmark/baseline.json
+Its "command", "platform" and "cpu_count" tell how and where it was made. Throughput depends on the machine: compare
+with -b ../test_data/benchmark/baseline.json on a similar one, or make a baseline of your own with the same command
+(at the commit to compare with) and keep it next to it.
+
+Usage: python benchmark.py -o bench.json [-s 1,2] [-w 1,2] [-b baseline.json -t 0.25 -m 0.25]
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+TEST_DATA = os.path.join(os.path.dirname(SCRIPTS), "test_data")
+STEPS = ["multiPrime-core", "get_multiPrime", "get_Maxprimerset", "extract_PCR_product", "finDimer"]
+
+
+def argsParse():
+    parser = OptionParser('Usage: %prog -o bench.json [-s 1,2] [-w 1,2] [-b baseline.json]',
+                          version="%prog 1.0.0",
+                          description="Benchmark of multiPrime-core, get_multiPrime, get_Maxprimerset, "
+                                      "extract_PCR_product and finDimer.")
+
+    parser.add_option('-s', '--scales',
+                      dest='scales',
+                      default="1,2",
+                      type="str",
+                      help='Scales of the inputs, comma separated. Default: 1,2.')
+
+    parser.add_option('-w', '--workers',
+                      dest='workers',
+                      default="1,2",
+                      type="str",
+                      help='Worker counts (-p / -n) of the steps with processes, comma separated. Default: 1,2.')
+
+    parser.add_option('-r', '--repeat',
+                      dest='repeat',
+                      default=1,
+                      type="int",
+                      help='Runs of each benchmark, the best time is kept. Default: 1.')
+
+    parser.add_option('-e', '--steps',
+                      dest='steps',
+                      default=",".join(STEPS),
+                      type="str",
+                      help='Steps to run, comma separated. Default: all ({}).'.format(",".join(STEPS)))
+
+    parser.add_option('-b', '--baseline',
+                      dest='baseline',
+                      default=None,
+                      type="str",
+                      help='Baseline report to compare with. Default: None.')
+
+    parser.add_option('-t', '--time_tolerance',
+                      dest='time_tolerance',
+                      default=0.25,
+                      type="float",
+                      help='Tolerated loss of throughput versus the baseline, fraction. Default: 0.25.')
+
+    parser.add_option('-m', '--memory_tolerance',
+                      dest='memory_tolerance',
+                      default=0.25,
+                      type="float",
+                      help='Tolerated increase of peak RSS versus the baseline, fraction. Default: 0.25.')
+
+    parser.add_option('-d', '--seed',
+                      dest='seed',
+                      default=0,
+                      type="int",
+                      help='Seed of the substitutions of the scaled copies. Default: 0.')
+
+    parser.add_option('-k', '--keep',
+                      dest='keep',
+                      default=None,
+                      type="str",
+                      help='Working directory, kept after the run. Default: a temporary directory, removed.')
+
+    parser.add_option('-o', '--out',
+                      dest='out',
+                      help='Output file: benchmark report (JSON).')
+    (options, args) = parser.parse_args()
+    if options.out is None:
+        parser.print_help()
+        print("No output file provided !!!")
+        sys.exit(1)
+    return parser.parse_args()
+
+
+##############################################################################################
+############################# scaled inputs ##################################################
+##############################################################################################
+def read_fasta(path):
+    # [(header line, sequence), ...] in file order
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                records.append([line, []])
+            elif line and records:
+                records[-1][1].append(line)
+    return [(header, "".join(sequence)) for header, sequence in records]
+
+
+def mutate(sequence, rng, rate=0.001):
+    # substitutions at a fraction of the positions (geometric gaps between them), gaps are kept.
+    # Pure Python: the peak RSS of a child process includes that of this process when it was forked.
+    seq = list(sequence)
+    position = -1
+    while True:
+        position += 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - rate))
+        if position >= len(seq):
+            return "".join(seq)
+        if seq[position] != "-":
+            seq[position] = rng.choice("ACGT")
+
+
+def scale_fasta(path, out, scale, seed):
+    # sequences of path, k times: copy c > 1 has IDs [ID]_c and 0.1% substitutions
+    records = read_fasta(path)
+    rng = random.Random(seed)
+    with open(out, "w") as fo:
+        for copy in range(1, scale + 1):
+            for header, sequence in records:
+                if copy > 1:
+                    header = header.split(" ")[0] + "_{}".format(copy)
+                    sequence = mutate(sequence, rng)
+                fo.write(header + "\n" + sequence + "\n")
+    return out
+
+
+def ungapped(path, out):
+    # reference sequences of an alignment (the same IDs and substitutions)
+    with open(out, "w") as fo:
+        for header, sequence in read_fasta(path):
+            fo.write(header + "\n" + sequence.replace("-", "") + "\n")
+    return out
+
+
+def scale_lines(lines, out, scale):
+    # candidate lines of get_multiPrime, k times: copy c > 1 is renamed [name]_c
+    with open(out, "w") as fo:
+        for copy in range(1, scale + 1):
+            for line in lines:
+                name, rest = line.split("\t", 1)
+                fo.write((name if copy == 1 else "{}_{}".format(name, copy)) + "\t" + rest)
+    return out
+
+
+def candidate_lines():
+    path = os.path.join(TEST_DATA, "test.results", "Clusters_cprimer")
+    lines = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".candidate.primers.txt"):
+            with open(os.path.join(path, name)) as f:
+                lines.extend(line for line in f if line.strip())
+    return lines
+
+
+def pair_number(line):
+    # Primer_F, Primer_R, product, coverage number, start:stop per pair after the name
+    fields = line.rstrip("\n").rstrip("\t").split("\t")
+    return (len(fields) - 1) // 5
+
+
+def candidate_primers(lines, number):
+    # the first number distinct primers (F and R) of the candidate lines
+    primers = []
+    seen = set()
+    for line in lines:
+        fields = line.rstrip("\n").rstrip("\t").split("\t")[1:]
+        for k in range(0, len(fields) - 4, 5):
+            for primer in fields[k:k + 2]:
+                if primer not in seen:
+                    seen.add(primer)
+                    primers.append(primer)
+                    if len(primers) == number:
+                        return primers
+    return primers
+
+
+##############################################################################################
+############################# runs ###########################################################
+##############################################################################################
+def run_command(command, log):
+    # ==> (wall time, peak RSS (KB) of the largest process of the run, output)
+    with open(log, "w") as fo:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=fo, stderr=subprocess.STDOUT, cwd=SCRIPTS)
+        # the resource usage of the child includes its own (waited-for) worker processes
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") \
+            else (status >> 8)
+    with open(log) as f:
+        output = f.read()
+    if process.returncode != 0:
+        print("Error: {} failed ({}):\n{}".format(" ".join(command), process.returncode, output[-2000:]))
+        sys.exit(1)
+    return seconds, usage.ru_maxrss, output
+
+
+class Benchmark(object):
+    def __init__(self, workdir, scales, workers, repeat, seed):
+        self.workdir = workdir
+        self.scales = scales
+        self.workers = workers
+        self.repeat = repeat
+        self.seed = seed
+        self.results = []
+        self.lines = candidate_lines()
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def measure(self, step, scale, workers, command, items, unit):
+        # best time of the repeats; items: number of items processed, or a function of the output of the run
+        best_seconds, peak_rss = None, 0
+        for run in range(self.repeat):
+            seconds, rss, output = run_command(command, self.path("{}.s{}.w{}.log".format(step, scale, workers)))
+            if best_seconds is None or seconds < best_seconds:
+                best_seconds = seconds
+            peak_rss = max(peak_rss, rss)
+        if callable(items):
+            items = items(output)
+        result = {"step": step, "scale": scale, "workers": workers, "seconds": round(best_seconds, 4),
+                  "items": items, "unit": unit, "throughput": round(items / best_seconds, 4),
+                  "peak_rss_kb": peak_rss}
+        print("INFO {} {} scale {} workers {}: {}s, {} {}, {} {}/s, peak RSS {} KB".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time())), step, scale, workers,
+            result["seconds"], items, unit, result["throughput"], unit, peak_rss))
+        self.results.append(result)
+        return result
+
+    def core_output(self, scale):
+        return self.path("core.s{}.out".format(scale))
+
+    def alignment(self, scale):
+        # test_data/comparison/1000_fasta.msa at scale, and its sequences (reference of the later steps)
+        msa = self.path("s{}.msa".format(scale))
+        if not os.path.exists(msa):
+            scale_fasta(os.path.join(TEST_DATA, "comparison", "1000_fasta.msa"), msa, scale, self.seed)
+            ungapped(msa, self.path("s{}.fasta".format(scale)))
+        return msa, self.path("s{}.fasta".format(scale))
+
+    def multiPrime_core(self, scale):
+        msa, ref = self.alignment(scale)
+        for workers in self.workers:
+            command = [sys.executable, "-W", "ignore", "multiPrime-core_V16.py", "-i", msa, "-o",
+                       self.core_output(scale), "-n", "4", "-d", "10", "-v", "1", "-c", "2,-1", "-g", "0.2,0.7",
+                       "-s", "150", "-l", "18", "-f", "0.7", "-p", str(workers)]
+            self.measure("multiPrime-core", scale, workers, command,
+                         lambda output: sum(map(int, re.findall(r": (\d+) windows", output))), "windows")
+
+    def get_multiPrime(self, scale):
+        if not os.path.exists(self.core_output(scale)):
+            self.multiPrime_core(scale)
+        msa, ref = self.alignment(scale)
+        out = self.path("pairs.s{}.txt".format(scale))
+        for workers in self.workers:
+            command = [sys.executable, "-W", "ignore", "get_multiPrime_V7.py", "-i", self.core_output(scale),
+                       "-r", ref, "-o", out, "-f", "0.7", "-s", "150,1200", "-g", "0.2,0.7", "-e", "4", "-d", "4",
+                       "-a", ",", "-m", "0", "-p", str(workers)]
+            self.measure("get_multiPrime", scale, workers, command,
+                         lambda output: sum(pair_number(line) for line in open(out) if line.strip()), "pairs")
+
+    def get_Maxprimerset(self, scale):
+        candidates = scale_lines(self.lines, self.path("candidates.s{}.txt".format(scale)), scale)
+        command = [sys.executable, "-W", "ignore", "get_Maxprimerset_V1.3.alpha.py", "-i", candidates, "-s", "5",
+                   "-m", "T", "-o", self.path("max.s{}.xls".format(scale))]
+        self.measure("get_Maxprimerset", scale, 1, command, sum(pair_number(line) for line in self.lines) * scale,
+                     "candidate pairs")
+
+    def extract_PCR_product(self, scale):
+        primers = os.path.join(TEST_DATA, "test.results", "Primers_set", "final_maxprimers_set.xls")
+        msa, ref = self.alignment(scale)
+        with open(primers) as f:
+            pairs = sum(1 for line in f if line.strip() and not line.startswith("#"))
+        sequences = sum(1 for _ in read_fasta(ref))
+        for workers in self.workers:
+            command = [sys.executable, "-W", "ignore", "extract_PCR_product_V1.py", "-i", primers, "-r", ref,
+                       "-f", "xls", "-p", str(workers), "-o", self.path("PCR_product.s{}.w{}".format(scale, workers)),
+                       "-s", self.path("coverage.s{}.w{}.xls".format(scale, workers))]
+            self.measure("extract_PCR_product", scale, workers, command, pairs * sequences,
+                         "primer pairs x sequences")
+
+    def finDimer(self, scale):
+        primers = candidate_primers(self.lines, 40 * scale)
+        fasta = self.path("primers.s{}.fa".format(scale))
+        with open(fasta, "w") as fo:
+            for k, primer in enumerate(primers):
+                fo.write(">primer_{}\n{}\n".format(k, primer))
+        for workers in self.workers:
+            command = [sys.executable, "-W", "ignore", "finDimer_V4.py", "-i", fasta, "-n", str(workers),
+                       "-o", self.path("dimer.s{}.w{}.txt".format(scale, workers))]
+            self.measure("finDimer", scale, workers, command, len(primers) * (len(primers) + 1) // 2,
+                         "primer pairs")
+
+    def run(self, steps):
+        for step in STEPS:
+            if step in steps:
+                for scale in self.scales:
+                    getattr(self, step.replace("-", "_"))(scale)
+        self.add_speedup()
+
+    def add_speedup(self):
+        # speedup of each worker count versus the first one, same step and scale
+        first = {}
+        for result in self.results:
+            key = result["step"], result["scale"]
+            first.setdefault(key, result["seconds"])
+            result["speedup"] = round(first[key] / result["seconds"], 4)
+
+
+def result_key(result):
+    return result["step"], result["scale"], result["workers"]
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    # ==> regressions: [(key, metric, baseline value, value), ...]
+    base = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key not in base:
+            continue
+        if result["throughput"] < base[key]["throughput"] * (1 - time_tolerance):
+            regressions.append((key, "throughput", base[key]["throughput"], result["throughput"]))
+        if result["peak_rss_kb"] > base[key]["peak_rss_kb"] * (1 + memory_tolerance):
+            regressions.append((key, "peak_rss_kb", base[key]["peak_rss_kb"], result["peak_rss_kb"]))
+    return regressions
+
+
+def main():
+    options, args = argsParse()
+    scales = [int(i) for i in options.scales.split(",")]
+    workers = [int(i) for i in options.workers.split(",")]
+    steps = [i.strip() for i in options.steps.split(",")]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        print("Error: unknown step(s) {}. Use {}.".format(",".join(sorted(unknown)), ",".join(STEPS)))
+        sys.exit(1)
+    if options.keep is not None:
+        os.makedirs(options.keep, exist_ok=True)
+        workdir = options.keep
+    else:
+        workdir = tempfile.mkdtemp(prefix="multiPrime_benchmark_")
+    try:
+        bench = Benchmark(workdir, scales, workers, options.repeat, options.seed)
+        bench.run(steps)
+    finally:
+        if options.keep is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report = {"date": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time())),
+              "command": " ".join(["python", "benchmark.py"] + sys.argv[1:]),
+              "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+              "scales": scales, "workers": workers, "repeat": options.repeat, "seed": options.seed,
+              "results": bench.results}
+    with open(options.out, "w") as fo:
+        json.dump(report, fo, indent=4)
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(bench.results, baseline, options.time_tolerance, options.memory_tolerance)
+        for (step, scale, worker_number), metric, base_value, value in regressions:
+            print("Regression: {} scale {} workers {}: {} {} (baseline {})".format(
+                step, scale, worker_number, metric, value, base_value))
+        if regressions:
+            sys.exit(1)
+        print("INFO no regression versus {} (tolerance: throughput {}, peak RSS {})".format(
+            options.baseline, options.time_tolerance, options.memory_tolerance))
+
+
+if __name__ == "__main__":
+    main()
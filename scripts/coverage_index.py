@@ -0,0 +1,72 @@
+#!/bin/python
+"""
+Position-indexed coverage of the observed sequences (variants) of a primer window.
+For each position and base, the variants carrying that base are kept as one bit set (a python int, bit i =
+variant i). A (degenerate) primer covers the AND over its positions of the bit sets of its bases, so the coverage of
+a primer, or the sequences gained by widening one position with one more base, is computed from the observed
+variants without expanding the primer: the cost grows with the number of variants, not with the degeneracy.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+from degenerate import degenerate_base
+
+
+class CoverageIndex(object):
+    # cover: {variant: number}, variants of the same length (the cover dict of multiPrime-core)
+    def __init__(self, cover):
+        self.variants = list(cover.keys())
+        self.counts = list(cover.values())
+        self.length = len(self.variants[0]) if self.variants else 0
+        self.bits = [{} for _ in range(self.length)]
+        for idx, variant in enumerate(self.variants):
+            bit = 1 << idx
+            for position, base in enumerate(variant):
+                self.bits[position][base] = self.bits[position].get(base, 0) | bit
+        # symbol_bits[position][symbol], filled on first use
+        self._symbol_bits = [{} for _ in range(self.length)]
+
+    def symbol_bits(self, position, symbol):
+        # variants with one of the bases of (degenerate) symbol at position
+        cache = self._symbol_bits[position]
+        if symbol not in cache:
+            bits = 0
+            for base in degenerate_base.get(symbol, [symbol]):
+                bits |= self.bits[position].get(base, 0)
+            cache[symbol] = bits
+        return cache[symbol]
+
+    def number(self, bits):
+        # number of sequences of the variants in bits
+        total = 0
+        while bits:
+            low = bits & -bits
+            total += self.counts[low.bit_length() - 1]
+            bits ^= low
+        return total
+
+    def covered_bits(self, primer, skip=None, bits=None):
+        # variants (all, or those in bits) covered by primer (sequence or list of symbols),
+        # position skip is not checked
+        if bits is None:
+            bits = (1 << len(self.variants)) - 1
+        symbol_bits = self._symbol_bits
+        for position, symbol in enumerate(primer):
+            if position != skip:
+                cache = symbol_bits[position]
+                bits &= cache[symbol] if symbol in cache else self.symbol_bits(position, symbol)
+                if not bits:
+                    break
+        return bits
+
+    def coverage(self, primer):
+        # number of sequences covered by primer
+        return self.number(self.covered_bits(primer))
+
+    def widen(self, primer, position, base):
+        # number of sequences with base at position and covered by primer at all other positions,
+        # i.e. the sequences gained when base is added to position of primer (base not yet in it).
+        bits = self.bits[position].get(base, 0)
+        if bits:
+            bits = self.covered_bits(primer, skip=position, bits=bits)
+        return self.number(bits)
@@ -0,0 +1,138 @@
+#!/bin/python
+"""
+Expansion of degenerate (IUPAC) primers, shared by multiPrime-core, get_multiPrime, get_Maxprimerset,
+extract_PCR_product, finDimer and primer_coverage_validation_by_BWT.
+The same primer (and the same sub-sequences of it) is expanded again and again in hairpin, GC, di-nucleotide,
+deltaG and dimer checks, so expansions and the properties derived from them are cached per process.
+expansion_deltaG is shared too, so that all scripts use (and cache) the same function.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import math
+from functools import lru_cache
+from itertools import product
+from statistics import mean
+
+degenerate_base = {"R": ["A", "G"], "Y": ["C", "T"], "M": ["A", "C"], "K": ["G", "T"],
+                   "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"], "B": ["G", "T", "C"],
+                   "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
+
+TRANS = str.maketrans("ATGCRYMKSWHBVDN", "TACGYRKMSWDVBHN")
+
+base2bit = {"A": 0, "C": 1, "G": 2, "T": 3}
+
+# Nearest-neighbor free energy (kcal/mol) of the di-nucleotides. row: 3' base, column: 5' base (A, C, G, T).
+freedom_of_H_37_table = [[-0.7, -0.81, -0.65, -0.65],
+                         [-0.67, -0.72, -0.8, -0.65],
+                         [-0.69, -0.87, -0.72, -0.81],
+                         [-0.61, -0.69, -0.67, -0.7]]
+
+penalty_of_H_37_table = [[0.4, 0.575, 0.33, 0.73],
+                         [0.23, 0.32, 0.17, 0.33],
+                         [0.41, 0.45, 0.32, 0.575],
+                         [0.33, 0.41, 0.23, 0.4]]
+
+H_bonds_number = [[2, 2.5, 2.5, 2],
+                  [2.5, 3, 3, 2.5],
+                  [2.5, 3, 3, 2.5],
+                  [2, 2.5, 2.5, 2]]
+adjust_initiation = {"A": 0.98, "T": 0.98, "C": 1.03, "G": 1.03}
+adjust_terminal_TA = 0.4
+# Symmetry correction applies only to self-complementary sequences.
+symmetry_correction = 0.4
+
+
+def RC(seq):
+    return seq.translate(TRANS)[::-1]
+
+
+def symmetry(seq):
+    if len(seq) % 2 == 1:
+        return False
+    else:
+        F = seq[:int(len(seq) / 2)]
+        R = RC(seq[int(len(seq) / 2):][::-1])
+        if F == R:
+            return True
+        else:
+            return False
+
+
+# deltaG of one non-degenerate primer. terminal_TA: the degenerate primer ends with "TA".
+# initiation_3: add the initiation of the 3' end base too (get_multiPrime only adds the 5' one).
+def expansion_deltaG(seq, terminal_TA, initiation_3=True):
+    Na = 50
+    Delta_G = 0
+    for n in range(len(seq) - 1):
+        i, j = base2bit[seq[n + 1]], base2bit[seq[n]]
+        Delta_G += freedom_of_H_37_table[i][j] * H_bonds_number[i][j] + penalty_of_H_37_table[i][j]
+    if initiation_3:
+        initiation = adjust_initiation[seq[0]] + adjust_initiation[seq[-1]]
+    else:
+        initiation = adjust_initiation[seq[0]]
+    if terminal_TA:
+        Delta_G += initiation + adjust_terminal_TA
+    else:
+        Delta_G += initiation
+    # adjust by concentration of Na+
+    Delta_G -= (0.175 * math.log(Na / 1000, math.e) + 0.20) * len(seq)
+    if symmetry(seq):
+        Delta_G += symmetry_correction
+    return Delta_G
+
+
+class DegeneratePrimer(object):
+    # Expansion and derived properties of one degenerate primer, computed on first use.
+    __slots__ = ("primer", "_expansion", "_gc_list", "_values")
+
+    def __init__(self, primer):
+        self.primer = primer
+        self._expansion = None
+        self._gc_list = None
+        self._values = {}
+
+    # all non-degenerate primers, in the same order as the original degenerate_seq
+    @property
+    def expansion(self):
+        if self._expansion is None:
+            seq = []
+            cs = ""
+            for s in self.primer:
+                if s not in degenerate_base:
+                    cs += s
+                else:
+                    seq.append([cs + i for i in degenerate_base[s]])
+                    cs = ""
+            if cs:
+                seq.append([cs])
+            self._expansion = tuple("".join(i) for i in product(*seq))
+        return self._expansion
+
+    # GC fraction (3 decimals) of each expansion
+    @property
+    def gc_list(self):
+        if self._gc_list is None:
+            self._gc_list = tuple(round((seq.count("G") + seq.count("C")) / len(seq), 3) for seq in self.expansion)
+        return self._gc_list
+
+    @property
+    def gc_mean(self):
+        return mean(self.gc_list)
+
+    # func(expansion, *args) of each expansion, e.g. Tm list or deltaG list.
+    def values(self, func, *args):
+        key = (func, args)
+        if key not in self._values:
+            self._values[key] = tuple(func(seq, *args) for seq in self.expansion)
+        return self._values[key]
+
+
+@lru_cache(maxsize=200000)
+def degenerate_primer(primer):
+    return DegeneratePrimer(primer)
+
+
+# expand degenerate primer into a tuple.
+def degenerate_seq(primer):
+    return degenerate_primer(primer).expansion
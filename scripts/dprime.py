@@ -0,0 +1,61 @@
+#!/bin/python
+"""
+In-process API of multiPrime-core: design candidate degenerate primers from an alignment in memory.
+
+    from dprime import design_primers, DesignError
+
+    sequences = ["ACGT...", "ACGA...", ...]             # aligned, same length; or a numpy array, or {acc ID: seq}
+    try:
+        result = design_primers(sequences, ids=["a", "b", ...], primer_length=18, coverage=0.8, nproc=4)
+    except DesignError as e:
+        ...                                             # alignment too short / empty, bad input
+    for candidate in result:                            # Candidate namedtuples in position order
+        print(candidate.position, candidate.primer, candidate.coverage)
+    result.positions, result.primers, result.coverages  # the same columns as arrays / list
+    result.uncovered(candidate.position, role="F")      # acc IDs not covered as primer-F (mismatch or gap)
+
+Keyword parameters are those of NN_degenerate in multiPrime-core_V16.py (the -o, -j and -k options of the
+command line do not apply). Their defaults are those of the command line (DEFAULTS), not those of NN_degenerate.
+Worker processes are forked (nproc > 1), as for multiPrime-core.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import importlib.util
+import os
+import sys
+
+
+def load_core():
+    # multiPrime-core_V16.py is not an importable module name: load it once and register it in sys.modules,
+    # so that worker processes can unpickle its functions.
+    name = "multiPrime_core"
+    if name not in sys.modules:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "multiPrime-core_V16.py")
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules[name]
+            raise
+    return sys.modules[name]
+
+
+core = load_core()
+NN_degenerate = core.NN_degenerate
+DesignError = core.DesignError
+Candidate = core.Candidate
+DesignResult = core.DesignResult
+
+
+# defaults of the multiPrime-core options (-l, -f, -n, -d, -s, -c, -v, -e, -a, -g, -p)
+DEFAULTS = {"primer_length": 18, "coverage": 0.8, "number_of_dege_bases": 4, "score_of_dege_bases": 10,
+            "product_len": 100, "position": "2,-1", "variation": 1, "raw_entropy_threshold": 3.6, "distance": 4,
+            "GC": "0.2,0.7", "nproc": 20}
+
+
+def design_primers(alignment, ids=None, **parameters):
+    # alignment: file path, list of aligned strings, numpy array or {acc ID: sequence} ==> DesignResult
+    return NN_degenerate(alignment, ids=ids, **dict(DEFAULTS, **parameters)).design()
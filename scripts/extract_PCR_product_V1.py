@@ -34,7 +34,6 @@ import re
 import sys
 import time
 from collections import defaultdict
-from itertools import product
 from multiprocessing import Manager
 from optparse import OptionParser
 from pathlib import Path
@@ -42,6 +41,7 @@ import os
 from operator import mul
 from functools import reduce
 import pandas as pd
+from degenerate import degenerate_seq
 
 from concurrent.futures import ProcessPoolExecutor
 from itertools import (takewhile, repeat)
@@ -103,10 +103,6 @@ def argsParse():
     return parser.parse_args()
 
 
-degenerate_base = {"R": ["A", "G"], "Y": ["C", "T"], "M": ["A", "C"], "K": ["G", "T"],
-                   "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"], "B": ["G", "T", "C"],
-                   "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
-
 score_table = {"A": 1, "G": 1.1, "C": 1.2, "T": 1.4, "R": 2.1, "Y": 2.6, "M": 2.2,
                "K": 2.5, "S": 2.3, "W": 2.4, "H": 3.6, "B": 3.7, "V": 3.3, "D": 3.5, "N": 4.7}
 
@@ -168,23 +164,8 @@ class Product(object):
                             res[key] = [primer_F, primer_R]
         return res
 
-    @staticmethod
-    def degenerate_seq(primer):
-        seq = []
-        cs = ""
-        for s in primer:
-            if s not in degenerate_base:
-                cs += s
-            else:
-                seq.append([cs + i for i in degenerate_base[s]])
-                cs = ""
-        if cs:
-            seq.append([cs])
-        # return ("".join(i) for i in product(*seq)) # This is a generator, just once when iteration
-        # d = [x for x in range(12)]
-        # g = (x for i in range(12))
-        # The result of list derivation returns a list, and the tuple derivation returns a generator
-        return ["".join(i) for i in product(*seq)]
+    # expand degenerate primer into a tuple. Expansions are cached, see degenerate.py.
+    degenerate_seq = staticmethod(degenerate_seq)
 
     def get_PCR_PRODUCT(self, primerinfo, F, R, ref):
         Fseq = self.degenerate_seq(F)
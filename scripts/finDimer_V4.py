@@ -35,18 +35,14 @@ import os
 import argparse
 import time
 from math import log10
-from itertools import product
 from multiprocessing import Manager
 from collections import defaultdict
+from degenerate import degenerate_primer, degenerate_seq, expansion_deltaG
 
 from concurrent.futures import ProcessPoolExecutor
 
 TRANS = str.maketrans("ATGCRYMKSWHBVDN", "TACGYRKMSWDVBHN")
 
-degenerate_base = {"R": ["A", "G"], "Y": ["C", "T"], "M": ["A", "C"], "K": ["G", "T"],
-                   "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"], "B": ["G", "T", "C"],
-                   "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
-
 score_table = {"A": 1, "G": 1.1, "C": 1.2, "T": 1.4, "R": 2.1, "Y": 2.6, "M": 2.2,
                "K": 2.5, "S": 2.3, "W": 2.4, "H": 3.6, "B": 3.7, "V": 3.3, "D": 3.5, "N": 4.7}
 # Martin Zacharias* "Base-Pairing and Base-Stacking Contributions to Double-Stranded DNA Formation"
@@ -145,19 +141,8 @@ class Dimer(object):
                     primer_dict[i.strip()] = name
         return primer_dict
 
-    @staticmethod
-    def degenerate_seq(primer):
-        seq = []
-        cs = ""
-        for s in primer:
-            if s not in degenerate_base:
-                cs += s
-            else:
-                seq.append([cs + i for i in degenerate_base[s]])
-                cs = ""
-        if cs:
-            seq.append([cs])
-        return ["".join(i) for i in product(*seq)]
+    # expand degenerate primer into a tuple. Expansions are cached, see degenerate.py.
+    degenerate_seq = staticmethod(degenerate_seq)
 
     def current_end(self, primer, adaptor="", num=5, length=14):
         primer_extend = adaptor + primer
@@ -169,23 +154,8 @@ class Dimer(object):
         return end_seq
 
     def deltaG(self, sequence):
-        Delta_G_list = []
-        Na = 50
-        for seq in self.degenerate_seq(sequence):
-            Delta_G = 0
-            for n in range(len(seq) - 1):
-                i, j = base2bit[seq[n + 1]], base2bit[seq[n]]
-                Delta_G += freedom_of_H_37_table[i][j] * H_bonds_number[i][j] + penalty_of_H_37_table[i][j]
-            term5 = sequence[-2:]
-            if term5 == "TA":
-                Delta_G += adjust_initiation[seq[0]] + adjust_initiation[seq[-1]] + adjust_terminal_TA
-            else:
-                Delta_G += adjust_initiation[seq[0]] + adjust_initiation[seq[-1]]
-            # adjust by concentration of Na+
-            Delta_G -= (0.175 * math.log(Na / 1000, math.e) + 0.20) * len(seq)
-            if symmetry(seq):
-                Delta_G += symmetry_correction
-            Delta_G_list.append(Delta_G)
+        term5 = sequence[-2:]
+        Delta_G_list = degenerate_primer(sequence).values(expansion_deltaG, term5 == "TA")
         return round(max(Delta_G_list), 2)
 
     def dimer_check(self, position):
@@ -8,7 +8,6 @@ __email__ = "yang_junbo_hi@126.com"
 __license__ = "yangjunbo"
 
 import sys
-from itertools import product
 from optparse import OptionParser
 import re
 import math
@@ -16,6 +15,7 @@ from operator import mul
 from functools import reduce
 import pandas as pd
 import numpy as np
+from degenerate import degenerate_primer, degenerate_seq, expansion_deltaG
 
 
 def argsParse():
@@ -66,10 +66,6 @@ def argsParse():
     return parser.parse_args()
 
 
-degenerate_pair = {"R": ["A", "G"], "Y": ["C", "T"], "M": ["A", "C"], "K": ["G", "T"],
-                   "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"], "B": ["G", "T", "C"],
-                   "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
-
 degenerate_table = {"A": 1, "G": 1.1, "C": 1.2, "T": 1.4, "R": 2.1, "Y": 2.6, "M": 2.2,
                     "K": 2.5, "S": 2.3, "W": 2.4, "H": 3.6, "B": 3.7, "V": 3.3, "D": 3.5, "N": 4.7}
 
@@ -127,18 +123,8 @@ def symmetry(seq):
             return False
 
 
-def dege_trans(primer):
-    seq = []
-    cs = ""
-    for s in primer:
-        if s not in degenerate_pair:
-            cs += s
-        else:
-            seq.append([cs + i for i in degenerate_pair[s]])
-            cs = ""
-    if cs:
-        seq.append([cs])
-    return ["".join(i) for i in product(*seq)]
+# expand degenerate primer. Expansions are cached, see degenerate.py.
+dege_trans = degenerate_seq
 
 
 def Penalty_points(length, GC, d1, d2):
@@ -154,38 +140,9 @@ def current_end(primer, num=5):
     return set(end_seq)
 
 
-def degenerate_seq(primer):
-    seq = []
-    cs = ""
-    for s in primer:
-        if s not in degenerate_pair:
-            cs += s
-        else:
-            seq.append([cs + i for i in degenerate_pair[s]])
-            cs = ""
-    if cs:
-        seq.append([cs])
-    return ["".join(i) for i in product(*seq)]
-
-
 def deltaG(sequence):
-    Delta_G_list = []
-    Na = 50
-    for seq in degenerate_seq(sequence):
-        Delta_G = 0
-        for n in range(len(seq) - 1):
-            i, j = base2bit[seq[n + 1]], base2bit[seq[n]]
-            Delta_G += freedom_of_H_37_table[i][j] * H_bonds_number[i][j] + penalty_of_H_37_table[i][j]
-        term5 = sequence[-2:]
-        if term5 == "TA":
-            Delta_G += adjust_initiation[seq[0]] + adjust_initiation[seq[-1]] + adjust_terminal_TA
-        else:
-            Delta_G += adjust_initiation[seq[0]] + adjust_initiation[seq[-1]]
-        # adjust by concentration of Na+
-        Delta_G -= (0.175 * math.log(Na / 1000, math.e) + 0.20) * len(seq)
-        if symmetry(seq):
-            Delta_G += symmetry_correction
-        Delta_G_list.append(Delta_G)
+    term5 = sequence[-2:]
+    Delta_G_list = degenerate_primer(sequence).values(expansion_deltaG, term5 == "TA")
     return round(max(Delta_G_list), 2)
 
 
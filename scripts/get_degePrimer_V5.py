@@ -45,6 +45,8 @@ from statistics import mean
 from bisect import bisect_left
 from optparse import OptionParser
 import sys
+from hairpin import HairpinDetector
+from repeats import has_repeat
 
 
 def argsParse():
@@ -191,19 +193,7 @@ symmetry_correction = 0.4
 
 base2bit = {"A": 0, "C": 1, "G": 2, "T": 3}
 
-di_nucleotides = set()
-
-for i in base2bit.keys():
-    single = i * 4
-    di_nucleotides.add(single)
-    for j in base2bit.keys():
-        if i != j:
-            di = (i + j) * 4
-            di_nucleotides.add(di)
-        for k in base2bit.keys():
-            if i != j != k:
-                tri = (i + j + k) * 3
-                di_nucleotides.add(tri)
+
 def dege_trans(sequence):
         seq = []
         cs = ""
@@ -239,6 +229,7 @@ class Primers_filter(object):
         self.size = size
         self.outfile = os.path.abspath(outfile)
         self.distance = distance
+        self.hairpin_detector = HairpinDetector(distance)
         self.Input_file = ref_file
         self.fraction = fraction
         self.GC = GC
@@ -293,28 +284,9 @@ class Primers_filter(object):
         return ("".join(i) for i in product(*seq))
 
     ################# Hairpin #####################
-    def hairpin_check(self, primer):
-        n = 0
-        distance = self.distance
-        check = "FALSE"
-        while n <= len(primer) - 5 - 5 - distance:
-            kmer = self.degenerate_seq(primer[n:n + 5])
-            left = self.degenerate_seq(primer[n + 5 + distance:])
-            for k in kmer:
-                for l in left:
-                    if re.search(reversecomplement(k), l):
-                        check = "TRUE"
-                        break
-                if check == "TRUE":
-                    break
-            if check == "TRUE":
-                break
-            n += 1
-
-        if check == "TRUE":
-            return True
-        else:
-            return False
+    def hairpin_check(self, primer, adaptor=""):
+        # hairpin of [adaptor--primer] on IUPAC masks, see hairpin.py
+        return self.hairpin_detector.check(primer, adaptor)
 
     ################# current_end #####################
     def current_end(self, primer, num=5, length=14):
@@ -397,21 +369,9 @@ class Primers_filter(object):
 
     ################# di_nucleotide #####################
     def di_nucleotide(self, primer):
-        Check = "False"
-        primers = self.degenerate_seq(primer)
-        for m in primers:
-            for n in di_nucleotides:
-                if re.search(n, m):
-                    Check = "True"
-                    break
-                else:
-                    pass
-            if Check == "True":
-                break
-        if Check == "True":
-            return True
-        else:
-            return False
+        # homopolymer run >= 4, dinucleotide repeat >= 4 or trinucleotide repeat >= 3 in any non-degenerate primer,
+        # see repeats.py
+        return has_repeat(primer)
 
     ################# di_nucleotide #####################
     def GC_clamp(self, primer, num=4, length=13):
@@ -469,8 +429,7 @@ class Primers_filter(object):
             pass
         else:
             for start in range(len(candidate_position)):
-                primerF_extend = adaptor[0] + self.primers[candidate_position[start]][0]
-                if self.hairpin_check(primerF_extend):
+                if self.hairpin_check(self.primers[candidate_position[start]][0], adaptor[0]):
                     pass
                 elif self.dege_filter_in_term_N_bp(self.primers[candidate_position[start]][0]):
                     pass
@@ -484,8 +443,8 @@ class Primers_filter(object):
                         break
                     else:
                         for stop in range(start_index, stop_index + 1):
-                            primerR_extend = adaptor[1] + reversecomplement(self.primers[candidate_position[stop]][0])
-                            if self.hairpin_check(primerR_extend):
+                            if self.hairpin_check(reversecomplement(self.primers[candidate_position[stop]][0]),
+                                                  adaptor[1]):
                                 pass
                             elif self.dege_filter_in_term_N_bp(
                                     reversecomplement(self.primers[candidate_position[stop]][0])):
@@ -6,7 +6,6 @@ __email__ = "yang_junbo_hi@126.com"
 __license__ = "MIT"
 
 import itertools
-import json
 
 """
 The MIT License (MIT)
@@ -38,8 +37,6 @@ import argparse
 import time
 from functools import reduce
 from math import log10
-from itertools import product
-from multiprocessing import Manager
 from collections import defaultdict
 import re
 from concurrent.futures import ProcessPoolExecutor, as_completed
@@ -48,6 +45,10 @@ from statistics import mean
 from bisect import bisect_left
 from optparse import OptionParser
 import sys
+from degenerate import degenerate_primer, degenerate_seq, expansion_deltaG
+from hairpin import HairpinDetector
+from repeats import has_repeat, repeat_check
+from seq_id_store import SeqIdStore, load_json_seq_id
 
 
 def argsParse():
@@ -162,10 +163,6 @@ def symmetry(seq):
             return False
 
 
-degenerate_base = {"R": ["A", "G"], "Y": ["C", "T"], "M": ["A", "C"], "K": ["G", "T"],
-                   "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"], "B": ["G", "T", "C"],
-                   "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
-
 score_table = {"A": 1, "G": 1.1, "C": 1.2, "T": 1.4, "R": 2.1, "Y": 2.6, "M": 2.2,
                "K": 2.5, "S": 2.3, "W": 2.4, "H": 3.6, "B": 3.7, "V": 3.3, "D": 3.5, "N": 4.7}
 # Martin Zacharias* "Base-Pairing and Base-Stacking Contributions to Double-Stranded DNA Formation"
@@ -200,53 +197,6 @@ adjust_terminal_TA = 0.4
 symmetry_correction = 0.4
 ##############################################################################################
 ##############################################################################################
-# 37°C and 1 M NaCl
-Htable2 = [[-7.9, -8.5, -8.2, -7.2, 0],
-           [-8.4, -8, -9.8, -8.2, 0],
-           [-7.8, -10.6, -8, -8.5, 0],
-           [-7.2, -7.8, -8.4, -7.9, 0],
-           [0, 0, 0, 0, 0]]
-Stable2 = [[-22.2, -22.7, -22.2, -21.3, 0],
-           [-22.4, -19.9, -24.4, -22.2, 0],
-           [-21, -27.2, -19.9, -22.7, 0],
-           [-20.4, -21, -22.4, -22.2, 0],
-           [0, 0, 0, 0, 0]]
-Gtable2 = [[-1, -1.45, -1.3, -0.58, 0],
-           [-1.44, -1.84, -2.24, -1.3, 0],
-           [-1.28, -2.17, -1.84, -1.45, 0],
-           [-0.88, -1.28, -1.44, -1, 0],
-           [0, 0, 0, 0, 0]]
-H_adjust_initiation = {"A": 2.3, "T": 2.3, "C": 0.1, "G": 0.1}
-S_adjust_initiation = {"A": 4.1, "T": 4.1, "C": -2.8, "G": -2.8}
-G_adjust_initiation = {"A": 1.03, "T": 1.03, "C": 0.98, "G": 0.98}
-H_symmetry_correction = 0
-S_symmetry_correction = -1.4
-G_symmetry_correction = 0.4
-##############################################################################################
-# ng/ul
-primer_concentration = 100
-Mo_concentration = 50
-Di_concentration = 1.5
-dNTP_concentration = 0.25
-Kelvin = 273.15
-# reference (Owczarzy et al.,2008)
-crossover_point = 0.22
-
-def Calc_deltaH_deltaS(seq):
-    Delta_H = 0
-    Delta_S = 0
-    for n in range(len(seq) - 1):
-        i, j = base2bit[seq[n + 1]], base2bit[seq[n]]
-        Delta_H += Htable2[i][j]
-        Delta_S += Stable2[i][j]
-    seq = seq.replace("#", '')
-    Delta_H += H_adjust_initiation[seq[0]] + H_adjust_initiation[seq[-1]]
-    Delta_S += S_adjust_initiation[seq[0]] + S_adjust_initiation[seq[-1]]
-    if symmetry(seq):
-        Delta_S += S_symmetry_correction
-    return Delta_H * 1000, Delta_S
-
-
 # salt_adjust = math.log(Tm_Na_adjust / 1000.0, math.e)
 # def S_adjust(seq):
 #     n = len(seq) - 1
@@ -260,83 +210,10 @@ def Calc_deltaH_deltaS(seq):
 # where n is the total number of phosphates in the duplex divided by 2,
 # This is equal to the oligonucleotide length minus 1.
 
-def GC_fraction(seq):
-    return round((list(seq).count("G") + list(seq).count("C")) / len(list(seq)), 3)
-# different salt corrections for monovalent (Owczarzy et al.,2004) and divalent cations (Owczarzy et al.,2008)
-def Calc_Tm_v2(seq):
-    delta_H, delta_S = Calc_deltaH_deltaS(seq)
-    # Note that the concentrations in the following Eq is mmol/L, In all other equations,concentration are mol/L
-    # Monovalent cations are typically present as K+ and Tris+ in PCR buffer,
-    # K+ is similar to Na+ in regard to duplex stabilization
-    # if Di_concentration > dNTP_concentration:
-    #     Tm_Na_adjust = Mo_concentration + 120 * math.sqrt(Di_concentration - dNTP_concentration)
-    # else:
-    #     Tm_Na_adjust = Mo_concentration
-    Tm_Na_adjust = Mo_concentration
-
-    if dNTP_concentration >= Di_concentration:
-        free_divalent = 0.00000000001
-    else:
-        free_divalent = (Di_concentration - dNTP_concentration) / 1000.0
-    R_div_monov_ratio = (math.sqrt(free_divalent)) / (Mo_concentration / 1000)
-
-    if R_div_monov_ratio < crossover_point:
-        # use only monovalent salt correction, [equation 22] (Owczarzy et al., 2004)
-        correction = (((4.29 * GC_fraction(seq)) - 3.95) * pow(10, -5) * math.log(Tm_Na_adjust / 1000.0, math.e)) \
-                     + (9.40 * pow(10, -6) * (pow(math.log(Tm_Na_adjust / 1000.0, math.e), 2)))
-    else:
-        # magnesium effects are dominant, [equation 16] (Owczarzy et al., 2008) is used
-        # Table 2
-        a = 3.92 * pow(10, -5)
-        b = - 9.11 * pow(10, -6)
-        c = 6.26 * pow(10, -5)
-        d = 1.42 * pow(10, -5)
-        e = - 4.82 * pow(10, -4)
-        f = 5.25 * pow(10, -4)
-        g = 8.31 * pow(10, -5)
-        if R_div_monov_ratio < 6.0:
-            a = 3.92 * pow(10, -5) * (
-                    0.843 - (0.352 * math.sqrt(Tm_Na_adjust / 1000.0) * math.log(Tm_Na_adjust / 1000.0, math.e)))
-            d = 1.42 * pow(10, -5) * (
-                    1.279 - 4.03 * pow(10, -3) * math.log(Tm_Na_adjust / 1000.0, math.e) - 8.03 * pow(10, -3) * pow(
-                math.log(Tm_Na_adjust / 1000.0, math.e), 2))
-            g = 8.31 * pow(10, -5) * (
-                    0.486 - 0.258 * math.log(Tm_Na_adjust / 1000.0, math.e) + 5.25 * pow(10, -3) * pow(
-                math.log(Tm_Na_adjust / 1000.0, math.e), 3))
-        # Eq 16
-        correction = a + (b * math.log(free_divalent, math.e))
-        + GC_fraction(seq) * (c + (d * math.log(free_divalent, math.e)))
-        + (1 / (2 * (len(seq) - 1))) * (e + (f * math.log(free_divalent, math.e))
-                                        + g * (pow((math.log(free_divalent, math.e)), 2)))
-
-    if symmetry(seq):
-        # Equation A
-        Tm = round(1 / ((1 / (delta_H / (delta_S + 1.9872 * math.log(primer_concentration / (1 * pow(10, 9)), math.e))))
-                        + correction) - Kelvin, 2)
-    else:
-        # Equation B
-        Tm = round(1 / ((1 / (delta_H / (delta_S + 1.9872 * math.log(primer_concentration / (4 * pow(10, 9)), math.e))))
-                        + correction) - Kelvin, 2)
-    return Tm
-
-
 
 ######################################################################################################
-di_nucleotides = set()
 base2bit = {"A": 0, "C": 1, "G": 2, "T": 3}
 
-for i in base2bit.keys():
-    single = i * 4
-    di_nucleotides.add(single)
-    for j in base2bit.keys():
-        if i != j:
-            di = (i + j) * 4
-            di_nucleotides.add(di)
-        for k in base2bit.keys():
-            if i != j != k:
-                tri = (i + j + k) * 3
-                di_nucleotides.add(tri)
-
 
 def score_trans(sequence):
     return reduce(mul, [math.floor(score_table[x]) for x in list(sequence)])
@@ -350,6 +227,26 @@ def Penalty_points(length, GC, d1, d2):
     return log10((2 ** length * 2 ** GC) / ((2 ** d1 - 0.9) * (2 ** d2 - 0.9)))
 
 
+##############################################################################################
+# Pairing workers get the Primers_filter (primer table, hairpin cache, seq-id store), the candidate positions and the
+# pairing parameters once, from the pool initializer. A task is then only a (start, stop) range of primer-F indexes.
+##############################################################################################
+PAIR_WORKER_APP = None
+PAIR_WORKER_ARGS = ()
+
+
+def init_pair_worker(primers_filter, adaptor, min_len, max_len, candidate_position, threshold):
+    global PAIR_WORKER_APP, PAIR_WORKER_ARGS
+    PAIR_WORKER_APP = primers_filter
+    PAIR_WORKER_ARGS = (adaptor, min_len, max_len, candidate_position, threshold)
+
+
+def primer_pairs_chunk(task):
+    # task: (start, stop) indexes of candidate_position ==> [(pair, number of non-covered sequences), ...]
+    start, stop = task
+    return PAIR_WORKER_APP.primer_pairs_batch(range(start, stop), *PAIR_WORKER_ARGS)
+
+
 class Primers_filter(object):
     def __init__(self, ref_file, primer_file, adaptor, rep_seq_number=500, distance=4, outfile="", diff_Tm=5,
                  size="300,700", position=9, GC="0.4,0.6", nproc=10, fraction=0.6):
@@ -359,6 +256,7 @@ class Primers_filter(object):
         self.size = size
         self.outfile = os.path.abspath(outfile)
         self.distance = distance
+        self.hairpin_detector = HairpinDetector(distance)
         self.Input_file = ref_file
         self.fraction = fraction
         self.GC = GC
@@ -366,8 +264,7 @@ class Primers_filter(object):
         self.rep_seq_number = rep_seq_number
         self.number = self.get_number()
         self.position = position
-        self.primers, self.gap_id, self.non_cover_id = self.parse_primers()
-        self.resQ = Manager().Queue()
+        self.primers, self.seq_id_store = self.parse_primers()
         self.pre_filter_primers = self.pre_filter()
 
     def parse_primers(self):
@@ -386,13 +283,13 @@ class Primers_filter(object):
                     Tm = round(float(i[9]), 2)
                     primer_dict[position] = [primer_seq, fraction, F_coverage, R_coverage, Tm]
         # print(primer_dict)
-        with open(self.primer_file + ".gap_seq_id_json") as g:
-            gap_dict = json.load(g)
-            g.close()
-        with open(self.primer_file + ".non_coverage_seq_id_json") as n:
-            non_cover_dict = json.load(n)
-            g.close()
-        return primer_dict, gap_dict, non_cover_dict
+        # acc IDs of non-covered sequences of each position: memory-mapped [input].seq_id_bin,
+        # or the JSON files of earlier multiPrime-core versions.
+        if os.path.exists(self.primer_file + ".seq_id_bin"):
+            seq_id_store = SeqIdStore(self.primer_file + ".seq_id_bin")
+        else:
+            seq_id_store = load_json_seq_id(self.primer_file)
+        return primer_dict, seq_id_store
 
     ################# get_number #####################
     def get_number(self):
@@ -407,43 +304,13 @@ class Primers_filter(object):
                 return seq_number
 
     ################# degenerate_seq #####################
-    @staticmethod
-    def degenerate_seq(sequence):
-        seq = []
-        cs = ""
-        for s in sequence:
-            if s not in degenerate_base:
-                cs += s
-            else:
-                seq.append([cs + i for i in degenerate_base[s]])
-                cs = ""
-        if cs:
-            seq.append([cs])
-        return ("".join(i) for i in product(*seq))
+    # expand degenerate primer into a tuple. Expansions are cached, see degenerate.py.
+    degenerate_seq = staticmethod(degenerate_seq)
 
     ################# Hairpin #####################
-    def hairpin_check(self, primer):
-        n = 0
-        distance = self.distance
-        check = "FALSE"
-        while n <= len(primer) - 5 - 5 - distance:
-            kmer = self.degenerate_seq(primer[n:n + 5])
-            left = self.degenerate_seq(primer[n + 5 + distance:])
-            for k in kmer:
-                for l in left:
-                    if re.search(reversecomplement(k), l):
-                        check = "TRUE"
-                        break
-                if check == "TRUE":
-                    break
-            if check == "TRUE":
-                break
-            n += 1
-
-        if check == "TRUE":
-            return True
-        else:
-            return False
+    def hairpin_check(self, primer, adaptor=""):
+        # hairpin of [adaptor--primer] on IUPAC masks, see hairpin.py
+        return self.hairpin_detector.check(primer, adaptor)
 
     ################# current_end #####################
     def current_end(self, primer, adaptor="", num=5, length=14):
@@ -457,22 +324,8 @@ class Primers_filter(object):
 
     ################# Free energy #####################
     def deltaG(self, sequence):
-        Delta_G_list = []
-        Na = 50
-        for seq in self.degenerate_seq(sequence):
-            Delta_G = 0
-            for n in range(len(seq) - 1):
-                i, j = base2bit[seq[n + 1]], base2bit[seq[n]]
-                Delta_G += freedom_of_H_37_table[i][j] * H_bonds_number[i][j] + penalty_of_H_37_table[i][j]
-            term5 = sequence[-2:]
-            if term5 == "TA":
-                Delta_G += adjust_initiation[seq[0]] + adjust_terminal_TA
-            else:
-                Delta_G += adjust_initiation[seq[0]]
-            Delta_G -= (0.175 * math.log(Na / 1000, math.e) + 0.20) * len(seq)
-            if symmetry(seq):
-                Delta_G += symmetry_correction
-            Delta_G_list.append(Delta_G)
+        term5 = sequence[-2:]
+        Delta_G_list = degenerate_primer(sequence).values(expansion_deltaG, term5 == "TA", False)
         return round(max(Delta_G_list), 2)
 
     ################# Dimer #####################
@@ -521,30 +374,13 @@ class Primers_filter(object):
 
     ################# GC content #####################
     def GC_fraction(self, sequence):
-        sequence_expand = self.degenerate_seq(sequence)
-        GC_list = []
-        for seq in sequence_expand:
-            GC_list.append(round((list(seq).count("G") + list(seq).count("C")) / len(list(seq)), 3))
-        GC_average = mean(GC_list)
-        return GC_average
+        return degenerate_primer(sequence).gc_mean
 
     ################# di_nucleotide #####################
     def di_nucleotide(self, primer):
-        Check = "False"
-        primers = self.degenerate_seq(primer)
-        for m in primers:
-            for n in di_nucleotides:
-                if re.search(n, m):
-                    Check = "True"
-                    break
-                else:
-                    pass
-            if Check == "True":
-                break
-        if Check == "True":
-            return True
-        else:
-            return False
+        # homopolymer run >= 4, dinucleotide repeat >= 4 or trinucleotide repeat >= 3 in any non-degenerate primer,
+        # see repeats.py
+        return has_repeat(primer)
 
     ################# di_nucleotide #####################
     def GC_clamp(self, primer, num=4, length=13):
@@ -567,6 +403,8 @@ class Primers_filter(object):
         # min_cov = self.fraction
         candidate_primers_position = []
         primer_info = self.primers
+        # repeats of all primers in one batch, see repeats.py
+        repeat = dict(zip(primer_info.keys(), repeat_check([primer_info[k][0] for k in primer_info.keys()])))
         for primer_position in primer_info.keys():
             primer = primer_info[primer_position][0]
             # coverage = primer_info[primer_position][1]
@@ -574,7 +412,7 @@ class Primers_filter(object):
                 pass
             elif self.GC_fraction(primer) > max or self.GC_fraction(primer) < min:
                 pass
-            elif self.di_nucleotide(primer):
+            elif repeat[primer_position]:
                 pass
             else:
                 candidate_primers_position.append(primer_position)
@@ -591,8 +429,7 @@ class Primers_filter(object):
         return index_left, index_right
 
     def primer_pairs(self, start, adaptor, min_len, max_len, candidate_position, primer_pairs, threshold):
-        primerF_extend = adaptor[0] + self.primers[candidate_position[start]][0]
-        if self.hairpin_check(primerF_extend):
+        if self.hairpin_check(self.primers[candidate_position[start]][0], adaptor[0]):
             # print("hairpin!")
             pass
         elif self.dege_filter_in_term_N_bp(self.primers[candidate_position[start]][0]):
@@ -607,9 +444,11 @@ class Primers_filter(object):
             if start_index > stop_index:
                 pass
             else:
+                # R partners passing all filters, their uncovered numbers are counted in one batch below.
+                stop_list = []
                 for stop in range(start_index, stop_index + 1):
-                    primerR_extend = adaptor[1] + reversecomplement(self.primers[candidate_position[stop]][0])
-                    if self.hairpin_check(primerR_extend):
+                    if self.hairpin_check(reversecomplement(self.primers[candidate_position[stop]][0]),
+                                          adaptor[1]):
                         # print("self hairpin!")
                         pass
                     elif self.dege_filter_in_term_N_bp(
@@ -637,35 +476,34 @@ class Primers_filter(object):
                                 if abs(difference_Tm) > self.diff_Tm:
                                     pass
                                 else:
-                                    start_pos = str(candidate_position[start])
-                                    # print(start_pos)
-                                    stop_pos = str(candidate_position[stop])
-                                    # print(stop_pos)
-                                    un_cover_list = []
-                                    for o in list(dict(self.gap_id[start_pos]).values()):
-                                        un_cover_list.extend(set(o))
-                                    for p in list(dict(self.non_cover_id[start_pos][0]).values()):
-                                        un_cover_list.extend(set(p))
-                                    for m in list(dict(self.gap_id[stop_pos]).values()):
-                                        un_cover_list.extend(set(m))
-                                    for n in list(dict(self.non_cover_id[stop_pos][1]).values()):
-                                        un_cover_list.extend(set(n))
-                                    all_non_cover_number = len(set(un_cover_list))
-                                    if all_non_cover_number/self.number > threshold:
-                                        pass
-                                    else:
-                                        all_coverage = self.number - all_non_cover_number
-                                        cover_percentage = round(all_coverage / self.number, 4)
-                                        average_Tm = str(round(mean([self.primers[candidate_position[start]][4],
-                                                    self.primers[candidate_position[stop]][4]]), 2))
-                                        line = (self.primers[candidate_position[start]][0],
-                                                reversecomplement(self.primers[candidate_position[stop]][0]),
-                                                str(distance) + ":" + average_Tm + ":" + str(cover_percentage),
-                                                all_coverage,
-                                                str(candidate_position[start]) + ":" + str(candidate_position[stop]))
-                                        primer_pairs.append(line)
-#                                 self.resQ.put(line)
-        # self.resQ.put(None)
+                                    stop_list.append(stop)
+                if stop_list:
+                    # sequences not covered by primer-F or primer-R (mismatch or gap), as bit arrays of acc IDs
+                    non_cover_numbers = self.seq_id_store.pair_uncovered_number(
+                        candidate_position[start], [candidate_position[stop] for stop in stop_list])
+                    # pairs are kept with their number of non-covered sequences, run() filters them again by fraction.
+                    for stop, all_non_cover_number in zip(stop_list, non_cover_numbers.tolist()):
+                        if all_non_cover_number / self.number > threshold:
+                            pass
+                        else:
+                            distance = int(candidate_position[stop]) - int(candidate_position[start]) + 1
+                            all_coverage = self.number - all_non_cover_number
+                            cover_percentage = round(all_coverage / self.number, 4)
+                            average_Tm = str(round(mean([self.primers[candidate_position[start]][4],
+                                                         self.primers[candidate_position[stop]][4]]), 2))
+                            line = (self.primers[candidate_position[start]][0],
+                                    reversecomplement(self.primers[candidate_position[stop]][0]),
+                                    str(distance) + ":" + average_Tm + ":" + str(cover_percentage),
+                                    all_coverage,
+                                    str(candidate_position[start]) + ":" + str(candidate_position[stop]))
+                            primer_pairs.append((line, all_non_cover_number))
+
+    def primer_pairs_batch(self, starts, adaptor, min_len, max_len, candidate_position, threshold):
+        # primer pairs of a batch of primer-F (indexes of candidate_position), run in a worker process.
+        primer_pairs = []
+        for start in starts:
+            self.primer_pairs(start, adaptor, min_len, max_len, candidate_position, primer_pairs, threshold)
+        return primer_pairs
 
         #  The queue in multiprocessing cannot be used for pool process pool, but there is a manager in multiprocessing.
         #  Inter process communication in the pool uses the queue in the manager. Manager().Queue().
@@ -680,13 +518,11 @@ class Primers_filter(object):
         #  Queue.put_Nowait(): equivalent to Queue. get (False). When the queue is full, an error is reported: Full.
 
     def run(self):
-        p = ProcessPoolExecutor(self.nproc)  #
         size_list = self.size.split(",")
         min_len = int(size_list[0])
         max_len = int(size_list[1])
         candidate_position = self.pre_filter_primers
         adaptor = self.adaptor.split(",")
-        primer_pairs = Manager().list()
         # print(candidate_position)
         coverage_threshold = 1 - self.fraction
         if int(candidate_position[-1]) - int(candidate_position[0]) < min_len:
@@ -698,25 +534,26 @@ class Primers_filter(object):
                 # fo.write(ID + "\t" + "\t".join(headers) + "\t")
                 fo.write(ID + "\n")
         else:
-            for start in range(len(candidate_position)):
-                print(start)
-                p.submit(self.primer_pairs(start, adaptor, min_len, max_len, candidate_position, primer_pairs,
-                                           coverage_threshold))
-                # This will submit all tasks to one place without blocking, and then each
-                # thread in the thread pool will fetch tasks.
-            p.shutdown()
-            # After I run the main, I don't care whether the sub thread is alive or dead. With this parameter,
-            # after all the sub threads are executed, the main function is executed get results after shutdown.
-            # Asynchronous call mode: only call, unequal return values, coupling may exist, but the speed is fast.
+            # Pairs are collected once with the relaxed threshold (used if less than 10 pairs pass),
+            # the non-covered fraction of each pair is kept, so relaxing the threshold is only a re-filter.
+            relaxed_threshold = coverage_threshold + 0.1
+            # primer-F are split into contiguous batches, several per process to balance the load.
+            batch_size = max(1, math.ceil(len(candidate_position) / (self.nproc * 4)))
+            tasks = [(i, min(i + batch_size, len(candidate_position)))
+                     for i in range(0, len(candidate_position), batch_size)]
+            # results are gathered in batch order, so pairs keep the order of primer-F and primer-R.
+            all_primer_pairs = []
+            with ProcessPoolExecutor(self.nproc, initializer=init_pair_worker,
+                                     initargs=(self, adaptor, min_len, max_len, candidate_position,
+                                               relaxed_threshold)) as p:
+                for primer_pairs_list in p.map(primer_pairs_chunk, tasks):
+                    all_primer_pairs.extend(primer_pairs_list)
+            primer_pairs = [line for line, all_non_cover_number in all_primer_pairs
+                            if all_non_cover_number / self.number <= coverage_threshold]
             if len(primer_pairs) < 10:
-                new_p = ProcessPoolExecutor(self.nproc)
-                coverage_threshold += 0.1
-                for start in range(len(candidate_position)):
-                    new_p.submit(self.primer_pairs(start, adaptor, min_len, max_len, candidate_position, primer_pairs,
-                                               coverage_threshold))
-                    # This will submit all tasks to one place without blocking, and then each
-                    # thread in the thread pool will fetch tasks.
-                new_p.shutdown()
+                coverage_threshold = relaxed_threshold
+                primer_pairs = [line for line, all_non_cover_number in all_primer_pairs
+                                if all_non_cover_number / self.number <= coverage_threshold]
             ID = str(self.outfile)
             primer_ID = str(self.outfile).split("/")[-1].rstrip(".txt")
             with open(self.outfile, "w") as fo:
@@ -0,0 +1,79 @@
+#!/bin/python
+"""
+Hairpin detection on 4-bit IUPAC masks (see iupac.py), without expanding degenerate primers.
+A primer has a hairpin if a 5-nt stem [n, n + 5) can pair with a stem [j, j + 5) further downstream,
+j >= n + 5 + distance, i.e. some non-degenerate primer contains the reverse complement of its own 5-mer
+at least distance bases away. Two degenerate bases can pair if the mask of one and the complement mask of the
+other share a base, so all stem pairs of a primer are tested by a single AND of the primer masks against the
+reversed complement masks, followed by a diagonal run of 5 pairable bases.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+from functools import lru_cache
+import numpy as np
+from iupac import ENCODE_TABLE, COMPLEMENT_TABLE
+
+STEM = 5
+
+
+def encode(seq):
+    # characters outside IUPAC codes are encoded as 0 and never pair
+    return ENCODE_TABLE[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+
+
+@lru_cache(maxsize=None)
+def allowed_stems(length, distance, first_row, stem):
+    # stem pairs to test: row a = start of the 3' stem (from first_row), column b = start of the 5' stem counted
+    # from the 3' end of the reversed complement, n = length - stem - b. j - n >= stem + distance <==> a + b >= length + distance
+    a = np.arange(first_row, length - stem + 1)[:, None]
+    b = np.arange(length - stem + 1)[None, :]
+    return (a + b) >= length + distance
+
+
+def stem_pairs(masks, rc_masks, distance, first_row=0, stem=STEM):
+    # masks: IUPAC masks of the sequence, rc_masks: their reversed complement.
+    # True if any 3' stem starting at or after first_row pairs with a 5' stem at least distance bases upstream.
+    length = len(masks)
+    if length - first_row < stem or length < 2 * stem + distance:
+        return False
+    pairable = (masks[first_row:, None] & rc_masks[None, :]) != 0
+    rows = length - stem + 1 - first_row
+    columns = length - stem + 1
+    run = pairable[:rows, :columns].copy()
+    for i in range(1, stem):
+        run &= pairable[i:rows + i, i:columns + i]
+    return bool((run & allowed_stems(length, distance, first_row, stem)).any())
+
+
+class HairpinDetector(object):
+    # distance: minimal number of bases between the two stems, e.g. (number of X) AGCT[XXXX]AGCT
+    def __init__(self, distance=4, stem=STEM):
+        self.distance = distance
+        self.stem = stem
+        self._adaptors = {}
+        self._results = {}
+
+    def adaptor_masks(self, adaptor):
+        # adaptor masks, reversed complement masks and whether the adaptor alone has a hairpin, computed once.
+        if adaptor not in self._adaptors:
+            masks = encode(adaptor)
+            rc_masks = COMPLEMENT_TABLE[masks][::-1]
+            self._adaptors[adaptor] = (masks, rc_masks, stem_pairs(masks, rc_masks, self.distance, stem=self.stem))
+        return self._adaptors[adaptor]
+
+    def check(self, primer, adaptor=""):
+        # hairpin of [adaptor--primer]. Stems inside the adaptor are checked once per adaptor,
+        # only 3' stems reaching into the primer are tested for each primer.
+        key = (adaptor, primer)
+        if key not in self._results:
+            adaptor_masks, adaptor_rc_masks, adaptor_hairpin = self.adaptor_masks(adaptor)
+            if adaptor_hairpin:
+                self._results[key] = True
+            else:
+                primer_masks = encode(primer)
+                masks = np.concatenate((adaptor_masks, primer_masks))
+                rc_masks = np.concatenate((COMPLEMENT_TABLE[primer_masks][::-1], adaptor_rc_masks))
+                first_row = max(0, len(adaptor) - self.stem + 1)
+                self._results[key] = stem_pairs(masks, rc_masks, self.distance, first_row, self.stem)
+        return self._results[key]
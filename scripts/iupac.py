@@ -0,0 +1,41 @@
+#!/bin/python
+"""
+IUPAC nucleotide codes as 4-bit masks.
+A=1, C=2, G=4, T=8; a degenerate base is the OR of the bases it stands for and a gap ("-") is 0.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import numpy as np
+
+base2mask = {"-": 0, "A": 1, "C": 2, "G": 4, "T": 8, "R": 5, "Y": 10, "M": 3, "K": 12, "S": 6, "W": 9,
+             "H": 11, "B": 14, "V": 7, "D": 13, "N": 15}
+
+mask2base = {v: k for k, v in base2mask.items()}
+
+# ASCII code ==> mask. Characters outside the table (including "#") are treated as gap.
+ENCODE_TABLE = np.zeros(256, dtype=np.uint8)
+for base, mask in base2mask.items():
+    ENCODE_TABLE[ord(base)] = mask
+    ENCODE_TABLE[ord(base.lower())] = mask
+
+# mask ==> ASCII code
+DECODE_TABLE = np.zeros(16, dtype=np.uint8)
+for mask, base in mask2base.items():
+    DECODE_TABLE[mask] = ord(base)
+
+# complement of a mask: A<=>T, C<=>G
+COMPLEMENT_TABLE = np.zeros(16, dtype=np.uint8)
+for mask in range(16):
+    COMPLEMENT_TABLE[mask] = ((mask & 1) << 3) | ((mask & 2) << 1) | ((mask & 4) >> 1) | ((mask & 8) >> 3)
+
+# number of bases a mask stands for
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(16)], dtype=np.uint8)
+
+
+def encode(seq):
+    return ENCODE_TABLE[np.frombuffer(seq.encode("ascii"), dtype=np.uint8)]
+
+
+def decode(masks):
+    return DECODE_TABLE[np.asarray(masks, dtype=np.uint8)].tobytes().decode("ascii")
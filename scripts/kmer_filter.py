@@ -2,13 +2,13 @@
 
 from optparse import OptionParser
 import sys
-import re
 import os
 import os.path
 from statistics import mean
 import math
 from functools import reduce
 from operator import mul  #
+from repeats import has_repeat
 
 
 def argsParse():
@@ -102,33 +102,9 @@ def GC_fraction(sequence):
 
 
 ###########################################################
-di_nucleotides = set()
-bases = ["A", "C", "G", "T"]
-for i in bases:
-    single = i * 4
-    di_nucleotides.add(single)
-    for j in bases:
-        if i != j:
-            di = (i + j) * 4
-            di_nucleotides.add(di)
-
-
 def di_nucleotide(primer):
-    Check = "False"
-    primers = dege_trans(primer)
-    for m in primers:
-        for n in di_nucleotides:
-            if re.search(n, m):
-                Check = "True"
-                break
-            else:
-                pass
-        if Check == "True":
-            break
-    if Check == "True":
-        return True
-    else:
-        return False
+    # homopolymer run >= 4 or dinucleotide repeat >= 4 in any non-degenerate kmer, see repeats.py
+    return has_repeat(primer.upper(), trinucleotide=False)
 
 
 ###########################################################
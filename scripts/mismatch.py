@@ -0,0 +1,89 @@
+#!/bin/python
+"""
+Bit-parallel mismatch kernel of (n)-nt variation coverage.
+Primers and variants are encoded as 4-bit IUPAC masks (see iupac.py), 16 bases packed into one uint64 word.
+A base of a variant matches the primer if it is not a gap and lies inside the primer mask (IUPAC containment), e.g.
+A or G under R; a gap ("-") is a mismatch. Mismatch positions of all variants of a window come out of a few
+AND/OR/shift operations, and the forbidden 3'-end positions of primer-F and primer-R (Y_strict, Y_strict_R) are
+checked with precomputed bitmasks.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import numpy as np
+from iupac import ENCODE_TABLE
+
+BASES_PER_WORD = 16
+# lowest bit of every nibble
+NIBBLE_LOW_BITS = np.uint64(0x1111111111111111)
+# number of set bits of each byte
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def encode_masks(primers, length):
+    # primers of the same length ==> (primers x length) uint8 IUPAC masks. Unknown characters ==> 0 (gap).
+    if not primers:
+        return np.zeros((0, length), dtype=np.uint8)
+    masks = ENCODE_TABLE[np.frombuffer("".join(primers).encode("ascii"), dtype=np.uint8)]
+    return masks.reshape(len(primers), length)
+
+
+def pack_masks(masks, words):
+    # (n x length) uint8 masks ==> (n x words) uint64, base i at bits [4 * (i % 16), 4 * (i % 16) + 4) of word i // 16.
+    n, length = masks.shape
+    padded = np.zeros((n, words * BASES_PER_WORD), dtype=np.uint64)
+    padded[:, :length] = masks
+    padded = padded.reshape(n, words, BASES_PER_WORD)
+    shifts = np.arange(0, 4 * BASES_PER_WORD, 4, dtype=np.uint64)
+    return np.bitwise_or.reduce(padded << shifts, axis=2)
+
+
+def position_bits(positions, length, words):
+    # positions (0-based, from 5') ==> one bit (the lowest of the nibble) per position.
+    # Out of range positions are ignored.
+    bits = np.zeros(words, dtype=np.uint64)
+    for idx in positions:
+        if 0 <= idx < length:
+            bits[idx // BASES_PER_WORD] |= np.uint64(1) << np.uint64(4 * (idx % BASES_PER_WORD))
+    return bits
+
+
+def nibble_any(words):
+    # lowest bit of each nibble is set if any bit of the nibble is set
+    folded = words | (words >> np.uint64(1))
+    folded |= folded >> np.uint64(2)
+    return folded & NIBBLE_LOW_BITS
+
+
+def popcount(words):
+    # (n x words) uint64 ==> (n) number of set bits
+    if words.size == 0:
+        return np.zeros(words.shape[0], dtype=np.int64)
+    return POPCOUNT8[words.view(np.uint8)].reshape(words.shape[0], -1).sum(axis=1, dtype=np.int64)
+
+
+class MismatchKernel(object):
+    def __init__(self, length, Y_strict, Y_strict_R):
+        self.length = length
+        self.words = (length + BASES_PER_WORD - 1) // BASES_PER_WORD
+        self.valid_bits = position_bits(range(length), length, self.words)
+        self.F_bits = position_bits(Y_strict, length, self.words)
+        self.R_bits = position_bits(Y_strict_R, length, self.words)
+
+    def mismatch_bits(self, primer, variants):
+        # one bit per mismatch position of each variant against (degenerate) primer
+        primer_words = pack_masks(encode_masks([primer], self.length), self.words)[0]
+        variant_words = pack_masks(encode_masks(variants, self.length), self.words)
+        # variant bases outside the primer mask
+        outside = nibble_any(variant_words & ~primer_words)
+        # gaps ("-") in variants
+        gap = ~nibble_any(variant_words) & self.valid_bits
+        return outside | gap
+
+    def check(self, primer, variants):
+        # number of mismatches, mismatch in Y_strict (primer-F), mismatch in Y_strict_R (primer-R) of each variant
+        bits = self.mismatch_bits(primer, variants)
+        mismatch_number = popcount(bits)
+        F_strict = ((bits & self.F_bits) != 0).any(axis=1)
+        R_strict = ((bits & self.R_bits) != 0).any(axis=1)
+        return mismatch_number, F_strict, R_strict
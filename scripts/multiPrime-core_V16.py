@@ -38,22 +38,36 @@ THE SOFTWARE.
 
 import math
 import time
-from functools import reduce
+from functools import reduce, partial, wraps
 from math import log10
-from itertools import product
-from multiprocessing import Manager
-from collections import defaultdict
+from collections import defaultdict, deque, Counter, namedtuple
+import io
+from itertools import groupby, islice
+import heapq
 import re
 from concurrent.futures import ProcessPoolExecutor
 from operator import mul
 from statistics import mean
 from optparse import OptionParser
+import os
 import sys
-from itertools import repeat
+import copy
 import json
+import pickle
+import shutil
+import hashlib
 import numpy as np
 import pandas as pd
 from numpy import array
+from alignment_store import AlignmentStore, distinct_rows
+from nn_matrix import variant_codes, frequency_matrix, transition_tensor, viterbi_batch
+from thermo import default_thermodynamics
+from mismatch import MismatchKernel
+from seq_id_store import SeqIdWriter, JsonObjectWriter, SeqIdStore
+from degenerate import degenerate_primer, degenerate_seq, expansion_deltaG
+from hairpin import HairpinDetector
+from repeats import has_repeat
+from coverage_index import CoverageIndex
 
 # Melting temperature between 55-80◦C reduces the occurrence of hairpins
 # Runs of three or more Cs or Gs at the 3'-ends of primers may promote mispriming at G or C-rich sequences
@@ -74,6 +88,15 @@ def argsParse():
                       type="int",
                       help='Length of primer. Default: 18.')
 
+    parser.add_option('-L', '--plen_range',
+                      dest='plen_range',
+                      default=None,
+                      type="str",
+                      help='Range of primer length, e.g. 18,25: primers of each length are designed in one run '
+                           '(one alignment parse, one process pool). [out] is the merged candidate table with '
+                           'a Length column; [out].[length] and [out].[length].seq_id_bin are the outputs of each '
+                           'length, as written by -l. -l is ignored. Default: None.')
+
     parser.add_option('-n', '--dnum',
                       dest='dnum',
                       default=4,
@@ -132,6 +155,15 @@ def argsParse():
                            "1:  I dont want mismatch at the 2nd position, start from 0."
                            "-1: I dont want mismatch at the -1st position, start fro -1.")
 
+    parser.add_option('-r', '--role',
+                      dest='role',
+                      action="store_true",
+                      default=False,
+                      help="Role-aware mode: acc IDs not covered as primer-F (primer-R) are only recorded for windows "
+                           "which can start (end) a PCR product of -s bp, i.e. windows too close to the end of the "
+                           "alignment skip primer-F work and windows too close to the start skip primer-R work. "
+                           "Skipped roles are recorded as not covering any sequence. Default: False.")
+
     parser.add_option('-p', '--proc',
                       dest='proc',
                       default="20",
@@ -147,14 +179,62 @@ def argsParse():
                            'Primers should not have complementary sequences (no consecutive 4 bp complementarities),'
                            'otherwise the primers themselves will fold into hairpin structure.')
 
+    parser.add_option('-j', '--json',
+                      dest='json',
+                      action="store_true",
+                      default=False,
+                      help="Also write acc IDs of non-covered sequences as [out].non_coverage_seq_id_json and "
+                           "[out].gap_seq_id_json. They are always written to the binary [out].seq_id_bin, "
+                           "which can be exported to JSON later by seq_id_store.py.")
+
+    parser.add_option('-w', '--sweep',
+                      dest='sweep',
+                      default=None,
+                      type="str",
+                      help="Parameter sweep: grid of -n, -d, -v, -c and -f, e.g. 'n=4|6;d=10|32;c=2,-1|4'. "
+                           "Parameters are separated by ';', values by '|', missing parameters take the value of "
+                           "their option. The alignment is parsed once and the window tables are shared by all grid "
+                           "points. [out].sweep_[k] (+ .seq_id_bin) is written for grid point k, [out].sweep lists "
+                           "the grid points. Default: None.")
+
+    parser.add_option('-k', '--checkpoint',
+                      dest='checkpoint',
+                      action="store_true",
+                      default=False,
+                      help="Keep the results of each finished range of windows in [out].checkpoint/, keyed by a hash "
+                           "of the input alignment and parameters. A rerun with the same input and parameters (any -p) "
+                           "skips the finished ranges. Removed after the outputs are written. Not available with -w. "
+                           "Default: False.")
+
+    parser.add_option('-b', '--batch',
+                      dest='batch',
+                      action="store_true",
+                      default=False,
+                      help="Batch mode: design primers for many alignments (clusters) with one process pool. -i is a "
+                           "directory of alignments (*.msa, *.tmsa) or comma-separated alignment files, more "
+                           "alignment files can follow the options. -o is the output directory: "
+                           "[out]/[name].top.primer.out (+ .seq_id_bin) for alignment [name].[ext], failed alignments "
+                           "in [out]/failed.txt (exit 1 only if all failed). Windows of all alignments share the "
+                           "pool, largest alignments first. Not with -L or -w. Default: False.")
+
+    parser.add_option('--profile',
+                      dest='profile',
+                      action="store_true",
+                      default=False,
+                      help="Write [out].profile.json ([out]/batch.profile.json with -b): wall time and number of "
+                           "calls of each design stage, summed over all processes (times of a stage include the "
+                           "stages it calls), and the number of windows rejected by each filter for each output. "
+                           "Default: False.")
+
     parser.add_option('-o', '--out',
                       dest='out',
-                      help='Output file: candidate primers. e.g. [*].candidate.primers.txt.')
+                      help='Output file: candidate primers. e.g. [*].candidate.primers.txt. '
+                           'Output directory with -b.')
     (options, args) = parser.parse_args()
     if len(sys.argv) == 1:
         parser.print_help()
         sys.exit(1)
-    elif options.input is None:
+    elif options.input is None and not (options.batch and args):
         parser.print_help()
         print("Input file must be specified !!!")
         sys.exit(1)
@@ -165,10 +245,6 @@ def argsParse():
     return parser.parse_args()
 
 
-degenerate_base = {"-": ["-"], "A": ["A"], "G": ["G"], "C": ["C"], "T": ["T"], "R": ["A", "G"], "Y": ["C", "T"],
-                   "M": ["A", "C"], "K": ["G", "T"], "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"],
-                   "B": ["G", "T", "C"], "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
-
 score_table = {"-": 100, "#": 0, "A": 1, "G": 1.11, "C": 1.21, "T": 1.4, "R": 2.11, "Y": 2.61, "M": 2.21,
                "K": 2.51, "S": 2.32, "W": 2.4, "H": 3.61, "B": 3.72, "V": 3.32, "D": 3.51, "N": 4.72}
 
@@ -200,39 +276,6 @@ symmetry_correction = 0.4
 ##############################################################################################
 base2bit = {"A": 0, "C": 1, "G": 2, "T": 3, "#": 4}
 
-##############################################################################################
-# 37°C and 1 M NaCl
-Htable2 = [[-7.9, -8.5, -8.2, -7.2, 0],
-           [-8.4, -8, -9.8, -8.2, 0],
-           [-7.8, -10.6, -8, -8.5, 0],
-           [-7.2, -7.8, -8.4, -7.9, 0],
-           [0, 0, 0, 0, 0]]
-Stable2 = [[-22.2, -22.7, -22.2, -21.3, 0],
-           [-22.4, -19.9, -24.4, -22.2, 0],
-           [-21, -27.2, -19.9, -22.7, 0],
-           [-20.4, -21, -22.4, -22.2, 0],
-           [0, 0, 0, 0, 0]]
-Gtable2 = [[-1, -1.45, -1.3, -0.58, 0],
-           [-1.44, -1.84, -2.24, -1.3, 0],
-           [-1.28, -2.17, -1.84, -1.45, 0],
-           [-0.88, -1.28, -1.44, -1, 0],
-           [0, 0, 0, 0, 0]]
-H_adjust_initiation = {"A": 2.3, "T": 2.3, "C": 0.1, "G": 0.1}
-S_adjust_initiation = {"A": 4.1, "T": 4.1, "C": -2.8, "G": -2.8}
-G_adjust_initiation = {"A": 1.03, "T": 1.03, "C": 0.98, "G": 0.98}
-H_symmetry_correction = 0
-S_symmetry_correction = -1.4
-G_symmetry_correction = 0.4
-##############################################################################################
-# ng/ul
-primer_concentration = 100
-Mo_concentration = 50
-Di_concentration = 1.5
-dNTP_concentration = 0.25
-Kelvin = 273.15
-# reference (Owczarzy et al.,2008)
-crossover_point = 0.22
-
 bases = np.array(["A", "C", "G", "T"])
 di_bases = []
 for i in bases:
@@ -244,19 +287,6 @@ def Penalty_points(length, GC, d1, d2):
     return log10((2 ** length * 2 ** GC) / ((d1 + 0.1) * (d2 + 0.1)))
 
 
-di_nucleotides = set()
-for i in base2bit.keys():
-    single = i * 4
-    di_nucleotides.add(single)
-    for j in base2bit.keys():
-        if i != j:
-            di = (i + j) * 4
-            di_nucleotides.add(di)
-        for k in base2bit.keys():
-            if i != j != k:
-                tri = (i + j + k) * 3
-                di_nucleotides.add(tri)
-
 def score_trans(sequence):
     return reduce(mul, [math.floor(score_table[x]) for x in list(sequence)])
 
@@ -270,16 +300,6 @@ def RC(seq):
     return seq.translate(TRANS)[::-1]
 
 
-##############################################################################################
-############## m_distance which is used to calculate (n)-nt variation coverage ###############
-# Caution: this function only works when degeneracy of seq2 < 2 (no degenerate in seq2).
-##############################################################################################
-def Y_distance(seq1, seq2):
-    seq_diff = list(np.array([score_table[x] for x in list(seq1)]) - np.array([score_table[x] for x in list(seq2)]))
-    m_dist = [idx for idx in range(len(seq_diff)) if seq_diff[idx] not in score_table.values()]
-    return m_dist
-
-
 ##############################################################################################
 def symmetry(seq):
     if len(seq) % 2 == 1:
@@ -293,21 +313,6 @@ def symmetry(seq):
             return False
 
 
-def Calc_deltaH_deltaS(seq):
-    Delta_H = 0
-    Delta_S = 0
-    for n in range(len(seq) - 1):
-        i, j = base2bit[seq[n + 1]], base2bit[seq[n]]
-        Delta_H += Htable2[i][j]
-        Delta_S += Stable2[i][j]
-    seq = seq.replace("#", '')
-    Delta_H += H_adjust_initiation[seq[0]] + H_adjust_initiation[seq[-1]]
-    Delta_S += S_adjust_initiation[seq[0]] + S_adjust_initiation[seq[-1]]
-    if symmetry(seq):
-        Delta_S += S_symmetry_correction
-    return Delta_H * 1000, Delta_S
-
-
 # salt_adjust = math.log(Tm_Na_adjust / 1000.0, math.e)
 # def S_adjust(seq):
 #     n = len(seq) - 1
@@ -321,75 +326,391 @@ def Calc_deltaH_deltaS(seq):
 # where n is the total number of phosphates in the duplex divided by 2,
 # This is equal to the oligonucleotide length minus 1.
 
-def GC_fraction(seq):
-    return round((list(seq).count("G") + list(seq).count("C")) / len(list(seq)), 3)
 
+##############################################################################################
 
-# different salt corrections for monovalent (Owczarzy et al.,2004) and divalent cations (Owczarzy et al.,2008)
-def Calc_Tm_v2(seq):
-    delta_H, delta_S = Calc_deltaH_deltaS(seq)
-    # Note that the concentrations in the following Eq is mmol/L, In all other equations,concentration are mol/L
-    # Monovalent cations are typically present as K+ and Tris+ in PCR buffer,
-    # K+ is similar to Na+ in regard to duplex stabilization
-    # if Di_concentration > dNTP_concentration:
-    #     Tm_Na_adjust = Mo_concentration + 120 * math.sqrt(Di_concentration - dNTP_concentration)
-    # else:
-    #     Tm_Na_adjust = Mo_concentration
-    Tm_Na_adjust = Mo_concentration
 
-    if dNTP_concentration >= Di_concentration:
-        free_divalent = 0.00000000001
-    else:
-        free_divalent = (Di_concentration - dNTP_concentration) / 1000.0
-    R_div_monov_ratio = (math.sqrt(free_divalent)) / (Mo_concentration / 1000)
-
-    if R_div_monov_ratio < crossover_point:
-        # use only monovalent salt correction, [equation 22] (Owczarzy et al., 2004)
-        correction = (((4.29 * GC_fraction(seq)) - 3.95) * pow(10, -5) * math.log(Tm_Na_adjust / 1000.0, math.e)) \
-                     + (9.40 * pow(10, -6) * (pow(math.log(Tm_Na_adjust / 1000.0, math.e), 2)))
-    else:
-        # magnesium effects are dominant, [equation 16] (Owczarzy et al., 2008) is used
-        # Table 2
-        a = 3.92 * pow(10, -5)
-        b = - 9.11 * pow(10, -6)
-        c = 6.26 * pow(10, -5)
-        d = 1.42 * pow(10, -5)
-        e = - 4.82 * pow(10, -4)
-        f = 5.25 * pow(10, -4)
-        g = 8.31 * pow(10, -5)
-        if R_div_monov_ratio < 6.0:
-            a = 3.92 * pow(10, -5) * (
-                    0.843 - (0.352 * math.sqrt(Tm_Na_adjust / 1000.0) * math.log(Tm_Na_adjust / 1000.0, math.e)))
-            d = 1.42 * pow(10, -5) * (
-                    1.279 - 4.03 * pow(10, -3) * math.log(Tm_Na_adjust / 1000.0, math.e) - 8.03 * pow(10, -3) * pow(
-                math.log(Tm_Na_adjust / 1000.0, math.e), 2))
-            g = 8.31 * pow(10, -5) * (
-                    0.486 - 0.258 * math.log(Tm_Na_adjust / 1000.0, math.e) + 5.25 * pow(10, -3) * pow(
-                math.log(Tm_Na_adjust / 1000.0, math.e), 3))
-        # Eq 16
-        correction = a + (b * math.log(free_divalent, math.e))
-        + GC_fraction(seq) * (c + (d * math.log(free_divalent, math.e)))
-        + (1 / (2 * (len(seq) - 1))) * (e + (f * math.log(free_divalent, math.e))
-                                        + g * (pow((math.log(free_divalent, math.e)), 2)))
-
-    if symmetry(seq):
-        # Equation A
-        Tm = round(1 / ((1 / (delta_H / (delta_S + 1.9872 * math.log(primer_concentration / (1 * pow(10, 9)), math.e))))
-                        + correction) - Kelvin, 2)
-    else:
-        # Equation B
-        Tm = round(1 / ((1 / (delta_H / (delta_S + 1.9872 * math.log(primer_concentration / (4 * pow(10, 9)), math.e))))
-                        + correction) - Kelvin, 2)
-    return Tm
+##############################################################################################
+############## window scanning in worker processes ###########################################
+# The alignment is handed to each worker once by the pool initializer (inherited by fork),
+# so tasks only carry a (start, stop) range of windows instead of the whole sequence dict.
+##############################################################################################
+# Several primer lengths can be scanned by one pool: workers keep one NN_degenerate per length.
+WINDOW_WORKER_APP = {}
+
+
+def init_window_worker(nn_apps):
+    global WINDOW_WORKER_APP
+    WINDOW_WORKER_APP = {nn_app.primer_length: nn_app for nn_app in nn_apps}
+
+
+def scan_window_chunk(task, batch_size=256):
+    # task: (primer length, (start, stop)) ==> (results, number of windows per filter outcome).
+    return scan_chunk(WINDOW_WORKER_APP[task[0]], task, batch_size)
+
+
+def scan_chunk(nn_app, task, batch_size=256):
+    # The gap test is done for a whole batch of windows first (see NN_degenerate.gap_filter), the other filters
+    # window by window, the Viterbi / MM decoding of the passing windows is done in batches.
+    primer_length, (chunk_start, chunk_stop) = task
+    checkpoint = nn_app.checkpoint_file(task)
+    if checkpoint is not None:
+        chunk_result = load_checkpoint(checkpoint)
+        if chunk_result is not None:
+            return chunk_result
+    nn_app.window_counts = Counter()
+    results = []
+    for batch_start in range(chunk_start, chunk_stop, batch_size):
+        positions = range(batch_start, min(batch_start + batch_size, chunk_stop))
+        windows = [nn_app.prepare_window(position) if passed else None
+                   for position, passed in zip(positions, nn_app.gap_filter(positions))]
+        decoded = iter(nn_app.decode_windows([window for window in windows if window is not None]))
+        for window in windows:
+            results.append(None if window is None else nn_app.design_window(window, next(decoded)))
+    chunk_result = (results, dict(nn_app.window_counts))
+    if checkpoint is not None:
+        save_checkpoint(checkpoint, chunk_result)
+    return chunk_result
+
+
+# Batch mode: one pool for the designs of several alignments, tasks are (index of the design, window task).
+BATCH_WORKER_APPS = []
+
+
+def init_batch_worker(nn_apps):
+    global BATCH_WORKER_APPS
+    BATCH_WORKER_APPS = nn_apps
+
+
+def batch_window_chunk(task, batch_size=256):
+    k, window_task = task
+    return scan_chunk(BATCH_WORKER_APPS[k], window_task, batch_size)
+
+
+SWEEP_WORKER_APPS = []
+
+
+def init_sweep_worker(nn_apps):
+    global SWEEP_WORKER_APPS
+    SWEEP_WORKER_APPS = nn_apps
+
+
+def sweep_window_chunk(chunk, batch_size=256):
+    # results of a (start, stop) range of windows for each grid point of the sweep.
+    # The window masks are read once, and the filtered window tables (cover, frequency and NN arrays) are shared by
+    # the grid points with the same filters (primer length, -v, -f), see NN_degenerate.window_key.
+    # ==> (results, number of windows per filter outcome) of each grid point.
+    chunk_start, chunk_stop = chunk
+    nn_apps = SWEEP_WORKER_APPS
+    results = [[] for _ in nn_apps]
+    for nn_app in nn_apps:
+        nn_app.window_counts = Counter()
+    for batch_start in range(chunk_start, chunk_stop, batch_size):
+        positions = range(batch_start, min(batch_start + batch_size, chunk_stop))
+        # masks of the windows passing the gap test of any grid point, read once
+        window_masks = {}
+        prepared = {}
+        for k, nn_app in enumerate(nn_apps):
+            # the key includes the coverage, which sets the start / stop region: shared windows have the same region
+            key = nn_app.window_key()
+            if key not in prepared:
+                before = Counter(nn_app.window_counts)
+                # only the windows of this grid point's own region are tested (and counted), as in a single design
+                own_positions = [position for position in positions
+                                 if nn_app.start_position <= position < nn_app.stop_position - nn_app.primer_length]
+                passed = dict(zip(own_positions, nn_app.gap_filter(own_positions))) if own_positions else {}
+                windows = []
+                for position in positions:
+                    if passed.get(position, False):
+                        if position not in window_masks:
+                            window_masks[position] = nn_app.alignment.window_masks(position, nn_app.primer_length)
+                        windows.append(nn_app.prepare_window(position, window_masks[position]))
+                    else:
+                        windows.append(None)
+                # filter outcomes, counted again for the other grid points sharing these windows
+                prepared[key] = windows, nn_app.window_counts - before
+            else:
+                windows, counts = prepared[key]
+                nn_app.window_counts.update(counts)
+            decoded = iter(nn_app.decode_windows([window for window in windows if window is not None]))
+            for window in windows:
+                results[k].append(None if window is None else nn_app.design_window(window, next(decoded)))
+    return [(res, dict(nn_app.window_counts)) for res, nn_app in zip(results, nn_apps)]
+
+
+def load_checkpoint(path):
+    # results of a finished range of windows, None if not (completely) saved
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (EOFError, pickle.UnpicklingError):
+        return None
+
+
+def save_checkpoint(path, results):
+    # committed atomically: a partial file is never seen under the final name
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb") as f:
+        pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def ordered_map(executor, fn, tasks, max_pending):
+    # reorder buffer: results of fn over tasks, in task order, each one as soon as it and all earlier tasks are done.
+    # At most max_pending tasks are submitted ahead of the oldest unfinished one, so the results finished out of
+    # order and kept in memory are bounded.
+    tasks = iter(tasks)
+    pending = deque(executor.submit(fn, task) for task in islice(tasks, max_pending))
+    while pending:
+        result = pending.popleft().result()
+        for task in islice(tasks, 1):
+            pending.append(executor.submit(fn, task))
+        yield result
+
+
+# windows per task. Fixed, so that the ranges (and their checkpoint files, -k) do not depend on the number of
+# processes: a rerun with another -p resumes the same ranges, and a killed run loses at most one range per process.
+CHUNK_WINDOWS = 64
+
+
+def window_chunks(start, stop, chunk_size=CHUNK_WINDOWS):
+    # contiguous ranges of windows, many per process to balance conserved / variable regions.
+    start, stop = int(start), int(stop)
+    if stop <= start:
+        return []
+    return [(i, min(i + chunk_size, stop)) for i in range(start, stop, chunk_size)]
 
 
 ##############################################################################################
+############## profiling (--profile) #########################################################
+# Stages are timed by wrappers installed on the class / module attributes by enable_profile: nothing is timed,
+# and nothing is changed, if the mode is off. Each process times its own stages; worker processes send theirs back
+# with each chunk result (see profiled), the main process adds them up (see profile_results).
+##############################################################################################
+STAGE_PROFILE = None
+
+# stage name ==> function timed. Times of a stage include those of the stages it calls.
+NN_STAGES = [("parse_alignment", "parse_seq"), ("gap_filter", "gap_filter"), ("prepare_window", "prepare_window"),
+             ("state_matrix", "state_matrix"), ("trans_matrix", "trans_matrix"),
+             ("decode_windows", "decode_windows"), ("design_window", "design_window"),
+             ("degenerate_by_NN_algorithm", "degenerate_by_NN_algorithm"),
+             ("refine_by_NN_array", "refine_by_NN_array"), ("coverage_stast", "coverage_stast"),
+             ("mis_primer_check", "mis_primer_check"), ("primer_pre_filter", "primer_pre_filter"),
+             ("dimer_check", "dimer_check")]
+
+
+class StageProfile(object):
+    # wall time and number of calls of each stage in this process, filter outcomes of each design
+    def __init__(self):
+        self.pid = os.getpid()
+        self.seconds = defaultdict(float)
+        self.calls = Counter()
+        self.rejections = {}
+
+    def add(self, stage, seconds):
+        self.seconds[stage] += seconds
+        self.calls[stage] += 1
+
+    def drain(self):
+        # stage times since the last drain, to be sent to the main process
+        stats = {stage: (self.calls[stage], self.seconds[stage]) for stage in self.calls}
+        self.seconds.clear()
+        self.calls.clear()
+        return stats
+
+    def update(self, stats):
+        for stage, (calls, seconds) in stats.items():
+            self.calls[stage] += calls
+            self.seconds[stage] += seconds
+
+    def report(self, path, total_time, nproc):
+        # JSON report: stage times summed over all processes, and filter outcomes of each design
+        stages = {stage: {"calls": self.calls[stage], "seconds": round(self.seconds[stage], 6)}
+                  for stage in sorted(self.calls, key=lambda stage: -self.seconds[stage])}
+        with open(path, "w") as fo:
+            json.dump({"total_seconds": round(total_time, 6), "processes": nproc, "stages": stages,
+                       "rejections": self.rejections}, fo, indent=4)
+
+
+def timed(function, stage):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            STAGE_PROFILE.add(stage, time.perf_counter() - start)
+    return wrapper
+
+
+def enable_profile():
+    # to be called before any design is set up
+    global STAGE_PROFILE
+    STAGE_PROFILE = StageProfile()
+    for stage, name in NN_STAGES:
+        setattr(NN_degenerate, name, timed(getattr(NN_degenerate, name), stage))
+    AlignmentStore.window_masks = timed(AlignmentStore.window_masks, "window_masks")
+    ResultWriter.add = timed(ResultWriter.add, "write_results")
+    default_thermodynamics.Tm = timed(default_thermodynamics.Tm, "Tm")
+    globals()["viterbi_batch"] = timed(viterbi_batch, "viterbi")
+
+
+def profiled_chunk(fn, task):
+    if STAGE_PROFILE.pid != os.getpid():
+        # forked worker: the times inherited from the main process are not ours
+        STAGE_PROFILE.__init__()
+    return fn(task), STAGE_PROFILE.drain()
+
+
+def profiled(fn):
+    # worker function fn, returning its stage times with each result if the mode is on
+    if STAGE_PROFILE is None:
+        return fn
+    return partial(profiled_chunk, fn)
+
+
+def profile_results(chunk_results):
+    # results of profiled(fn) in the main process ==> results of fn
+    if STAGE_PROFILE is None:
+        return chunk_results
+    return (add_profile(result, stats) for result, stats in chunk_results)
+
+
+def add_profile(result, stats):
+    STAGE_PROFILE.update(stats)
+    return result
+
+
+class DesignError(ValueError):
+    # the alignment or the parameters do not allow any primer design
+    pass
+
+
+def alignment_sequences(alignment, ids=None):
+    # aligned sequences in memory ==> (acc IDs, sequences as strings)
+    # alignment: dict {acc ID: sequence}, list of strings, or numpy array: 1-D of strings, 2-D of characters
+    # (one row per sequence, dtype S1 / U1) or 2-D of ASCII codes (uint8). ids default to seq_0, seq_1, ...
+    if isinstance(alignment, dict):
+        ids = list(alignment.keys()) if ids is None else ids
+        sequences = list(alignment.values())
+    elif isinstance(alignment, np.ndarray) and alignment.ndim == 2:
+        if alignment.dtype == np.uint8:
+            sequences = [row.tobytes().decode("ascii") for row in alignment]
+        elif alignment.dtype.kind == "S":
+            sequences = [b"".join(row.tolist()).decode("ascii") for row in alignment]
+        elif alignment.dtype.kind == "U":
+            sequences = ["".join(row.tolist()) for row in alignment]
+        else:
+            raise DesignError("unsupported alignment array of dtype {}".format(alignment.dtype))
+    else:
+        sequences = [sequence.decode("ascii") if isinstance(sequence, bytes) else str(sequence)
+                     for sequence in alignment]
+    if ids is None:
+        ids = ["seq_{}".format(i) for i in range(len(sequences))]
+    ids = list(ids)
+    if len(ids) != len(sequences):
+        raise DesignError("{} acc IDs for {} sequences".format(len(ids), len(sequences)))
+    if len(set(ids)) != len(ids):
+        raise DesignError("acc IDs are not unique")
+    return ids, sequences
+
+
+# one row of the candidate table (-o), see DesignResult
+Candidate = namedtuple("Candidate", ["position", "entropy_cover", "entropy_total", "primer", "degenerate_number",
+                                     "nonsense_number", "coverage", "F_mis_coverage", "R_mis_coverage", "Tm",
+                                     "information"])
+
+
+class DesignResult(object):
+    # candidate primers of NN_degenerate.design in position order, as Candidate tuples and as arrays.
+    # seq_id_store: acc IDs not covered by each candidate (in memory, see seq_id_store.py).
+    # filter_counts: number of windows per filter outcome.
+    def __init__(self, candidates, seq_id_store, filter_counts):
+        self.candidates = candidates
+        self.seq_id_store = seq_id_store
+        self.filter_counts = filter_counts
+        self.positions = np.array([c.position for c in candidates], dtype=np.int64)
+        self.primers = [c.primer for c in candidates]
+        self.coverages = np.array([c.coverage for c in candidates], dtype=np.int64)
+        self.F_mis_coverages = np.array([c.F_mis_coverage for c in candidates], dtype=np.int64)
+        self.R_mis_coverages = np.array([c.R_mis_coverage for c in candidates], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __iter__(self):
+        return iter(self.candidates)
+
+    def uncovered(self, position, role="F"):
+        # acc IDs not covered by the candidate at position as primer-F (role "F") or primer-R ("R"), by mismatch or gap
+        return self.seq_id_store.uncovered(position, role) | self.seq_id_store.uncovered(position, "gap")
+
+
+class ResultCollector(object):
+    # ResultWriter in memory: window results in position order ==> DesignResult
+    def __init__(self, nn_app):
+        self.nn_app = nn_app
+        self.candidates = []
+        self.buffer = io.BytesIO()
+        self.seq_id_writer = SeqIdWriter(self.buffer, nn_app.alignment.ids)
+
+    def add(self, res):
+        if res is None:
+            return
+        (position, candidate), (_, non_cover), (_, gap_seq_id) = res
+        self.candidates.append(Candidate(position, *candidate))
+        self.seq_id_writer.add(position, non_cover[0], non_cover[1], gap_seq_id)
+
+    def close(self):
+        self.seq_id_writer.close()
+        return DesignResult(self.candidates, SeqIdStore(buffer=self.buffer.getvalue()), dict(self.nn_app.filter_counts))
+
+
+class ResultWriter(object):
+    # Streaming writer of the outputs of a design: window results in position order ==> [outfile],
+    # [outfile].seq_id_bin (and JSON). Each window is written as soon as it arrives, nothing is kept but the bit
+    # arrays of [outfile].seq_id_bin, see seq_id_store.py.
+    def __init__(self, nn_app):
+        self.json_out = nn_app.json_out
+        self.seq_id_writer = SeqIdWriter(nn_app.outfile + '.seq_id_bin', nn_app.alignment.ids)
+        if self.json_out:
+            self.non_cover_writer = JsonObjectWriter(nn_app.outfile + '.non_coverage_seq_id_json')
+            self.gap_writer = JsonObjectWriter(nn_app.outfile + '.gap_seq_id_json')
+        self.fo = open(nn_app.outfile, "w")
+        headers = ["Position", "Entropy of cover (bit)", "Entropy of total (bit)", "Optimal_primer", "primer_degenerate_number",
+                   "nonsense_primer_number", "Optimal_coverage", "Mis-F-coverage", "Mis-R-coverage", "Tm",
+                   "Information"]
+        self.fo.write("\t".join(map(str, headers)) + "\n")
+
+    def add(self, res):
+        if res is None:
+            return
+        (position, candidate), (_, non_cover), (_, gap_seq_id) = res
+        self.fo.write(str(position) + "\t" + "\t".join(map(str, candidate)) + "\n")
+        # acc IDs of non-covered sequences: binary, memory-mappable store, see seq_id_store.py.
+        self.seq_id_writer.add(position, non_cover[0], non_cover[1], gap_seq_id)
+        if self.json_out:
+            self.non_cover_writer.add(position, non_cover)
+            self.gap_writer.add(position, gap_seq_id)
+
+    def close(self):
+        self.fo.close()
+        self.seq_id_writer.close()
+        if self.json_out:
+            self.non_cover_writer.close()
+            self.gap_writer.close()
 
 
 class NN_degenerate(object):
+    # seq_file: alignment file, or the aligned sequences in memory (dict {acc ID: sequence}, list of strings or
+    # numpy array, see alignment_sequences) with their acc IDs in ids. Raises DesignError instead of exiting.
     def __init__(self, seq_file, primer_length=18, coverage=0.8, number_of_dege_bases=18, score_of_dege_bases=1000,
                  product_len=250, position="2,-1", variation=2, raw_entropy_threshold=3.6, distance=4, GC="0.4,0.6",
-                 nproc=10, outfile=""):
+                 nproc=10, outfile="", json_out=False, role_aware=False, checkpoint=False, ids=None):
         self.primer_length = primer_length  # primer length
         self.coverage = coverage  # min coverage
         self.number_of_dege_bases = number_of_dege_bases
@@ -397,89 +718,79 @@ class NN_degenerate(object):
         self.product = product_len
         self.position = position  # gap position
         self.Y_strict, self.Y_strict_R = self.get_Y()
+        self.mismatch_kernel = MismatchKernel(self.primer_length, self.Y_strict, self.Y_strict_R)
         self.variation = variation  # coverage of n-nt variation and max_gap_number
         self.distance = distance  # haripin
+        self.hairpin_detector = HairpinDetector(distance)
+        # dimer_check results, shared by the designs of with_parameters
+        self.dimer_cache = {}
+        # number of windows per filter outcome: window_counts in the scanning process, filter_counts in total
+        self.window_counts = Counter()
+        self.filter_counts = Counter()
         self.GC = GC.split(",")
         self.nproc = nproc  # GC content
-        self.seq_dict, self.total_sequence_number = self.parse_seq(seq_file)
-        self.position_list = self.seq_attribute(self.seq_dict)
+        self.seq_file = seq_file
+        self.alignment = self.parse_seq(seq_file, ids)
+        self.total_sequence_number = self.alignment.number
+        self.position_list = self.seq_attribute(self.alignment)
         self.start_position = self.position_list[0]
         self.stop_position = self.position_list[1]
         self.length = self.position_list[2]
         self.raw_entropy_threshold = raw_entropy_threshold
         self.entropy_threshold = self.entropy_threshold_adjust(self.length)
         self.outfile = outfile
-        self.resQ = Manager().Queue()
-
-    # expand degenerate primer into a list.
-    @staticmethod
-    def degenerate_seq(primer):
-        seq = []
-        cs = ""
-        for s in primer:
-            if s not in degenerate_base:
-                cs += s
-            else:
-                seq.append([cs + i for i in degenerate_base[s]])
-                cs = ""
-        if cs:
-            seq.append([cs])
-        return ["".join(i) for i in product(*seq)]
+        self.json_out = json_out
+        self.role_aware = role_aware
+        self.checkpoint_dir = self.checkpoint_path() if checkpoint else None
+
+    def with_parameters(self, outfile, **parameters):
+        # the same design with other parameters (attribute names of __init__, e.g. primer_length, variation).
+        # The alignment store is shared, as are the hairpin, dimer, repeat, expansion and Tm caches inside a process.
+        nn_app = copy.copy(self)
+        for name, value in parameters.items():
+            setattr(nn_app, name, value)
+        nn_app.window_counts = Counter()
+        nn_app.filter_counts = Counter()
+        nn_app.Y_strict, nn_app.Y_strict_R = nn_app.get_Y()
+        nn_app.mismatch_kernel = MismatchKernel(nn_app.primer_length, nn_app.Y_strict, nn_app.Y_strict_R)
+        if nn_app.coverage != self.coverage:
+            # start / stop region and entropy threshold depend on the coverage
+            nn_app.position_list = nn_app.seq_attribute(nn_app.alignment)
+            nn_app.start_position, nn_app.stop_position, nn_app.length = nn_app.position_list
+            nn_app.entropy_threshold = nn_app.entropy_threshold_adjust(nn_app.length)
+        nn_app.outfile = outfile
+        return nn_app
+
+    def with_length(self, primer_length, outfile):
+        # the same design for another primer length
+        return self.with_parameters(outfile, primer_length=primer_length)
+
+    def window_key(self):
+        # parameters of the window filters (prepare_window): designs with the same key share the window tables
+        return self.primer_length, self.variation, self.coverage
+
+    # expand degenerate primer into a tuple. Expansions are cached, see degenerate.py.
+    degenerate_seq = staticmethod(degenerate_seq)
 
     ##################################################
     ################# pre_filter #####################
     ##################################################
 
     ################### hairpin ######################
-    def hairpin_check(self, primer):
-        n = 0
-        distance = self.distance
-        check = "FALSE"
-        while n <= len(primer) - 5 - 5 - distance:
-            kmer = self.degenerate_seq(primer[n:n + 5])
-            left = self.degenerate_seq(primer[n + 5 + distance:])
-            for k in kmer:
-                for l in left:
-                    if re.search(RC(k), l):
-                        check = "TRUE"
-                        break
-                if check == "TRUE":
-                    break
-            if check == "TRUE":
-                break
-            n += 1
-
-        if check == "TRUE":
-            return True
-        else:
-            return False
+    def hairpin_check(self, primer, adaptor=""):
+        # hairpin of [adaptor--primer] on IUPAC masks, see hairpin.py
+        return self.hairpin_detector.check(primer, adaptor)
 
     ################# GC content #####################
     def GC_fraction(self, sequence):
-        sequence_expand = self.degenerate_seq(sequence)
-        GC_list = []
-        for seq in sequence_expand:
-            GC_list.append(round((list(seq).count("G") + list(seq).count("C")) / len(list(seq)), 3))
-        GC_average = round(mean(GC_list), 2)
+        GC_average = round(degenerate_primer(sequence).gc_mean, 2)
         return GC_average
 
     ################# di_nucleotide #####################
     def di_nucleotide(self, primer):
-        Check = "False"
-        primers = self.degenerate_seq(primer)
-        for m in primers:
-            for n in di_nucleotides:
-                if re.search(n, m):
-                    Check = "True"
-                    break
-                else:
-                    pass
-            if Check == "True":
-                break
-        if Check == "True":
-            return True
-        else:
-            return False
+        # homopolymer run >= 4, dinucleotide repeat >= 4 or trinucleotide repeat >= 3 in any non-degenerate primer,
+        # see repeats.py
+        return has_repeat(primer)
 
     ##################################################
     ################### filter #######################
@@ -512,8 +823,15 @@ class NN_degenerate(object):
         else:
             return False
 
-    # Import multi-alignment results and return a dict ==> {ID：sequence}
-    def parse_seq(self, Input):
+    # Import multi-alignment results and return a column-major store of {ID：sequence}
+    def parse_seq(self, Input, ids=None):
+        # Input: alignment file, or the aligned sequences in memory (see alignment_sequences)
+        if not isinstance(Input, str):
+            ids, sequences = alignment_sequences(Input, ids)
+            sequences = [re.sub("[^ACGTRYMKSWHBVD]", "-", sequence.upper()) for sequence in sequences]
+            if not sequences:
+                raise DesignError("the alignment has no sequence !!!")
+            return AlignmentStore(ids, sequences)
         seq_dict = defaultdict(str)
         with open(Input, "r") as f:
             for i in f:
@@ -527,7 +845,9 @@ class NN_degenerate(object):
                         # carefully !, make sure that Ns have been replaced!
                         sequence = re.sub("[^ACGTRYMKSWHBVD]", "-", i.strip().upper())
                         seq_dict[acc_id] += sequence
-        return seq_dict, len(seq_dict)
+        if not seq_dict:
+            raise DesignError("{} has no sequence !!!".format(Input))
+        return AlignmentStore(seq_dict.keys(), list(seq_dict.values()))
 
 
     def current_end(self, primer, adaptor="", num=5, length=14):
@@ -540,26 +860,16 @@ class NN_degenerate(object):
         return end_seq
 
     def deltaG(self, sequence):
-        Delta_G_list = []
-        Na = 50
-        for seq in self.degenerate_seq(sequence):
-            Delta_G = 0
-            for n in range(len(seq) - 1):
-                base_i, base_j = base2bit[seq[n + 1]], base2bit[seq[n]]
-                Delta_G += freedom_of_H_37_table[base_i][base_j] * H_bonds_number[base_i][base_j] + penalty_of_H_37_table[base_i][base_j]
-            term5 = sequence[-2:]
-            if term5 == "TA":
-                Delta_G += adjust_initiation[seq[0]] + adjust_initiation[seq[-1]] + adjust_terminal_TA
-            else:
-                Delta_G += adjust_initiation[seq[0]] + adjust_initiation[seq[-1]]
-            # adjust by concentration of Na+
-            Delta_G -= (0.175 * math.log(Na / 1000, math.e) + 0.20) * len(seq)
-            if symmetry(seq):
-                Delta_G += symmetry_correction
-            Delta_G_list.append(Delta_G)
+        term5 = sequence[-2:]
+        Delta_G_list = degenerate_primer(sequence).values(expansion_deltaG, term5 == "TA")
         return round(max(Delta_G_list), 2)
 
     def dimer_check(self, primer):
+        if primer not in self.dimer_cache:
+            self.dimer_cache[primer] = self.primer_dimer(primer)
+        return self.dimer_cache[primer]
+
+    def primer_dimer(self, primer):
         current_end = self.current_end(primer)
         current_end_sort = sorted(current_end, key=lambda i: len(i), reverse=True)
         dimer = False
@@ -615,72 +925,62 @@ class NN_degenerate(object):
     def full_degenerate_primer(self, freq_matrix):
         # degenerate transformation in each position
         max_dege_primers = ''
-        for col in freq_matrix.columns.values:
-            tmp = freq_matrix[freq_matrix[col] > 0].index.values.tolist()
+        row_names = freq_matrix.index.values
+        for column in freq_matrix.values.T:
+            tmp = row_names[column > 0].tolist()
             max_dege_primers += trans_score_table[round(sum([score_table[x] for x in tmp]), 2)]
         return max_dege_primers
 
-    def state_matrix(self, primers_db):
-        pieces = []
-        for col in primers_db.columns.values:
-            tmp_series = primers_db[col].value_counts()  # (normalize=True)
-            tmp_series.name = col
-            pieces.append(tmp_series)
-        nodes = pd.concat(pieces, axis=1)
-        nodes.fillna(0, inplace=True)
-        nodes = nodes.sort_index(ascending=True)
-        nodes = nodes.astype(int)
-        row_names = nodes.index.values.tolist()
-        if "-" in row_names:
-            nodes.drop("-", inplace=True, axis=0)
-        return nodes
-
-    def di_matrix(self, primers):
-        primers_trans = []
-        for i in primers.keys():
-            slice = []
-            for j in range(len(i) - 1):
-                slice.append(i[j:j + 2])
-            primers_trans.extend(repeat(slice, primers[i]))
-        return pd.DataFrame(primers_trans)
+    def state_matrix(self, cover):
+        # rows: bases (A, C, G, T) found in the window, columns: positions. "-" is not counted.
+        codes, counts = variant_codes(cover)
+        freq = frequency_matrix(codes, counts)[:4]
+        present = freq.sum(axis=1) > 0
+        return pd.DataFrame(freq[present], index=bases[present], columns=range(codes.shape[1]))
 
     def trans_matrix(self, primers):
-        primers_di_db = self.di_matrix(primers)
-        pieces = []
-        for col in primers_di_db.columns.values:
-            tmp_list = []
-            for i in di_bases:
-                # row: A, T, C ,G; column: A, T, C, G
-                number = list(primers_di_db[col]).count(i)
-                tmp_list.append(number)
-            pieces.append(tmp_list)
-        a, b = primers_di_db.shape
-        trans = np.array(pieces).reshape(b, 4, 4)
-        return trans
+        # layer: NN position; row: A, C, G, T (5' base); column: A, C, G, T (3' base)
+        codes, counts = variant_codes(primers)
+        return transition_tensor(codes, counts)
 
     def get_optimal_primer_by_viterbi(self, nodes, trans):
-        nodes = np.array(nodes.T)
-        seq_len, num_labels = len(nodes), len(trans[0])
-        labels = np.arange(num_labels).reshape((1, -1))
-        scores = nodes[0].reshape((-1, 1))
-        primer_index = labels
-        for t in range(1, seq_len):
-            observe = nodes[t].reshape((1, -1))
-            current_trans = trans[t - 1]
-            M = scores + current_trans + observe
-            scores = np.max(M, axis=0).reshape((-1, 1))
-            idxs = np.argmax(M, axis=0)
-            primer_index = np.concatenate([primer_index[:, idxs], labels], 0)
-        best_primer_index = primer_index[:, scores.argmax()]
-        return best_primer_index
+        # single window, see viterbi_batch in nn_matrix.py
+        return viterbi_batch(np.array(nodes.T)[None], np.asarray(trans)[None])[0]
 
     def get_optimal_primer_by_MM(self, cover_for_MM):
-        sort_cover = sorted(cover_for_MM.items(), key=lambda x: x[1], reverse=True)
-        L_seq = list(sort_cover[0][0])
-        best_primer_index = [base2bit[x] for x in L_seq]
-        # Return the maximum of an array or maximum along an axis. axis=0 代表列 , axis=1 代表行
+        # most frequent sequence without gap (the first one in case of ties)
+        best_primer = max(cover_for_MM.items(), key=lambda x: x[1])[0]
+        best_primer_index = [base2bit[x] for x in best_primer]
         return best_primer_index
 
+    def decode_windows(self, windows):
+        # windows from prepare_window ==> [(NN_matrix, optimal_primer_index_NM, optimal_primer_index_MM, same), ...]
+        # Viterbi paths of all windows needing them in one batch (window x position x base tensors),
+        # then MM paths, compared with the Viterbi paths in one array operation.
+        # None for windows where the full degenerate primer is used.
+        decoded = [None] * len(windows)
+        # NN array is only needed if the full degenerate primer is not ok. It is built once per window.
+        batch = [idx for idx, window in enumerate(windows)
+                 if not self.pre_degenerate_primer_check(window["full_degenerate_primer"])]
+        if not batch:
+            return decoded
+        for idx in batch:
+            if windows[idx]["NN_matrix"] is None:
+                windows[idx]["NN_matrix"] = self.trans_matrix(windows[idx]["cover"])
+        nodes = np.stack([np.array(windows[idx]["freq_matrix"].T) for idx in batch])
+        trans = np.stack([windows[idx]["NN_matrix"] for idx in batch])
+        paths_NM = viterbi_batch(nodes, trans)
+        # -1: no sequence without gap, no MM path
+        paths_MM = np.full_like(paths_NM, -1)
+        for k, idx in enumerate(batch):
+            if len(windows[idx]["cover_for_MM"]) != 0:
+                paths_MM[k] = self.get_optimal_primer_by_MM(windows[idx]["cover_for_MM"])
+        same = (paths_NM == paths_MM).all(axis=1).tolist()
+        for k, idx in enumerate(batch):
+            optimal_primer_index_MM = paths_MM[k].tolist() if paths_MM[k, 0] >= 0 else None
+            decoded[idx] = (windows[idx]["NN_matrix"], paths_NM[k], optimal_primer_index_MM, same[k])
+        return decoded
+
     def entropy(self, cover, cover_number, gap_sequence, gap_sequence_number):
         # cBit: entropy of cover sequences
         # tBit: entropy of total sequences
@@ -696,28 +996,20 @@ class NN_degenerate(object):
         return round(-cBit, 2), round(-tBit, 2)
 
     # Sequence processing. Return a list contains sequence length, start and stop position of each sequence.
-    def seq_attribute(self, Input_dict):
-        start_dict = {}
-        stop_dict = {}
-        # pattern_start = re.compile('[A-Z]')
-        # pattern_stop = re.compile("-*$")
-        for acc_id in Input_dict.keys():
-            # start_dict[acc_id] = pattern_start.search(Input_dict[acc_id]).span()[0]
-            # stop_dict[acc_id] = pattern_stop.search(Input_dict[acc_id]).span()[0] - 1
-            t_length = len(Input_dict[acc_id])
-            start_dict[acc_id] = t_length - len(Input_dict[acc_id].lstrip("-"))
-            stop_dict[acc_id] = len(Input_dict[acc_id].rstrip("-"))
-            # start position should contain [coverage] sequences at least.
-        start = np.quantile(np.array(list(start_dict.values())).reshape(1, -1), self.coverage, interpolation="higher")
+    def seq_attribute(self, alignment):
+        # start: number of leading gaps; stop: length without trailing gaps.
+        start_list = alignment.seq_start()
+        stop_list = alignment.seq_stop()
+        # start position should contain [coverage] sequences at least.
+        start = np.quantile(start_list.reshape(1, -1), self.coverage, interpolation="higher")
         # for python 3.9.9
-        # start = np.quantile(np.array(list(start_dict.values())).reshape(1, -1), self.coverage, method="higher")
+        # start = np.quantile(start_list.reshape(1, -1), self.coverage, method="higher")
         # stop position should contain [coverage] sequences at least.
-        stop = np.quantile(np.array(list(stop_dict.values())).reshape(1, -1), self.coverage, interpolation="lower")
-        # stop = np.quantile(np.array(list(stop_dict.values())).reshape(1, -1), self.coverage, method="lower")
+        stop = np.quantile(stop_list.reshape(1, -1), self.coverage, interpolation="lower")
+        # stop = np.quantile(stop_list.reshape(1, -1), self.coverage, method="lower")
         if stop - start < int(self.product):
-            print("Error: max length of PCR product is shorter than the default min Product length with {} "
-                  "coverage! Non candidate primers !!!".format(self.coverage))
-            sys.exit(1)
+            raise DesignError("max length of PCR product is shorter than the default min Product length with {} "
+                              "coverage! Non candidate primers !!!".format(self.coverage))
         else:
             return [start, stop, stop-start]
 
@@ -731,115 +1023,131 @@ class NN_degenerate(object):
                 return self.raw_entropy_threshold * 0.9
 
 
-    def get_primers(self, sequence_dict, primer_start):  # , primer_info, non_cov_primer_out
-        # record sequence and acc id
-        non_gap_seq_id = defaultdict(list)
-        # record sequence (no gap) and number
-        cover = defaultdict(int)
-        cover_for_MM = defaultdict(int)
-        # record total coverage sequence number
-        cover_number = 0
-        # record sequence (> variation gap) and number
-        gap_sequence = defaultdict(int)
-        gap_seq_id = defaultdict(list)
+    def sequence_ids(self, sequences, members):
+        # acc IDs of each expanded sequence, in alignment order.
+        # sequences and members (row indexes) are the distinct windows from distinct_rows.
+        member_list = defaultdict(list)
+        for sequence, member in zip(sequences, members):
+            for i in self.degenerate_seq(sequence):
+                member_list[i].append(member)
+        seq_id = defaultdict(list)
+        for i, member in member_list.items():
+            index = member[0] if len(member) == 1 else np.sort(np.concatenate(member))
+            seq_id[i] = self.alignment.id_array[index].tolist()
+        return seq_id
+
+    def get_primers(self, primer_start):  # , primer_info, non_cov_primer_out
+        window = self.prepare_window(primer_start)
+        if window is None:
+            return None
+        return self.design_window(window, self.decode_windows([window])[0])
+
+    def gap_filter(self, positions):
+        # gap test of prepare_window for all windows at positions at once, from the rank index of the alignment:
+        # windows failing it are never sliced. True if the window passes.
+        gap_numbers = self.alignment.window_gap_numbers(positions, self.primer_length)
+        gap_sequence_numbers = (gap_numbers > self.variation).sum(axis=1).tolist()
+        passed = [round(gap_sequence_number / self.total_sequence_number, 2) < (1 - self.coverage)
+                  for gap_sequence_number in gap_sequence_numbers]
+        self.window_counts["gap"] += passed.count(False)
+        return passed
+
+    def prepare_window(self, primer_start, window_masks=None):
+        # gap, entropy and base composition filters of the window at primer_start.
+        # Return None if the window fails, else what the primer design needs (see design_window).
+        # "-" which in start or stop position of the window is replaced with nucleotides
+        if window_masks is None:
+            window_masks = self.alignment.window_masks(primer_start, self.primer_length)
+        # sequences with gap number > variation
+        gap_rows = (window_masks == 0).sum(axis=1) > self.variation
         # record total sequence (> variation gap) number
-        gap_sequence_number = 0
-        primers_db = []
-        for seq_id in sequence_dict.keys():
-            sequence = sequence_dict[seq_id][primer_start:primer_start + self.primer_length].upper()
-            # replace "-" which in start or stop position with nucleotides
-            if sequence == "-" * self.primer_length:
-                pass
-            else:
-                if sequence.startswith("-"):
-                    sequence_narrow = sequence.lstrip("-")
-                    append_base_length = len(sequence) - len(sequence_narrow)
-                    left_seq = sequence_dict[seq_id][0:primer_start].replace("-", "")
-                    if len(left_seq) >= append_base_length:
-                        sequence = left_seq[len(left_seq) - append_base_length:] + sequence_narrow
-                if sequence.endswith("-"):
-                    sequence_narrow = sequence.rstrip("-")
-                    append_base_length = len(sequence) - len(sequence_narrow)
-                    right_seq = sequence_dict[seq_id][primer_start + self.primer_length:].replace("-", "")
-                    if len(right_seq) >= append_base_length:
-                        sequence = sequence_narrow + right_seq[0:append_base_length]
-            if len(sequence) < self.primer_length:
-                append_base_length = self.primer_length - len(sequence)
-                left_seq = sequence_dict[seq_id][0:primer_start].replace("-", "")
-                if len(left_seq) >= append_base_length:
-                    sequence = left_seq[len(left_seq) - append_base_length:] + sequence
-            # gap number. number of gap > 2
-            if list(sequence).count("-") > self.variation:
-                gap_sequence[sequence] += 1
-                gap_sequence_number += 1
-                if round(gap_sequence_number / self.total_sequence_number, 2) >= (1 - self.coverage):
-                    break
-                else:
-                    # record acc ID of gap sequences
-                    expand_sequence = self.degenerate_seq(sequence)
-                    for i in expand_sequence:
-                        gap_seq_id[i].append(seq_id)
-            # # accepted gap, number of gap <= variation
-            else:
-                expand_sequence = self.degenerate_seq(sequence)
-                cover_number += 1
-                for i in expand_sequence:
-                    cover[i] += 1
-                    primers_db.append(list(i))
-                    # record acc ID of non gap sequences, which is potential mis-coverage
-                    non_gap_seq_id[i].append(seq_id)
-                    if re.search("-", i):
-                        pass
-                    else:
-                        cover_for_MM[i] += 1
+        gap_sequence_number = int(gap_rows.sum())
         # number of sequences with too many gaps greater than (1 - self.coverage)
         if round(gap_sequence_number / self.total_sequence_number, 2) >= (1 - self.coverage):
             # print("Gap fail")
-            self.resQ.put(None)
-        elif len(cover) < 1:
-            self.resQ.put(None)
+            self.window_counts["gap"] += 1
+            return None
+        # record total coverage sequence number
+        cover_number = self.total_sequence_number - gap_sequence_number
+        # identical windows are counted together; acc IDs are only collected for windows passing the filters.
+        cover_sequences, cover_counts, cover_members = distinct_rows(window_masks, np.nonzero(~gap_rows)[0])
+        gap_sequences, gap_counts, gap_members = distinct_rows(window_masks, np.nonzero(gap_rows)[0])
+        # record sequence (no gap) and number
+        cover = defaultdict(int)
+        cover_for_MM = defaultdict(int)
+        for sequence, count in zip(cover_sequences, cover_counts):
+            for i in self.degenerate_seq(sequence):
+                cover[i] += count
+                if "-" not in i:
+                    cover_for_MM[i] += count
+        # record sequence (> variation gap) and number
+        gap_sequence = dict(zip(gap_sequences, gap_counts))
+        if len(cover) < 1:
             # print("Cover fail")
+            self.window_counts["cover"] += 1
+            return None
+        # cBit: entropy of cover sequences
+        # tBit: entropy of total sequences
+        cBit, tBit = self.entropy(cover, cover_number, gap_sequence, gap_sequence_number)
+        if tBit > self.entropy_threshold:
+            # print("Entropy fail")
+            # This window is not a conserved region, and not proper to design primers
+            self.window_counts["entropy"] += 1
+            return None
+        # frequency matrix
+        freq_matrix = self.state_matrix(cover)
+        colSum = np.sum(freq_matrix, axis=0)
+        a, b = freq_matrix.shape
+        # a < 4 means base composition of this region is less than 4 (GC bias).
+        # It's not a proper region for primer design.
+        if a < 4:
+            self.window_counts["base_composition"] += 1
+            return None
+        elif (colSum == 0).any():
+            # print(colSum)  # if 0 in array; pass
+            self.window_counts["empty_column"] += 1
+            return None
+        # NN_matrix and acc IDs are filled on first use (decode_windows, design_window)
+        return {"primer_start": primer_start, "freq_matrix": freq_matrix, "cover": cover,
+                "cover_for_MM": cover_for_MM, "cover_number": cover_number, "cBit": cBit, "tBit": tBit,
+                "cover_sequences": cover_sequences, "cover_members": cover_members,
+                "gap_sequences": gap_sequences, "gap_members": gap_members,
+                "full_degenerate_primer": self.full_degenerate_primer(freq_matrix), "NN_matrix": None,
+                "non_gap_seq_id": None, "gap_seq_id": None}
+
+    def design_window(self, window, decoded=None):
+        # degenerate primer of a window from prepare_window. decoded: its entry of decode_windows.
+        primer_start = window["primer_start"]
+        # record acc id (once per window)
+        if window["non_gap_seq_id"] is None:
+            window["non_gap_seq_id"] = self.sequence_ids(window["cover_sequences"], window["cover_members"])
+            window["gap_seq_id"] = self.sequence_ids(window["gap_sequences"], window["gap_members"])
+        non_gap_seq_id = window["non_gap_seq_id"]
+        gap_seq_id_info = [primer_start, window["gap_seq_id"]]
+        # the design adds zero counts to cover, the window may be designed again with other parameters
+        cover = defaultdict(int, window["cover"])
+        mismatch_coverage, non_cov_primer_info = \
+            self.degenerate_by_NN_algorithm(primer_start, window["freq_matrix"], cover, non_gap_seq_id,
+                                            window["cover_for_MM"], window["cover_number"], window["cBit"],
+                                            window["tBit"], decoded)
+        # F, R = mismatch_coverage[1][6], mismatch_coverage[1][7]
+        sequence = mismatch_coverage[1][2]
+        if self.dimer_check(sequence):
+            # print("Dimer fail")
+            self.window_counts["dimer"] += 1
+            return None
         else:
-            # cBit: entropy of cover sequences
-            # tBit: entropy of total sequences
-            cBit, tBit = self.entropy(cover, cover_number, gap_sequence, gap_sequence_number)
-            if tBit > self.entropy_threshold:
-                # print("Entropy fail")
-                # This window is not a conserved region, and not proper to design primers
-                self.resQ.put(None)
-            else:
-                primers_db = pd.DataFrame(primers_db)
-                # frequency matrix
-                freq_matrix = self.state_matrix(primers_db)
-                colSum = np.sum(freq_matrix, axis=0)
-                a, b = freq_matrix.shape
-                # a < 4 means base composition of this region is less than 4 (GC bias).
-                # It's not a proper region for primer design.
-                if a < 4:
-                    self.resQ.put(None)
-                elif (colSum == 0).any():
-                    # print(colSum)  # if 0 in array; pass
-                    self.resQ.put(None)
-                else:
-                    gap_seq_id_info = [primer_start, gap_seq_id]
-                    mismatch_coverage, non_cov_primer_info = \
-                        self.degenerate_by_NN_algorithm(primer_start, freq_matrix, cover, non_gap_seq_id,
-                                                        cover_for_MM, cover_number, cBit, tBit)
-                    # self.resQ.put([mismatch_coverage, non_cov_primer_info, gap_seq_id_info])
-                    # F, R = mismatch_coverage[1][6], mismatch_coverage[1][7]
-                    sequence = mismatch_coverage[1][2]
-                    if self.dimer_check(sequence):
-                        # print("Dimer fail")
-                        self.resQ.put(None)
-                    else:
-                        self.resQ.put([mismatch_coverage, non_cov_primer_info, gap_seq_id_info])
-                    # if F < cover_number * 0.5 or R < cover_number * 0.5:
-                    #     self.resQ.put(None)
-                    # else:
-                    #     self.resQ.put([mismatch_coverage, non_cov_primer_info, gap_seq_id_info])
+            self.window_counts["candidate"] += 1
+            return [mismatch_coverage, non_cov_primer_info, gap_seq_id_info]
+        # if F < cover_number * 0.5 or R < cover_number * 0.5:
+        #     return None
+        # else:
+        #     return [mismatch_coverage, non_cov_primer_info, gap_seq_id_info]
 
     def degenerate_by_NN_algorithm(self, primer_start, freq_matrix, cover, non_gap_seq_id, cover_for_MM,
-                                   cover_number, cBit, tBit):
+                                   cover_number, cBit, tBit, decoded=None):
+        # decoded: (NN_matrix, optimal_primer_index_NM, optimal_primer_index_MM, same) of decode_windows,
+        # computed here if not given.
         # full degenerate primer
         full_degenerate_primer = self.full_degenerate_primer(freq_matrix)
         # unique covered primers, which is used to calculate coverage and
@@ -848,6 +1156,7 @@ class NN_degenerate(object):
         # if full_degenerate_primer is ok, then return full_degenerate_primer
         # mismatch_coverage, non_cov_primer_info = {}, {}
         F_non_cover, R_non_cover = {}, {}
+        F_role, R_role = self.window_roles(primer_start)
         ######################################################################################################
         ############ need prone. not all primers is proper for primer-F or primer-R ##########################
         ## if primer located in the start region, you do not need to calculate coverage for primer-R #########
@@ -858,7 +1167,7 @@ class NN_degenerate(object):
             optimal_primer_current = full_degenerate_primer
             F_mis_cover_cover, F_non_cover_in_cover, R_mis_cover_cover, R_non_cover_in_cover = \
                 self.mis_primer_check(cover_primer_set, full_degenerate_primer, cover,
-                                      non_gap_seq_id)
+                                      non_gap_seq_id, F_role, R_role)
             F_non_cover.update(F_non_cover_in_cover)
             R_non_cover.update(R_non_cover_in_cover)
             covered_primer_set = cover_primer_set.intersection(set(self.degenerate_seq(full_degenerate_primer)))
@@ -868,14 +1177,16 @@ class NN_degenerate(object):
             F_mis_cover = optimal_coverage_init + F_mis_cover_cover
             R_mis_cover = optimal_coverage_init + R_mis_cover_cover
         else:
-            NN_matrix = self.trans_matrix(cover)
-            if len(cover_for_MM) != 0:
+            if decoded is None:
+                NN_matrix = self.trans_matrix(cover)
                 optimal_primer_index_NM = self.get_optimal_primer_by_viterbi(freq_matrix, NN_matrix)
-                optimal_primer_index_MM = self.get_optimal_primer_by_MM(cover_for_MM)
-                # print(optimal_primer_index_NM.tolist()) # array
-                # print(optimal_primer_index_MM) # list
-                #  if (optimal_primer_index_NM == optimal_primer_index_MM).all():
-                if optimal_primer_index_NM.tolist() == optimal_primer_index_MM:
+                optimal_primer_index_MM = self.get_optimal_primer_by_MM(cover_for_MM) \
+                    if len(cover_for_MM) != 0 else None
+                same = optimal_primer_index_NM.tolist() == optimal_primer_index_MM
+            else:
+                NN_matrix, optimal_primer_index_NM, optimal_primer_index_MM, same = decoded
+            if optimal_primer_index_MM is not None:
+                if same:
                     optimal_primer_index = optimal_primer_index_NM
                     row_names = np.array(freq_matrix.index.values).reshape(1, -1)
                     # build a list to store init base information in each position.
@@ -885,7 +1196,7 @@ class NN_degenerate(object):
                     optimal_primer_current, F_mis_cover, R_mis_cover, information, F_non_cover, R_non_cover = \
                         self.coverage_stast(cover, optimal_primer_index, NN_matrix, optimal_coverage_init, cover_number,
                                             optimal_primer_list, cover_primer_set, non_gap_seq_id, F_non_cover,
-                                            R_non_cover)
+                                            R_non_cover, F_role, R_role)
                 else:
                     F_non_cover_NM, R_non_cover_NM, F_non_cover_MM, R_non_cover_MM = {}, {}, {}, {}
                     row_names = np.array(freq_matrix.index.values).reshape(1, -1)
@@ -898,7 +1209,7 @@ class NN_degenerate(object):
                     R_non_cover_NM = self.coverage_stast(cover, optimal_primer_index_NM, NN_matrix_NM,
                                                          optimal_coverage_init_NM, cover_number, optimal_primer_list_NM,
                                                          cover_primer_set, non_gap_seq_id, F_non_cover_NM,
-                                                         R_non_cover_NM)
+                                                         R_non_cover_NM, F_role, R_role)
                     optimal_primer_list_MM = row_names[:, optimal_primer_index_MM][0].tolist()
                     # initiation coverage (optimal primer, used as base coverage)
                     optimal_coverage_init_MM = cover["".join(optimal_primer_list_MM)]
@@ -907,7 +1218,7 @@ class NN_degenerate(object):
                     R_non_cover_MM = self.coverage_stast(cover, optimal_primer_index_MM, NN_matrix_MM,
                                                          optimal_coverage_init_MM, cover_number,
                                                          optimal_primer_list_MM, cover_primer_set, non_gap_seq_id,
-                                                         F_non_cover_MM, R_non_cover_MM)
+                                                         F_non_cover_MM, R_non_cover_MM, F_role, R_role)
                     if (F_mis_cover_NM + R_mis_cover_NM) > (F_mis_cover_MM + R_mis_cover_MM):
                         optimal_primer_current, F_mis_cover, R_mis_cover, information, optimal_coverage_init, \
                         F_non_cover, R_non_cover, NN_matrix = optimal_primer_current_NM, F_mis_cover_NM, \
@@ -921,7 +1232,6 @@ class NN_degenerate(object):
                     # print(F_mis_cover)
                     # print(R_mis_cover)
             else:
-                optimal_primer_index_NM = self.get_optimal_primer_by_viterbi(freq_matrix, NN_matrix)
                 F_non_cover_NM, R_non_cover_NM, F_non_cover_MM, R_non_cover_MM = {}, {}, {}, {}
                 row_names = np.array(freq_matrix.index.values).reshape(1, -1)
                 # build a list to store init base information in each position.
@@ -932,15 +1242,17 @@ class NN_degenerate(object):
                 optimal_primer_current_NM, F_mis_cover_NM, R_mis_cover_NM, information_NM, F_non_cover_NM, \
                 R_non_cover_NM = self.coverage_stast(cover, optimal_primer_index_NM, NN_matrix_NM,
                                                      optimal_coverage_init_NM, cover_number, optimal_primer_list_NM,
-                                                     cover_primer_set, non_gap_seq_id, F_non_cover_NM, R_non_cover_NM)
+                                                     cover_primer_set, non_gap_seq_id, F_non_cover_NM, R_non_cover_NM,
+                                                     F_role, R_role)
                 optimal_primer_current, F_mis_cover, R_mis_cover, information, optimal_coverage_init, F_non_cover, \
                 R_non_cover, NN_matrix = optimal_primer_current_NM, F_mis_cover_NM, R_mis_cover_NM, information_NM, \
                                          optimal_coverage_init_NM, F_non_cover_NM, R_non_cover_NM, NN_matrix_NM
         nonsense_primer_number = len(set(self.degenerate_seq(optimal_primer_current)) - set(cover.keys()))
         primer_degenerate_number = dege_number(optimal_primer_current)
-        Tm, coverage = [], []
+        # Tm of all expansions in one call, see thermo.py.
+        Tm = default_thermodynamics.Tm(self.degenerate_seq(optimal_primer_current))
+        coverage = []
         for seq in self.degenerate_seq(optimal_primer_current):
-            Tm.append(Calc_Tm_v2(seq))
             coverage.append(cover[seq])
         Tm_average = round(mean(Tm), 2)
         perfect_coverage = sum(coverage)
@@ -948,11 +1260,13 @@ class NN_degenerate(object):
         out_mismatch_coverage = [primer_start, [cBit, tBit, optimal_primer_current, primer_degenerate_number,
                                                 nonsense_primer_number, perfect_coverage, F_mis_cover,
                                                 R_mis_cover, Tm_average, information]]
-        non_cov_primer_info = [primer_start, [F_non_cover, R_non_cover]]
+        # None: the window is never used in this role (role-aware mode), see seq_id_store.py
+        non_cov_primer_info = [primer_start, [F_non_cover if F_role else None, R_non_cover if R_role else None]]
         return out_mismatch_coverage, non_cov_primer_info
 
     def coverage_stast(self, cover, optimal_primer_index, NN_matrix, optimal_coverage_init, cover_number,
-                       optimal_primer_list, cover_primer_set, non_gap_seq_id, F_non_cover, R_non_cover):
+                       optimal_primer_list, cover_primer_set, non_gap_seq_id, F_non_cover, R_non_cover,
+                       F_role=True, R_role=True):
         # if the coverage is too low, is it necessary to refine?
         # mis-coverage as threshold? if mis-coverage reached to 100% but degeneracy is still very low,
         optimal_NN_index = []
@@ -964,12 +1278,14 @@ class NN_degenerate(object):
             # Is the minimum number in NN coverage = optimal_primer_coverage ? No!
             optimal_NN_coverage.append(
                 NN_matrix[idx, optimal_primer_index[idx], optimal_primer_index[idx + 1]])
+        # coverage gained by each refine is counted over the observed sequences, see coverage_index.py
+        cover_index = CoverageIndex(cover)
         while optimal_coverage_init < cover_number:
             # optimal_primer_update, coverage_update, NN_coverage_update,
             # NN array_update, degeneracy_update, degenerate_update
             optimal_primer_list, optimal_coverage_init, optimal_NN_coverage_update, \
             NN_matrix, degeneracy, number_of_degenerate = \
-                self.refine_by_NN_array(optimal_primer_list, optimal_coverage_init, cover, optimal_NN_index,
+                self.refine_by_NN_array(optimal_primer_list, optimal_coverage_init, cover_index, optimal_NN_index,
                                         optimal_NN_coverage, NN_matrix)
             if optimal_NN_coverage_update == optimal_NN_coverage:
                 # NN_coverage not change means bugs or there are continuous positions mismatch
@@ -982,7 +1298,7 @@ class NN_degenerate(object):
         information = self.primer_pre_filter(optimal_primer_current)
         F_mis_cover_cover, F_non_cover_in_cover, R_mis_cover_cover, R_non_cover_in_cover = \
             self.mis_primer_check(cover_primer_set, optimal_primer_current, cover,
-                                  non_gap_seq_id)
+                                  non_gap_seq_id, F_role, R_role)
         F_non_cover.update(F_non_cover_in_cover)
         R_non_cover.update(R_non_cover_in_cover)
         F_mis_cover = optimal_coverage_init + F_mis_cover_cover
@@ -992,7 +1308,7 @@ class NN_degenerate(object):
         # print(R_mis_cover_cover)
         return optimal_primer_current, F_mis_cover, R_mis_cover, information, F_non_cover, R_non_cover
 
-    def refine_by_NN_array(self, optimal_primer_list, optimal_coverage_init, cover,
+    def refine_by_NN_array(self, optimal_primer_list, optimal_coverage_init, cover_index,
                            optimal_NN_index, optimal_NN_coverage, NN_array):
         # use minimum index of optimal_NN_coverage as the position to refine
         refine_index = np.where(optimal_NN_coverage == np.min(optimal_NN_coverage))[0]  # np.where[0] is a list
@@ -1022,11 +1338,8 @@ class NN_degenerate(object):
                         # position 0.
                         if idx != row:
                             init_score += score_table[bases[idx]]
-                            new_primer[i] = bases[idx]
-                            # Calculate coverage after refine
-                            for new_primer_update in self.degenerate_seq("".join(new_primer)):
-                                if new_primer_update in cover.keys():
-                                    coverage_renew += cover["".join(new_primer_update)]
+                            # sequences gained by adding bases[idx] to the position, see coverage_index.py
+                            coverage_renew += cover_index.widen(new_primer, i, bases[idx])
                             new_primer[i] = trans_score_table[round(init_score, 2)]
                             # reset NN_array. row names will update after reset.
                             NN_array_tmp[i, row, :] += NN_array_tmp[i, idx, :]
@@ -1055,11 +1368,8 @@ class NN_degenerate(object):
                             # position 1.
                             if idx != column:
                                 init_score += score_table[bases[idx]]
-                                # Calculate coverage after refine
-                                new_primer[i + 1] = bases[idx]
-                                for new_primer_update in self.degenerate_seq("".join(new_primer)):
-                                    if new_primer_update in cover.keys():
-                                        coverage_renew += cover["".join(new_primer_update)]
+                                # sequences gained by adding bases[idx] to the position, see coverage_index.py
+                                coverage_renew += cover_index.widen(new_primer, i + 1, bases[idx])
                                 new_primer[i + 1] = trans_score_table[round(init_score, 2)]
                                 # reset NN_array. column + (column idx) of layer i and row + (row idx) of layer i+1.
                                 NN_array_tmp[i, :, column] += NN_array_tmp[i, :, idx]
@@ -1088,11 +1398,8 @@ class NN_degenerate(object):
                         # position -1.
                         if idx != column:
                             init_score += score_table[bases[idx]]
-                            # Calculate coverage after refine
-                            new_primer[i + 1] = bases[idx]
-                            for new_primer_update in self.degenerate_seq("".join(new_primer)):
-                                if new_primer_update in cover.keys():
-                                    coverage_renew += cover["".join(new_primer_update)]
+                            # sequences gained by adding bases[idx] to the position, see coverage_index.py
+                            coverage_renew += cover_index.widen(new_primer, i + 1, bases[idx])
                             new_primer[i + 1] = trans_score_table[round(init_score, 2)]
                             # reset NN_array. column names will update after reset.
                             NN_array_tmp[i, :, column] += NN_array_tmp[i, :, idx]
@@ -1125,11 +1432,8 @@ class NN_degenerate(object):
                             # or if idx != next_row
                             # init trans score update
                             init_score += score_table[bases[idx]]
-                            # Calculate coverage after refine
-                            new_primer[i + 1] = bases[idx]
-                            for new_primer_update in self.degenerate_seq("".join(new_primer)):
-                                if new_primer_update in cover.keys():
-                                    coverage_renew += cover["".join(new_primer_update)]
+                            # sequences gained by adding bases[idx] to the position, see coverage_index.py
+                            coverage_renew += cover_index.widen(new_primer, i + 1, bases[idx])
                             new_primer[i + 1] = trans_score_table[round(init_score, 2)]
                             # reset NN_array. column + (column idx) of layer i and row + (row idx) of layer i+1.
                             NN_array_tmp[i, :, column] += NN_array_tmp[i, :, idx]
@@ -1173,89 +1477,372 @@ class NN_degenerate(object):
                 Y_strict_R.append(-y_index + 1)
         return Y_strict, Y_strict_R
 
-    def mis_primer_check(self, all_primers, optimal_primer, cover, non_gap_seq_id):
-        # uncoverage sequence in cover dict
+    def window_roles(self, primer_start):
+        # can the window at primer_start be primer-F / primer-R of a PCR product >= self.product?
+        # Distance as in get_multiPrime: R position - F position + 1. Always True if not role-aware.
+        if not self.role_aware:
+            return True, True
+        last_window = self.stop_position - self.primer_length - 1
+        F_role = last_window - primer_start + 1 >= int(self.product)
+        R_role = primer_start - self.start_position + 1 >= int(self.product)
+        return bool(F_role), bool(R_role)
+
+    def mis_primer_check(self, all_primers, optimal_primer, cover, non_gap_seq_id, F_role=True, R_role=True):
+        # uncoverage sequence in cover dict. Mis-coverage is counted for both roles, acc IDs are only
+        # recorded for the roles of the window (F_role, R_role).
         optimal_primer_set = set(self.degenerate_seq(optimal_primer))
-        uncover_primer_set = all_primers - optimal_primer_set
+        uncover_primer_list = list(all_primers - optimal_primer_set)
         F_non_cover, R_non_cover = {}, {}
         F_mis_cover, R_mis_cover = 0, 0
-        for uncover_primer in uncover_primer_set:
-            Y_dist = Y_distance(optimal_primer, uncover_primer)
-            if len(Y_dist) > self.variation:
+        # mismatch number and 3'-end check of all uncovered primers at once, see mismatch.py.
+        mismatch_number, F_strict, R_strict = self.mismatch_kernel.check(optimal_primer, uncover_primer_list)
+        for uncover_primer, mismatch, F_mismatch, R_mismatch in zip(uncover_primer_list, mismatch_number.tolist(),
+                                                                   F_strict.tolist(), R_strict.tolist()):
+            if mismatch > self.variation:
                 # record sequence and acc_ID which will never mis-coverage. too many mismatch!
-                F_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
-                R_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
-            # if len(Y_dist) <= self.variation:
-            else:
-                if len(set(Y_dist).intersection(self.Y_strict)) > 0:
+                if F_role:
                     F_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
+                if R_role:
+                    R_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
+            else:
+                if F_mismatch:
+                    if F_role:
+                        F_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
                 else:
                     F_mis_cover += cover[uncover_primer]
-                if len(set(Y_dist).intersection(self.Y_strict_R)) > 0:
-                    R_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
+                if R_mismatch:
+                    if R_role:
+                        R_non_cover[uncover_primer] = non_gap_seq_id[uncover_primer]
                 else:
                     R_mis_cover += cover[uncover_primer]
-        # print(F_mis_cover)
-        # print(R_mis_cover)
         return F_mis_cover, F_non_cover, R_mis_cover, R_non_cover
 
     ################# get_primers #####################
+    def checkpoint_path(self):
+        # [outfile].checkpoint/[hash of the alignment and of the parameters, except primer length]
+        key = hashlib.sha256()
+        if isinstance(self.seq_file, str):
+            with open(self.seq_file, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    key.update(block)
+        else:
+            key.update("\n".join(self.alignment.ids).encode("utf-8"))
+            key.update(self.alignment.columns.tobytes())
+        parameters = [self.coverage, self.number_of_dege_bases, self.score_of_dege_bases, self.product, self.position,
+                      self.variation, self.raw_entropy_threshold, self.distance, self.GC, self.role_aware]
+        key.update(json.dumps(parameters).encode("utf-8"))
+        return os.path.join(self.outfile + ".checkpoint", key.hexdigest()[:16])
+
+    def checkpoint_file(self, task):
+        # file of a (primer length, (start, stop)) range of windows, None without checkpoint
+        if self.checkpoint_dir is None:
+            return None
+        primer_length, (start, stop) = task
+        return os.path.join(self.checkpoint_dir, "L{}_{}_{}.pkl".format(primer_length, start, stop))
+
+    def remove_checkpoint(self):
+        # all outputs are written
+        if self.checkpoint_dir is not None and os.path.isdir(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
+            if not os.listdir(os.path.dirname(self.checkpoint_dir)):
+                os.rmdir(os.path.dirname(self.checkpoint_dir))
+
+    def window_tasks(self):
+        # (primer length, (start, stop)) ranges of all windows of this primer length
+        return [(self.primer_length, chunk) for chunk in
+                window_chunks(self.start_position, self.stop_position - self.primer_length)]
+
+    def scan_windows(self, nn_apps=None):
+        # yield (primer length, result of each window (None if rejected)) in task order, i.e. by length and position.
+        # All primer lengths of nn_apps (default: this one) are scanned by one process pool.
+        if nn_apps is None:
+            nn_apps = [self]
+        tasks = [task for nn_app in nn_apps for task in nn_app.window_tasks()]
+        if self.checkpoint_dir is not None:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # filter outcomes are counted by the design of each length
+        by_length = {nn_app.primer_length: nn_app for nn_app in nn_apps}
+        if self.nproc <= 1 or len(tasks) <= 1:
+            init_window_worker(nn_apps)
+            for task in tasks:
+                results, counts = scan_window_chunk(task)
+                by_length[task[0]].filter_counts.update(counts)
+                for res in results:
+                    yield task[0], res
+        else:
+            with ProcessPoolExecutor(self.nproc, initializer=init_window_worker, initargs=(nn_apps,)) as p:
+                # chunk results in submission order, as soon as each one and all earlier ones are finished.
+                chunk_results = ordered_map(p, profiled(scan_window_chunk), tasks, 2 * self.nproc)
+                for task, (results, counts) in zip(tasks, profile_results(chunk_results)):
+                    by_length[task[0]].filter_counts.update(counts)
+                    for res in results:
+                        yield task[0], res
+
+    def write_results(self, results):
+        # results: window results of this primer length in position order ==> [outfile], [outfile].seq_id_bin
+        # (and JSON), see ResultWriter.
+        writer = ResultWriter(self)
+        for res in results:
+            writer.add(res)
+        writer.close()
+
+    def design(self):
+        # in-process design: DesignResult, no file is written
+        collector = ResultCollector(self)
+        for primer_length, res in self.scan_windows():
+            collector.add(res)
+        return collector.close()
+
     def run(self):
-        p = ProcessPoolExecutor(self.nproc)  #
-        sequence_dict = self.seq_dict
-        start_primer = self.start_position
-        stop_primer = self.stop_position
-        # primer_info = Manager().list()
-        # non_cov_primer_out = Manager().list()
-        for position in range(start_primer, stop_primer - self.primer_length):
-            # print(position)
-            p.submit(self.get_primers(sequence_dict, position))  # , primer_info, non_cov_primer_out
-            # This will submit all tasks to one place without blocking, and then each
-            # thread in the thread pool will fetch tasks.
-        n = 0
-        candidate_list, non_cov_primer_out, gap_seq_id_out = [], [], []
+        self.write_results(res for primer_length, res in self.scan_windows())
+        self.remove_checkpoint()
+        self.report_filters()
+
+    def run_sweep(self, grid):
+        # parameter sweep: grid is a list of {attribute: value}, one design per grid point. The windows of the
+        # union of all start / stop regions are scanned once, see sweep_window_chunk.
+        if self.checkpoint_dir is not None:
+            raise DesignError("Checkpoints are not available for parameter sweeps.")
+        nn_apps = [self.with_parameters("{}.sweep_{}".format(self.outfile, k), **parameters)
+                   for k, parameters in enumerate(grid)]
+        names = ["number_of_dege_bases", "score_of_dege_bases", "variation", "position", "coverage"]
+        with open(self.outfile + ".sweep", "w") as fo:
+            fo.write("\t".join(["Grid_point", "Output", "-n", "-d", "-v", "-c", "-f"]) + "\n")
+            for k, nn_app in enumerate(nn_apps):
+                fo.write("\t".join(map(str, [k, nn_app.outfile] + [getattr(nn_app, name) for name in names])) + "\n")
+        start = min([nn_app.start_position for nn_app in nn_apps])
+        stop = max([nn_app.stop_position for nn_app in nn_apps]) - self.primer_length
+        chunks = window_chunks(start, stop)
+        writers = [ResultWriter(nn_app) for nn_app in nn_apps]
+        if self.nproc <= 1 or len(chunks) <= 1:
+            init_sweep_worker(nn_apps)
+            chunk_results = map(sweep_window_chunk, chunks)
+            for results in chunk_results:
+                self.write_sweep_chunk(nn_apps, writers, results)
+        else:
+            with ProcessPoolExecutor(self.nproc, initializer=init_sweep_worker, initargs=(nn_apps,)) as p:
+                chunk_results = ordered_map(p, profiled(sweep_window_chunk), chunks, 2 * self.nproc)
+                for results in profile_results(chunk_results):
+                    self.write_sweep_chunk(nn_apps, writers, results)
+        for writer in writers:
+            writer.close()
+        for nn_app in nn_apps:
+            nn_app.report_filters()
+
+    @staticmethod
+    def write_sweep_chunk(nn_apps, writers, results):
+        for nn_app, writer, (res, counts) in zip(nn_apps, writers, results):
+            nn_app.filter_counts.update(counts)
+            for r in res:
+                writer.add(r)
+
+    def report_filters(self):
+        # number of windows eliminated by each filter
+        outcomes = ["gap", "cover", "entropy", "base_composition", "empty_column", "dimer"]
+        counts = self.filter_counts
+        if STAGE_PROFILE is not None:
+            STAGE_PROFILE.rejections[self.outfile] = {outcome: counts[outcome] for outcome in outcomes + ["candidate"]}
+        print("INFO {} {}: {} windows, rejected by {}; {} candidates".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time())), self.outfile,
+            sum(counts.values()), ", ".join(["{} {}".format(outcome, counts[outcome]) for outcome in outcomes]),
+            counts["candidate"]))
+
+    def run_lengths(self, primer_lengths):
+        # multi-length design: the alignment is parsed once and the windows of all lengths are scanned by one pool.
+        # [outfile].[length] (+ .seq_id_bin) per length, [outfile]: merged table with a Length column.
+        nn_apps = {primer_length: self.with_length(primer_length, "{}.{}".format(self.outfile, primer_length))
+                   for primer_length in primer_lengths}
+        # results come length by length
+        for primer_length, results in groupby(self.scan_windows(list(nn_apps.values())), key=lambda x: x[0]):
+            nn_apps[primer_length].write_results(res for _, res in results)
+        for nn_app in nn_apps.values():
+            if not os.path.exists(nn_app.outfile):
+                # no window of this length
+                nn_app.write_results([])
+        self.merge_lengths(list(nn_apps.values()))
+        self.remove_checkpoint()
+        for nn_app in nn_apps.values():
+            nn_app.report_filters()
+
+    def merge_lengths(self, nn_apps):
+        # merge the tables of each length by position (then length), reading them line by line.
+        def rows(nn_app):
+            with open(nn_app.outfile) as f:
+                next(f)
+                for line in f:
+                    position, candidate = line.rstrip("\n").split("\t", 1)
+                    yield int(position), nn_app.primer_length, candidate
         with open(self.outfile, "w") as fo:
-            headers = ["Position", "Entropy of cover (bit)", "Entropy of total (bit)", "Optimal_primer", "primer_degenerate_number",
-                       "nonsense_primer_number", "Optimal_coverage", "Mis-F-coverage", "Mis-R-coverage", "Tm",
-                       "Information"]
+            headers = ["Position", "Length", "Entropy of cover (bit)", "Entropy of total (bit)", "Optimal_primer",
+                       "primer_degenerate_number", "nonsense_primer_number", "Optimal_coverage", "Mis-F-coverage",
+                       "Mis-R-coverage", "Tm", "Information"]
             fo.write("\t".join(map(str, headers)) + "\n")
-            while n < stop_primer - start_primer - self.primer_length:
-                res = self.resQ.get()
-                # The get method can read and delete an element from the queue. Similarly, the get method has two
-                # optional parameters: blocked and timeout. If blocked is true (the default value) and timeout is
-                # positive, no element is retrieved during the waiting time, and a Queue is thrown Empty exception.
-                # If blocked is false, there are two cases. If a value of Queue is available, return the value
-                # immediately. Otherwise, if the queue is empty, throw a Queue.Empty exception immediately.
-                if res is None:
-                    n += 1
-                    continue
-                candidate_list.append(res[0])
-                non_cov_primer_out.append(res[1])
-                gap_seq_id_out.append(res[2])
-                n += 1
-            sorted_candidate_dict = dict(sorted(dict(candidate_list).items(), key=lambda x: x[0], reverse=False))
-            for position in sorted_candidate_dict.keys():
-                fo.write(str(position) + "\t" + "\t".join(map(str, sorted_candidate_dict[position])) + "\n")
-            fo.close()
-            with open(self.outfile + '.non_coverage_seq_id_json', "w") as fj:
-                json.dump(dict(non_cov_primer_out), fj, indent=4)
-            fj.close()
-            with open(self.outfile + '.gap_seq_id_json', "w") as fg:
-                json.dump(dict(gap_seq_id_out), fg, indent=4)
-            fg.close()
-            # get results before shutdown. Synchronous call mode: call, wait for the return value, decouple,
-            # but slow.
-        p.shutdown()
+            for position, primer_length, candidate in heapq.merge(*[rows(nn_app) for nn_app in nn_apps]):
+                fo.write("{}\t{}\t{}\n".format(position, primer_length, candidate))
+
+
+BATCH_SUFFIXES = (".msa", ".tmsa")
+
+
+def batch_files(inputs):
+    # -i (directory or comma-separated alignment files) and the positional arguments ==> alignment files.
+    # Directories contribute their *.msa / *.tmsa files.
+    files = []
+    for item in inputs:
+        for path in item.split(","):
+            if not path:
+                continue
+            if os.path.isdir(path):
+                files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                    if name.endswith(BATCH_SUFFIXES)))
+            else:
+                files.append(path)
+    return files
+
+
+def batch_outfile(seq_file, outdir):
+    # [outdir]/[name].top.primer.out for alignment [name].[ext], as the multiPrime rule of the workflow.
+    name = os.path.splitext(os.path.basename(seq_file))[0]
+    return os.path.join(outdir, name + ".top.primer.out")
+
+
+def run_batch(seq_files, outdir, nproc, **parameters):
+    # Designs of many alignments (clusters) with the same parameters, one process pool for all of them: the windows
+    # of all clusters are scanned by the pool, largest clusters (sequences x windows) first, and each cluster is
+    # written as its results arrive ([outdir]/[name].top.primer.out + .seq_id_bin). Alignments which failed are
+    # listed in [outdir]/failed.txt (name, alignment, error; empty if none), so that the workflow can tell a failed
+    # cluster from a designed one. ==> alignments which failed.
+    os.makedirs(outdir, exist_ok=True)
+    nn_apps, failed = [], []
+    with open(os.path.join(outdir, "failed.txt"), "w") as fo:
+        for seq_file in seq_files:
+            try:
+                nn_apps.append(NN_degenerate(seq_file, nproc=nproc, outfile=batch_outfile(seq_file, outdir),
+                                             **parameters))
+            except (DesignError, OSError) as e:
+                print("Error: {}: {}".format(seq_file, e))
+                failed.append(seq_file)
+                name = os.path.splitext(os.path.basename(seq_file))[0]
+                fo.write("{}\t{}\t{}\n".format(name, seq_file, e))
+    nn_apps.sort(key=lambda nn_app: nn_app.total_sequence_number * (nn_app.stop_position - nn_app.start_position),
+                 reverse=True)
+    tasks = [(k, task) for k, nn_app in enumerate(nn_apps) for task in nn_app.window_tasks()]
+    for nn_app in nn_apps:
+        if nn_app.checkpoint_dir is not None:
+            os.makedirs(nn_app.checkpoint_dir, exist_ok=True)
+    if nproc <= 1 or len(tasks) <= 1:
+        init_batch_worker(nn_apps)
+        chunk_results = map(batch_window_chunk, tasks)
+        write_batch(nn_apps, tasks, chunk_results)
+    else:
+        with ProcessPoolExecutor(nproc, initializer=init_batch_worker, initargs=(nn_apps,)) as p:
+            chunk_results = ordered_map(p, profiled(batch_window_chunk), tasks, 2 * nproc)
+            write_batch(nn_apps, tasks, profile_results(chunk_results))
+    return failed
+
+
+def write_batch(nn_apps, tasks, chunk_results):
+    # chunk results in task order, i.e. cluster by cluster: one cluster is written at a time.
+    # Clusters without any window get their (empty) outputs too.
+    chunks_left = Counter(k for k, task in tasks)
+    writer = None
+    for (k, task), (results, counts) in zip(tasks, chunk_results):
+        nn_app = nn_apps[k]
+        if writer is None:
+            writer = ResultWriter(nn_app)
+        nn_app.filter_counts.update(counts)
+        for res in results:
+            writer.add(res)
+        chunks_left[k] -= 1
+        if chunks_left[k] == 0:
+            writer.close()
+            writer = None
+            nn_app.remove_checkpoint()
+            nn_app.report_filters()
+    for k, nn_app in enumerate(nn_apps):
+        if k not in chunks_left:
+            nn_app.write_results([])
+            nn_app.report_filters()
+
+
+def sweep_grid(sweep, options):
+    # 'n=4|6;d=10|32' ==> [{attribute of NN_degenerate: value}, ...], all combinations.
+    # Missing parameters take the value of their option.
+    parameters = [("n", "number_of_dege_bases", int, options.dnum),
+                  ("d", "score_of_dege_bases", int, options.degeneracy),
+                  ("v", "variation", int, options.variation),
+                  ("c", "position", str, options.coordinate),
+                  ("f", "coverage", float, options.fraction)]
+    values = {}
+    for item in sweep.split(";"):
+        if item.strip():
+            name, value = item.split("=", 1)
+            values[name.strip().lstrip("-")] = value.split("|")
+    unknown = set(values.keys()) - set([p[0] for p in parameters])
+    if unknown:
+        print("Error: unknown sweep parameter(s) {}. Use n, d, v, c and f.".format(",".join(sorted(unknown))))
+        sys.exit(1)
+    grid = [{}]
+    for name, attribute, value_type, default in parameters:
+        grid = [dict(point, **{attribute: value_type(value.strip())}) for point in grid
+                for value in values.get(name, [str(default)])]
+    return grid
 
 
 def main():
     options, args = argsParse()
-    NN_APP = NN_degenerate(seq_file=options.input, primer_length=options.plen, coverage=options.fraction,
+    if options.profile:
+        enable_profile()
+        start = time.perf_counter()
+        profile_path = os.path.join(options.out, "batch.profile.json") if options.batch \
+            else options.out + ".profile.json"
+    try:
+        run_design(options, args)
+    finally:
+        if options.profile and os.path.isdir(os.path.dirname(os.path.abspath(profile_path))):
+            STAGE_PROFILE.report(profile_path, time.perf_counter() - start, options.proc)
+
+
+def run_design(options, args):
+    if options.checkpoint and options.sweep is not None:
+        print("Error: -k can not be combined with -w !!!")
+        sys.exit(1)
+    if options.batch:
+        if options.plen_range is not None or options.sweep is not None:
+            print("Error: -b can not be combined with -L or -w !!!")
+            sys.exit(1)
+        seq_files = batch_files([options.input] + args if options.input else args)
+        failed = run_batch(seq_files, options.out, options.proc,
+                           primer_length=options.plen, coverage=options.fraction,
                            number_of_dege_bases=options.dnum, score_of_dege_bases=options.degeneracy,
-                           raw_entropy_threshold=options.entropy, product_len=options.size, position=options.coordinate,
-                           variation=options.variation, distance=options.away, GC=options.gc,
-                           nproc=options.proc, outfile=options.out)
-    NN_APP.run()
+                           raw_entropy_threshold=options.entropy, product_len=options.size,
+                           position=options.coordinate, variation=options.variation, distance=options.away,
+                           GC=options.gc, json_out=options.json, role_aware=options.role,
+                           checkpoint=options.checkpoint)
+        # a failed alignment does not fail the others: exit 1 only if none was designed.
+        if failed:
+            print("Error: no candidate primers for {} alignment(s), see {} !!!".format(
+                len(failed), os.path.join(options.out, "failed.txt")))
+            if len(failed) == len(seq_files):
+                sys.exit(1)
+        return
+    try:
+        NN_APP = NN_degenerate(seq_file=options.input, primer_length=options.plen, coverage=options.fraction,
+                               number_of_dege_bases=options.dnum, score_of_dege_bases=options.degeneracy,
+                               raw_entropy_threshold=options.entropy, product_len=options.size,
+                               position=options.coordinate, variation=options.variation, distance=options.away,
+                               GC=options.gc, nproc=options.proc, outfile=options.out, json_out=options.json,
+                               role_aware=options.role, checkpoint=options.checkpoint)
+        if options.sweep is not None:
+            NN_APP.run_sweep(sweep_grid(options.sweep, options))
+        elif options.plen_range is None:
+            NN_APP.run()
+        else:
+            min_len, max_len = map(int, options.plen_range.split(","))
+            NN_APP.run_lengths(range(min_len, max_len + 1))
+    except DesignError as e:
+        print("Error: {}".format(e))
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -41,7 +41,6 @@ import time
 from functools import reduce
 from math import log10
 from itertools import product
-from multiprocessing import Manager
 from collections import defaultdict
 import re
 from concurrent.futures import ProcessPoolExecutor
@@ -383,6 +382,34 @@ def Calc_Tm_v2(seq):
 ##############################################################################################
 
 
+##############################################################################################
+############## window scanning in worker processes ###########################################
+# The alignment is handed to each worker once by the pool initializer (inherited by fork),
+# so tasks only carry a (start, stop) range of windows instead of the whole sequence dict.
+##############################################################################################
+WINDOW_WORKER_APP = None
+
+
+def init_window_worker(nn_app):
+    global WINDOW_WORKER_APP
+    WINDOW_WORKER_APP = nn_app
+
+
+def scan_window_chunk(chunk):
+    chunk_start, chunk_stop = chunk
+    return [WINDOW_WORKER_APP.get_primers(WINDOW_WORKER_APP.seq_dict, position)
+            for position in range(chunk_start, chunk_stop)]
+
+
+def window_chunks(start, stop, nproc, chunks_per_proc=4):
+    # contiguous ranges of windows, several per process to balance conserved / variable regions.
+    start, stop = int(start), int(stop)
+    if stop <= start:
+        return []
+    chunk_size = max(1, math.ceil((stop - start) / (max(1, nproc) * chunks_per_proc)))
+    return [(i, min(i + chunk_size, stop)) for i in range(start, stop, chunk_size)]
+
+
 class NN_degenerate(object):
     def __init__(self, seq_file, primer_length=18, coverage=0.8, number_of_dege_bases=18, score_of_dege_bases=1000,
                  product_len=250, position="2,-1", variation=2, raw_entropy_threshold=3.6, distance=4, GC="0.4,0.6",
@@ -406,7 +433,6 @@ class NN_degenerate(object):
         self.raw_entropy_threshold = raw_entropy_threshold
         self.entropy_threshold = self.entropy_threshold_adjust(self.length)
         self.outfile = outfile
-        self.resQ = Manager().Queue()
 
     # expand degenerate primer into a list.
     @staticmethod
@@ -758,9 +784,9 @@ class NN_degenerate(object):
         # number of sequences with too many gaps greater than (1 - self.coverage)
         if round(gap_sequence_number / self.total_sequence_number, 2) >= (1 - self.coverage):
             # print("Gap fail")
-            self.resQ.put(None)
+            return None
         elif len(cover) < 1:
-            self.resQ.put(None)
+            return None
             # print("Cover fail")
         else:
             # cBit: entropy of cover sequences
@@ -769,7 +795,7 @@ class NN_degenerate(object):
             if tBit > self.entropy_threshold:
                 # print("Entropy fail")
                 # This window is not a conserved region, and not proper to design primers
-                self.resQ.put(None)
+                return None
             else:
                 primers_db = pd.DataFrame(primers_db)
                 # frequency matrix
@@ -779,27 +805,27 @@ class NN_degenerate(object):
                 # a < 4 means base composition of this region is less than 4 (GC bias).
                 # It's not a proper region for primer design.
                 if a < 4:
-                    self.resQ.put(None)
+                    return None
                 elif (colSum == 0).any():
                     # print(colSum)  # if 0 in array; pass
-                    self.resQ.put(None)
+                    return None
                 else:
                     gap_seq_id_info = [primer_start, gap_seq_id]
                     mismatch_coverage, non_cov_primer_info = \
                         self.degenerate_by_NN_algorithm(primer_start, freq_matrix, cover, non_gap_seq_id,
                                                         cover_for_MM, cover_number, cBit, tBit)
-                    # self.resQ.put([mismatch_coverage, non_cov_primer_info, gap_seq_id_info])
+                    # return [mismatch_coverage, non_cov_primer_info, gap_seq_id_info]
                     # F, R = mismatch_coverage[1][6], mismatch_coverage[1][7]
                     sequence = mismatch_coverage[1][2]
                     if self.dimer_check(sequence):
                         # print("Dimer fail")
-                        self.resQ.put(None)
+                        return None
                     else:
-                        self.resQ.put([mismatch_coverage, non_cov_primer_info, gap_seq_id_info])
+                        return [mismatch_coverage, non_cov_primer_info, gap_seq_id_info]
                     # if F < cover_number * 0.5 or R < cover_number * 0.5:
-                    #     self.resQ.put(None)
+                    #     return None
                     # else:
-                    #     self.resQ.put([mismatch_coverage, non_cov_primer_info, gap_seq_id_info])
+                    #     return [mismatch_coverage, non_cov_primer_info, gap_seq_id_info]
 
     def degenerate_by_NN_algorithm(self, primer_start, freq_matrix, cover, non_gap_seq_id, cover_for_MM,
                                    cover_number, cBit, tBit):
@@ -1163,39 +1189,36 @@ class NN_degenerate(object):
         return F_mis_cover, F_non_cover, R_mis_cover, R_non_cover
 
     ################# get_primers #####################
+    def scan_windows(self, start, stop):
+        # yield the result of each window (None if rejected) in position order.
+        chunks = window_chunks(start, stop, self.nproc)
+        if self.nproc <= 1 or len(chunks) <= 1:
+            init_window_worker(self)
+            for chunk in chunks:
+                for res in scan_window_chunk(chunk):
+                    yield res
+        else:
+            with ProcessPoolExecutor(self.nproc, initializer=init_window_worker, initargs=(self,)) as p:
+                # map returns chunk results in submission order, as soon as each one is finished.
+                for results in p.map(scan_window_chunk, chunks):
+                    for res in results:
+                        yield res
+
     def run(self):
-        p = ProcessPoolExecutor(self.nproc)  #
-        sequence_dict = self.seq_dict
         start_primer = self.start_position
         stop_primer = self.stop_position
-        # primer_info = Manager().list()
-        # non_cov_primer_out = Manager().list()
-        for position in range(start_primer, stop_primer - self.primer_length):
-            # print(position)
-            p.submit(self.get_primers(sequence_dict, position))  # , primer_info, non_cov_primer_out
-            # This will submit all tasks to one place without blocking, and then each
-            # thread in the thread pool will fetch tasks.
-        n = 0
         candidate_list, non_cov_primer_out, gap_seq_id_out = [], [], []
         with open(self.outfile, "w") as fo:
             headers = ["Position", "Entropy of cover (bit)", "Entropy of total (bit)", "Optimal_primer", "primer_degenerate_number",
                        "nonsense_primer_number", "Optimal_coverage", "Mis-F-coverage", "Mis-R-coverage", "Tm",
                        "Information"]
             fo.write("\t".join(map(str, headers)) + "\n")
-            while n < stop_primer - start_primer - self.primer_length:
-                res = self.resQ.get()
-                # The get method can read and delete an element from the queue. Similarly, the get method has two
-                # optional parameters: blocked and timeout. If blocked is true (the default value) and timeout is
-                # positive, no element is retrieved during the waiting time, and a Queue is thrown Empty exception.
-                # If blocked is false, there are two cases. If a value of Queue is available, return the value
-                # immediately. Otherwise, if the queue is empty, throw a Queue.Empty exception immediately.
+            for res in self.scan_windows(start_primer, stop_primer - self.primer_length):
                 if res is None:
-                    n += 1
                     continue
                 candidate_list.append(res[0])
                 non_cov_primer_out.append(res[1])
                 gap_seq_id_out.append(res[2])
-                n += 1
             sorted_candidate_dict = dict(sorted(dict(candidate_list).items(), key=lambda x: x[0], reverse=False))
             for position in sorted_candidate_dict.keys():
                 fo.write(str(position) + "\t" + "\t".join(map(str, sorted_candidate_dict[position])) + "\n")
@@ -1206,9 +1229,6 @@ class NN_degenerate(object):
             with open(self.outfile + '.gap_seq_id_json', "w") as fg:
                 json.dump(dict(gap_seq_id_out), fg, indent=4)
             fg.close()
-            # get results before shutdown. Synchronous call mode: call, wait for the return value, decouple,
-            # but slow.
-        p.shutdown()
 
 
 def main():
@@ -0,0 +1,62 @@
+#!/bin/python
+"""
+Frequency matrix and nearest-neighbor (NN) transition tensor of the sequences in a primer window.
+The sequences of a window are given as {sequence: number}, as the cover dict of multiPrime-core.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import numpy as np
+
+bases = np.array(["A", "C", "G", "T"])
+
+# ASCII code ==> row of the frequency matrix. "A", "C", "G", "T" ==> 0-3, "-" and others ==> 4.
+BASE_INDEX_TABLE = np.full(256, 4, dtype=np.int64)
+for idx, base in enumerate(bases):
+    BASE_INDEX_TABLE[ord(base)] = idx
+
+
+def variant_codes(cover):
+    # {sequence: number} ==> (variants x length) base index array, (variants) number array
+    sequences = list(cover.keys())
+    counts = np.fromiter(cover.values(), dtype=np.int64, count=len(sequences))
+    if not sequences:
+        return np.zeros((0, 0), dtype=np.int64), counts
+    codes = BASE_INDEX_TABLE[np.frombuffer("".join(sequences).encode("ascii"), dtype=np.uint8)]
+    return codes.reshape(len(sequences), -1), counts
+
+
+def frequency_matrix(codes, counts):
+    # (5 x length): number of A, C, G, T and "-" in each column.
+    one_hot = codes[:, :, None] == np.arange(5)
+    return np.einsum("n,nlb->bl", counts, one_hot.astype(np.int64))
+
+
+def transition_tensor(codes, counts):
+    # (length - 1) x 4 x 4: number of each di-nucleotide (row: 5' base, column: 3' base) in each NN position.
+    # Di-nucleotides with "-" are not counted.
+    pairs = codes[:, :-1] * 5 + codes[:, 1:]
+    one_hot = pairs[:, :, None] == np.arange(25)
+    trans = np.einsum("n,nlb->lb", counts, one_hot.astype(np.int64))
+    return trans.reshape(-1, 5, 5)[:, :4, :4].copy()
+
+
+def viterbi_batch(nodes, trans):
+    # nodes: (windows x length x labels) state scores, trans: (windows x length - 1 x labels x labels) NN scores
+    # ==> (windows x length) label path with the maximal sum of each window.
+    # Max-plus dynamic programming over all windows at once, with preallocated back pointers.
+    # Ties are resolved as the per-window decoder of multiPrime-core (first maximum).
+    windows, length, labels = nodes.shape
+    back_pointer = np.zeros((windows, length, labels), dtype=np.int64)
+    scores = nodes[:, 0, :]
+    for t in range(1, length):
+        # M[w, i, j]: best path ending with label i at t - 1, then label j at t
+        M = scores[:, :, None] + trans[:, t - 1] + nodes[:, t, None, :]
+        back_pointer[:, t] = M.argmax(axis=1)
+        scores = M.max(axis=1)
+    path = np.zeros((windows, length), dtype=np.int64)
+    path[:, -1] = scores.argmax(axis=1)
+    rows = np.arange(windows)
+    for t in range(length - 1, 0, -1):
+        path[:, t - 1] = back_pointer[rows, t, path[:, t]]
+    return path
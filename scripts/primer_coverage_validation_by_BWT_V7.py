@@ -38,7 +38,6 @@ import sys
 from collections import defaultdict
 import os
 import multiprocessing
-from itertools import product
 from multiprocessing import Process
 import time
 import numpy as np
@@ -52,6 +51,7 @@ from operator import mul  #
 from bisect import bisect_left
 from multiprocessing import Manager
 from concurrent.futures import ProcessPoolExecutor
+from degenerate import degenerate_seq
 
 
 # Path(path).parent, Path(path).name, Path(path).suffix, Path(path).stem, Path(path).iterdir(), Path(path).joinpath()
@@ -135,10 +135,6 @@ def argsParse():
 
 TRANS = str.maketrans("ATGCRYMKSWHBVDN", "TACGYRKMSWDVBHN")
 
-degenerate_base = {"R": ["A", "G"], "Y": ["C", "T"], "M": ["A", "C"], "K": ["G", "T"],
-                   "S": ["G", "C"], "W": ["A", "T"], "H": ["A", "T", "C"], "B": ["G", "T", "C"],
-                   "V": ["G", "A", "C"], "D": ["G", "A", "T"], "N": ["A", "T", "G", "C"]}
-
 score_table = {"A": 1, "G": 1.1, "C": 1.2, "T": 1.4, "R": 2.1, "Y": 2.6, "M": 2.2,
                "K": 2.5, "S": 2.3, "W": 2.4, "H": 3.6, "B": 3.7, "V": 3.3, "D": 3.5, "N": 4.7}
 
@@ -229,19 +225,8 @@ class off_targets(object):
         self.resQ = Manager().Queue()
         self.mismatch_num = mismatch_num
 
-    @staticmethod
-    def degenerate_seq(primer):
-        seq = []
-        cs = ""
-        for s in primer:
-            if s not in degenerate_base:
-                cs += s
-            else:
-                seq.append([cs + i for i in degenerate_base[s]])
-                cs = ""
-        if cs:
-            seq.append([cs])
-        return ["".join(i) for i in product(*seq)]
+    # expand degenerate primer into a tuple. Expansions are cached, see degenerate.py.
+    degenerate_seq = staticmethod(degenerate_seq)
 
     def get_term(self):
         Output = Path(self.primer_file).parent.joinpath(Path(self.primer_file).stem).with_suffix(".term.fa")
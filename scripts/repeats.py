@@ -0,0 +1,79 @@
+#!/bin/python
+"""
+Homopolymer and short tandem repeat detection on 4-bit IUPAC masks (see iupac.py).
+A primer is rejected if any of its non-degenerate primers contains a homopolymer run >= 4 (AAAA),
+a dinucleotide repeat >= 4 (ACACACAC) or a trinucleotide repeat >= 3 (ACGACGACG, ACAACAACA).
+For a period p, the bases of a repeat at positions o + q, o + q + p, ... must be the same, so they are allowed by
+the AND of the masks at those positions. One pass over the AND arrays finds all repeats, for many primers of the
+same length at once, without expanding degenerate bases.
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+from functools import lru_cache
+from itertools import product
+import numpy as np
+from iupac import ENCODE_TABLE
+
+BASE_MASKS = (1, 2, 4, 8)
+
+# DIFFERENT_2[a, b]: a base of mask a and a base of mask b can differ (repeat unit of 2 different bases).
+DIFFERENT_2 = np.zeros((16, 16), dtype=bool)
+# DIFFERENT_3[a, b, c]: bases x, y, z of masks a, b, c with x != y and y != z exist (repeat unit of 3 bases).
+DIFFERENT_3 = np.zeros((16, 16, 16), dtype=bool)
+for a, b in product(range(16), repeat=2):
+    DIFFERENT_2[a, b] = any(x & a and y & b and x != y for x, y in product(BASE_MASKS, repeat=2))
+for a, b, c in product(range(16), repeat=3):
+    DIFFERENT_3[a, b, c] = any(x & a and y & b and z & c and x != y and y != z
+                               for x, y, z in product(BASE_MASKS, repeat=3))
+
+
+def encode(primers):
+    # primers of the same length ==> (primers x length) uint8 IUPAC masks. Characters outside IUPAC codes ==> 0.
+    length = len(primers[0]) if primers else 0
+    masks = ENCODE_TABLE[np.frombuffer("".join(primers).encode("ascii"), dtype=np.uint8)]
+    return masks.reshape(len(primers), length)
+
+
+def residue_and(masks, period, repeat):
+    # AND of the masks at o, o + period, ..., o + period * (repeat - 1), for each offset o
+    length = masks.shape[1]
+    span = period * (repeat - 1)
+    result = masks[:, :length - span].copy()
+    for t in range(1, repeat):
+        result &= masks[:, period * t:length - span + period * t]
+    return result
+
+
+def repeat_array(masks, trinucleotide=True):
+    # (primers x length) uint8 masks ==> bool array, True if any non-degenerate primer has a homopolymer run >= 4,
+    # dinucleotide repeat >= 4 or (trinucleotide=True) trinucleotide repeat >= 3.
+    length = masks.shape[1]
+    found = np.zeros(masks.shape[0], dtype=bool)
+    if length >= 4:
+        found |= (residue_and(masks, 1, 4) != 0).any(axis=1)
+    if length >= 8:
+        unit = residue_and(masks, 2, 4)
+        found |= DIFFERENT_2[unit[:, :length - 7], unit[:, 1:length - 6]].any(axis=1)
+    if trinucleotide and length >= 9:
+        unit = residue_and(masks, 3, 3)
+        found |= DIFFERENT_3[unit[:, :length - 8], unit[:, 1:length - 7], unit[:, 2:length - 6]].any(axis=1)
+    return found
+
+
+def repeat_check(primers, trinucleotide=True):
+    # primers of any length ==> list of bool, primers of the same length are checked in one batch
+    result = [False] * len(primers)
+    by_length = {}
+    for idx, primer in enumerate(primers):
+        by_length.setdefault(len(primer), []).append(idx)
+    for indexes in by_length.values():
+        found = repeat_array(encode([primers[i] for i in indexes]), trinucleotide)
+        for i, f in zip(indexes, found.tolist()):
+            result[i] = f
+    return result
+
+
+@lru_cache(maxsize=200000)
+def has_repeat(primer, trinucleotide=True):
+    return repeat_check([primer], trinucleotide)[0]
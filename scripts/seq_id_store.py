@@ -0,0 +1,325 @@
+#!/bin/python
+"""
+Binary store of the sequences not covered by each candidate primer of multiPrime-core
+(replaces [out].non_coverage_seq_id_json and [out].gap_seq_id_json).
+
+Layout of [out].seq_id_bin, little-endian, each section padded to 8 bytes:
+    magic "MPSEQID1"
+    header: uint64 x 6 = id number, position number, record number, id blob size, variant blob size, member number
+    id blob: acc IDs joined by "\\n" (the sequence-ID dictionary, in alignment order)
+    positions: int64 [positions], ascending
+    bits: uint8 [positions x 3 x ceil(ids / 8)], one bit array of acc IDs (np.packbits, little bit order) per
+          position and kind: 0 = not covered as primer-F, 1 = not covered as primer-R, 2 = gap
+    record position: uint32 [records], record kind: uint8 [records]
+    record variant offset: uint64 [records + 1], record member offset: uint64 [records + 1]
+    variant blob: window sequences of the records
+    members: uint32 [members], acc ID indexes of each record, in the same order as the JSON lists
+A reader memory-maps the file and gets the bit arrays of any position without parsing the rest;
+records (sequence ==> acc IDs) are only needed for the JSON export.
+
+Usage: python seq_id_store.py -i [out].seq_id_bin [-o out]  (write [out].non_coverage_seq_id_json and [out].gap_seq_id_json)
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import io
+import json
+import mmap
+import shutil
+import sys
+import tempfile
+from optparse import OptionParser
+import numpy as np
+from mismatch import popcount
+
+MAGIC = b"MPSEQID1"
+HEADER = np.dtype("<u8")
+KINDS = ("F", "R", "gap")
+F_KIND, R_KIND, GAP_KIND = 0, 1, 2
+
+
+def argsParse():
+    parser = OptionParser('Usage: %prog -i [out].seq_id_bin -o out',
+                          description="Export the binary acc ID store of multiPrime-core as JSON.")
+    parser.add_option('-i', '--input',
+                      dest='input',
+                      help='Input file: [out].seq_id_bin of multiPrime-core.')
+    parser.add_option('-o', '--out',
+                      dest='out',
+                      help='Output prefix: [out].non_coverage_seq_id_json and [out].gap_seq_id_json are written. '
+                           'Default: input without ".seq_id_bin".')
+    (options, args) = parser.parse_args()
+    if options.input is None:
+        parser.print_help()
+        print("Input file must be specified !!!")
+        sys.exit(1)
+    return options, args
+
+
+def padding(size):
+    return b"\0" * (-size % 8)
+
+
+class SeqIdWriter(object):
+    # Streaming writer of [out].seq_id_bin: add() the windows in ascending position order, then close().
+    # Every section that grows with the positions or the records (positions, bit arrays: 3 x ceil(ids / 8) bytes
+    # per position, record tables, window sequences, acc ID indexes) is spooled to a temporary file and copied
+    # into [out].seq_id_bin by close(), so memory holds one window at a time.
+    SPOOLS = ("positions", "bits", "record_position", "record_kind", "variant_offset", "member_offset",
+              "variants", "members")
+
+    def __init__(self, path, ids):
+        self.path = path
+        self.ids = list(ids)
+        self.id_index = {seq_id: idx for idx, seq_id in enumerate(self.ids)}
+        self.position_number, self.record_number = 0, 0
+        self.last_position = None
+        self.variant_size, self.member_number = 0, 0
+        self.spools = {name: tempfile.TemporaryFile() for name in self.SPOOLS}
+        self.spools["variant_offset"].write(np.zeros(1, dtype="<u8").tobytes())
+        self.spools["member_offset"].write(np.zeros(1, dtype="<u8").tobytes())
+
+    def add(self, position, F_non_cover, R_non_cover, gap_seq_id):
+        # Each *_non_cover / gap_seq_id is {sequence: [acc ID, ...]}.
+        # F_non_cover / R_non_cover is None if the window is never used in that role (multiPrime-core -r):
+        # all bits are set, so the primer does not cover any sequence in that role, and no record is written.
+        if self.last_position is not None and position <= self.last_position:
+            raise ValueError("Positions must be added in ascending order: {} after {}."
+                             .format(position, self.last_position))
+        p_idx = self.position_number
+        self.last_position = position
+        self.position_number += 1
+        self.spools["positions"].write(np.array([position], dtype="<i8").tobytes())
+        bits = np.zeros((len(KINDS), len(self.ids)), dtype=bool)
+        record_kind = []
+        variant_offset, member_offset = [], []
+        for kind, seq_id_dict in ((F_KIND, F_non_cover), (R_KIND, R_non_cover), (GAP_KIND, gap_seq_id)):
+            if seq_id_dict is None:
+                bits[kind] = True
+                continue
+            for sequence, seq_ids in seq_id_dict.items():
+                members = np.array([self.id_index[i] for i in seq_ids], dtype="<u4")
+                bits[kind, members] = True
+                variant = sequence.encode("ascii")
+                self.variant_size += len(variant)
+                self.member_number += len(members)
+                record_kind.append(kind)
+                variant_offset.append(self.variant_size)
+                member_offset.append(self.member_number)
+                self.spools["variants"].write(variant)
+                self.spools["members"].write(members.tobytes())
+        self.record_number += len(record_kind)
+        self.spools["bits"].write(np.packbits(bits, axis=1, bitorder="little").tobytes())
+        self.spools["record_position"].write(np.full(len(record_kind), p_idx, dtype="<u4").tobytes())
+        self.spools["record_kind"].write(np.array(record_kind, dtype="u1").tobytes())
+        self.spools["variant_offset"].write(np.array(variant_offset, dtype="<u8").tobytes())
+        self.spools["member_offset"].write(np.array(member_offset, dtype="<u8").tobytes())
+
+    def close(self):
+        id_blob = "\n".join(self.ids).encode("utf-8")
+        header = np.array([len(self.ids), self.position_number, self.record_number, len(id_blob),
+                           self.variant_size, self.member_number], dtype=HEADER)
+        sections = [MAGIC, header.tobytes(), id_blob] + [self.spools[name] for name in self.SPOOLS]
+        if hasattr(self.path, "write"):
+            fo = self.path
+        else:
+            fo = open(self.path, "wb")
+        for section in sections:
+            if hasattr(section, "read"):
+                size = section.tell()
+                section.seek(0)
+                shutil.copyfileobj(section, fo)
+                section.close()
+            else:
+                size = len(section)
+                fo.write(section)
+            fo.write(padding(size))
+        if fo is not self.path:
+            fo.close()
+
+
+def write_seq_id(path, ids, non_cov_primer_out, gap_seq_id_out):
+    # non_cov_primer_out: [[position, [F_non_cover, R_non_cover]], ...], gap_seq_id_out: [[position, gap_seq_id], ...]
+    # (as collected by NN_degenerate.run), see SeqIdWriter.add.
+    non_cover = dict(non_cov_primer_out)
+    gap = dict(gap_seq_id_out)
+    writer = SeqIdWriter(path, ids)
+    for position in sorted(set(non_cover.keys()) | set(gap.keys())):
+        F_non_cover, R_non_cover = non_cover.get(position, [{}, {}])
+        writer.add(position, F_non_cover, R_non_cover, gap.get(position, {}))
+    writer.close()
+
+
+class JsonObjectWriter(object):
+    # Streaming writer of a JSON object, entry by entry, with the same layout as json.dump(..., indent=4).
+    def __init__(self, path, indent=4):
+        self.fo = open(path, "w")
+        self.indent = indent
+        self.number = 0
+
+    def add(self, key, value):
+        self.fo.write(",\n" if self.number else "{\n")
+        value = json.dumps(value, indent=self.indent).replace("\n", "\n" + " " * self.indent)
+        self.fo.write(" " * self.indent + json.dumps(str(key)) + ": " + value)
+        self.number += 1
+
+    def close(self):
+        self.fo.write("\n}" if self.number else "{}")
+        self.fo.close()
+
+
+def load_json_seq_id(prefix):
+    # SeqIdStore (in memory) of [prefix].non_coverage_seq_id_json and [prefix].gap_seq_id_json, written by
+    # earlier versions of multiPrime-core. The ID dictionary is in order of first appearance.
+    with open(prefix + ".non_coverage_seq_id_json") as n:
+        non_cover = json.load(n)
+    with open(prefix + ".gap_seq_id_json") as g:
+        gap = json.load(g)
+    ids = {}
+    for position in non_cover.keys():
+        for seq_id_dict in non_cover[position] + [gap.get(position, {})]:
+            for seq_ids in (seq_id_dict or {}).values():
+                for seq_id in seq_ids:
+                    ids.setdefault(seq_id, len(ids))
+    buffer = io.BytesIO()
+    write_seq_id(buffer, list(ids.keys()), [[int(k), v] for k, v in non_cover.items()],
+                 [[int(k), v] for k, v in gap.items()])
+    return SeqIdStore(buffer=buffer.getvalue())
+
+
+class SeqIdStore(object):
+    # path: [out].seq_id_bin, memory-mapped. buffer: the same content in memory (see load_json_seq_id).
+    def __init__(self, path=None, buffer=None):
+        self.path = path
+        self.load(buffer)
+
+    def load(self, buffer=None):
+        if buffer is None:
+            with open(self.path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = buffer
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a seq_id_bin file of multiPrime-core.".format(self.path))
+        offset = len(MAGIC)
+        header = np.frombuffer(self.buffer, dtype=HEADER, count=6, offset=offset)
+        self.id_number, position_number, record_number, id_size, variant_size, member_number = map(int, header)
+        offset += header.nbytes
+        self.nbytes = (self.id_number + 7) // 8
+        sections = [("id_blob", "u1", id_size), ("positions", "<i8", position_number),
+                    ("bits", "u1", position_number * len(KINDS) * self.nbytes),
+                    ("record_position", "<u4", record_number), ("record_kind", "u1", record_number),
+                    ("variant_offset", "<u8", record_number + 1), ("member_offset", "<u8", record_number + 1),
+                    ("variant_blob", "u1", variant_size), ("members", "<u4", member_number)]
+        for name, dtype, count in sections:
+            array = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset)
+            setattr(self, name, array)
+            offset += array.nbytes + len(padding(array.nbytes))
+        self.bits = self.bits.reshape(position_number, len(KINDS), self.nbytes)
+        self._ids = None
+        self._role_bits = {}
+
+    def __getstate__(self):
+        # worker processes map the file again instead of receiving a copy of it
+        if self.path is not None:
+            return {"path": self.path}
+        return {"path": None, "buffer": bytes(self.buffer)}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.load(state.get("buffer"))
+
+    @property
+    def ids(self):
+        # sequence-ID dictionary, decoded on first use
+        if self._ids is None:
+            self._ids = self.id_blob.tobytes().decode("utf-8").split("\n") if self.id_number else []
+        return self._ids
+
+    def __contains__(self, position):
+        idx = np.searchsorted(self.positions, int(position))
+        return idx < len(self.positions) and self.positions[idx] == int(position)
+
+    def position_index(self, position):
+        idx = int(np.searchsorted(self.positions, int(position)))
+        if idx >= len(self.positions) or self.positions[idx] != int(position):
+            raise KeyError(position)
+        return idx
+
+    def position_indexes(self, positions):
+        # positions ==> row indexes of the bit arrays, all at once
+        positions = np.asarray(positions, dtype=np.int64)
+        idx = np.searchsorted(self.positions, positions)
+        found = idx < len(self.positions)
+        found[found] = self.positions[idx[found]] == positions[found]
+        if not found.all():
+            raise KeyError(positions[~found].tolist())
+        return idx
+
+    def role_bits(self, role):
+        # (positions x bytes) acc IDs not covered by the primer of role "F" or "R" (mismatch or gap) at each position.
+        # Built on first use and kept in memory.
+        if role not in self._role_bits:
+            self._role_bits[role] = self.bits[:, KINDS.index(role)] | self.bits[:, GAP_KIND]
+        return self._role_bits[role]
+
+    def pair_uncovered_number(self, F_position, R_positions):
+        # number of acc IDs not covered by primer-F at F_position or by primer-R at each of R_positions:
+        # popcount(F_uncovered | R_uncovered), all R partners of primer-F in one call.
+        F_bits = self.role_bits("F")[self.position_index(F_position)]
+        R_bits = self.role_bits("R")[self.position_indexes(R_positions)]
+        return popcount(F_bits | R_bits)
+
+    def bit_array(self, position, kind):
+        # packed bit array (uint8, little bit order) of acc IDs not covered at position. kind: "F", "R" or "gap"
+        return self.bits[self.position_index(position), KINDS.index(kind)]
+
+    def seq_ids(self, bit_array):
+        # packed bit array ==> acc IDs
+        index = np.nonzero(np.unpackbits(bit_array, count=self.id_number, bitorder="little"))[0]
+        ids = self.ids
+        return [ids[i] for i in index.tolist()]
+
+    def uncovered(self, position, kind):
+        # set of acc IDs not covered at position
+        return set(self.seq_ids(self.bit_array(position, kind)))
+
+    def records(self):
+        # [(position, kind, sequence, [acc ID, ...]), ...] in the order they were written
+        ids = self.ids
+        variant_blob = self.variant_blob.tobytes().decode("ascii")
+        variant_offset = self.variant_offset.tolist()
+        member_offset = self.member_offset.tolist()
+        positions = self.positions.tolist()
+        for r, (p_idx, kind) in enumerate(zip(self.record_position.tolist(), self.record_kind.tolist())):
+            sequence = variant_blob[variant_offset[r]:variant_offset[r + 1]]
+            members = self.members[member_offset[r]:member_offset[r + 1]].tolist()
+            yield positions[p_idx], KINDS[kind], sequence, [ids[i] for i in members]
+
+    def to_json(self, prefix):
+        # write [prefix].non_coverage_seq_id_json and [prefix].gap_seq_id_json as multiPrime-core (-j) does
+        non_cover = {position: [{}, {}] for position in self.positions.tolist()}
+        gap = {position: {} for position in self.positions.tolist()}
+        for position, kind, sequence, seq_ids in self.records():
+            if kind == "gap":
+                gap[position][sequence] = seq_ids
+            else:
+                non_cover[position][KINDS.index(kind)][sequence] = seq_ids
+        # roles skipped by multiPrime-core -r: all bits set and no record
+        full = np.packbits(np.ones(self.id_number, dtype=bool), bitorder="little")
+        for p_idx, position in enumerate(self.positions.tolist()):
+            for kind in (F_KIND, R_KIND):
+                if self.id_number and not non_cover[position][kind] and (self.bits[p_idx, kind] == full).all():
+                    non_cover[position][kind] = None
+        with open(prefix + '.non_coverage_seq_id_json', "w") as fj:
+            json.dump(non_cover, fj, indent=4)
+        with open(prefix + '.gap_seq_id_json', "w") as fg:
+            json.dump(gap, fg, indent=4)
+
+
+if __name__ == "__main__":
+    (options, args) = argsParse()
+    out = options.out
+    if out is None:
+        out = options.input[:-len(".seq_id_bin")] if options.input.endswith(".seq_id_bin") else options.input
+    store = SeqIdStore(options.input)
+    store.to_json(out)
@@ -0,0 +1,275 @@
+#!/bin/python
+"""
+Deterministic generator of a synthetic sequence family (raw FASTA + multi-alignment) for scale tests.
+
+A tree is grown from a root sequence (-i, or random of -l bp): -b children per node over -d levels, the leaves
+(-n sequences) are attached to the nodes of the last level with uneven (gamma) weights, so clades differ in size.
+Every branch (root ==> leaf: -d internal branches + 1 leaf branch) gets an equal share of the substitution rate
+(-s) and of the indel rate (-g), both per site from the root to a leaf. Indel lengths are geometric (mean -m).
+Insertions (a fraction -e of the indels) are made on internal branches only: they add alignment columns, gapped in
+the other clades, so all columns are known before the leaves are written. Each internal node adds its own columns:
+lower -e for wide trees (many nodes, -b ** -d on the last level) to keep the alignment close to the root length.
+Deletions (gaps) are made on all branches, shared by the sequences of a clade if made on an internal branch.
+Leaves then get IUPAC codes (-a, a code containing the base, N included) and, for a fraction of them (-p),
+leading / trailing gaps of up to -t of the alignment length (partial genomes).
+
+Outputs: [out].msa (aligned, input of multiPrime-core) and [out].fa (the same sequences without gaps, reference of
+get_multiPrime and extract_PCR_product), one line per sequence, in the same order with the same IDs:
+>S[index]_[clade], e.g. >S0000042_3.1.0. Leaves are written one by one, memory holds the internal nodes only.
+The same parameters and seed (-r) give the same files.
+
+Usage: python synthetic_family.py -n 10000 -l 10000 -o family [-s 0.05 -g 0.005 -a 0.001 -p 0.1 -r 0]
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import sys
+from optparse import OptionParser
+import numpy as np
+
+# sequence codes: 0-3 bases, 4 gap, 5-15 IUPAC codes
+ALPHABET = np.frombuffer(b"ACGT-RYMKSWHBVDN", dtype=np.uint8)
+GAP = 4
+# IUPAC codes (index in ALPHABET) containing each base
+AMBIGUITY = np.array([[5, 7, 10, 12, 13, 14, 15],   # A: R M W H V D N
+                      [6, 7, 9, 11, 12, 13, 15],    # C: Y M S H B V N
+                      [5, 8, 9, 11, 13, 14, 15],    # G: R K S B V D N
+                      [6, 8, 10, 11, 12, 14, 15]],  # T: Y K W H B D N
+                     dtype=np.uint8)
+ENCODE = np.full(256, 255, dtype=np.uint8)
+ENCODE[np.frombuffer(b"ACGT", dtype=np.uint8)] = np.arange(4, dtype=np.uint8)
+
+
+def argsParse():
+    parser = OptionParser('Usage: %prog -n 10000 -l 10000 -o family\n \
+                        Options: { -i [seed.fa] -b [4] -d [3] -s [0.05] -g [0.005] -e [0.2] -m [3] -a [0.001] '
+                          '-p [0.1] -t [0.2] -r [0] }',
+                          version="%prog 1.0.0",
+                          description="Deterministic synthetic sequence family (FASTA + multi-alignment).")
+
+    parser.add_option('-n', '--number',
+                      dest='number',
+                      default=1000,
+                      type="int",
+                      help='Number of sequences. Default: 1000.')
+
+    parser.add_option('-l', '--length',
+                      dest='length',
+                      default=10000,
+                      type="int",
+                      help='Length of the random root sequence. Ignored with -i. Default: 10000.')
+
+    parser.add_option('-i', '--input',
+                      dest='input',
+                      default=None,
+                      type="str",
+                      help='Seed sequence: the first sequence of this FASTA file is the root (gaps removed, '
+                           'bases other than A, C, G, T replaced with random bases). Default: None.')
+
+    parser.add_option('-b', '--branching',
+                      dest='branching',
+                      default=4,
+                      type="int",
+                      help='Children of each internal node. Default: 4.')
+
+    parser.add_option('-d', '--depth',
+                      dest='depth',
+                      default=3,
+                      type="int",
+                      help='Levels of internal nodes under the root. Default: 3.')
+
+    parser.add_option('-s', '--substitution',
+                      dest='substitution',
+                      default=0.05,
+                      type="float",
+                      help='Substitutions per site from the root to a leaf. Default: 0.05.')
+
+    parser.add_option('-g', '--indel',
+                      dest='indel',
+                      default=0.005,
+                      type="float",
+                      help='Indel events per site from the root to a leaf. Default: 0.005.')
+
+    parser.add_option('-e', '--insertion',
+                      dest='insertion',
+                      default=0.2,
+                      type="float",
+                      help='Fraction of the indels of internal branches that are insertions, the others are '
+                           'deletions. Default: 0.2.')
+
+    parser.add_option('-m', '--indel_length',
+                      dest='indel_length',
+                      default=3,
+                      type="float",
+                      help='Mean indel length (geometric). Default: 3.')
+
+    parser.add_option('-a', '--ambiguity',
+                      dest='ambiguity',
+                      default=0.001,
+                      type="float",
+                      help='Fraction of the bases of each sequence replaced with an IUPAC code (R, Y, ..., N) '
+                           'containing the base. Default: 0.001.')
+
+    parser.add_option('-p', '--partial',
+                      dest='partial',
+                      default=0.1,
+                      type="float",
+                      help='Fraction of partial sequences, with leading and trailing gaps. Default: 0.1.')
+
+    parser.add_option('-t', '--truncation',
+                      dest='truncation',
+                      default=0.2,
+                      type="float",
+                      help='Max fraction of the alignment gapped at each end of a partial sequence. Default: 0.2.')
+
+    parser.add_option('-r', '--seed',
+                      dest='seed',
+                      default=0,
+                      type="int",
+                      help='Random seed. Default: 0.')
+
+    parser.add_option('-o', '--out',
+                      dest='out',
+                      help='Prefix of the outputs: [out].fa and [out].msa.')
+    (options, args) = parser.parse_args()
+    if options.out is None:
+        parser.print_help()
+        print("No output file provided !!!")
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def read_seed(path):
+    # first sequence of a FASTA file
+    sequence = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith(">"):
+                if sequence:
+                    break
+            else:
+                sequence.append(line.strip().upper().replace("-", ""))
+    return "".join(sequence)
+
+
+class SyntheticFamily(object):
+    def __init__(self, root, number=1000, branching=4, depth=3, substitution=0.05, indel=0.005, insertion=0.2,
+                 indel_length=3, ambiguity=0.001, partial=0.1, truncation=0.2, seed=0):
+        # root: sequence (str), or length of a random root
+        self.rng = np.random.RandomState(seed)
+        if isinstance(root, str):
+            root = ENCODE[np.frombuffer(root.encode("ascii"), dtype=np.uint8)]
+            unknown = root == 255
+            root[unknown] = self.rng.randint(0, 4, int(unknown.sum()))
+        else:
+            root = self.rng.randint(0, 4, int(root)).astype(np.uint8)
+        self.number = number
+        self.branching = branching
+        self.depth = depth
+        # rates of each branch
+        branches = depth + 1
+        self.substitution = substitution / branches
+        self.indel = indel / branches
+        self.insertion = insertion
+        self.indel_length = indel_length
+        self.ambiguity = ambiguity
+        self.partial = partial
+        self.truncation = truncation
+        self.nodes = self.grow(root)
+
+    def indel_lengths(self, number):
+        return self.rng.geometric(1.0 / max(1.0, self.indel_length), number)
+
+    def grow(self, root):
+        # internal nodes, level by level: {clade path (tuple): sequence codes in alignment columns}
+        root_length = len(root)
+        # insertions: {clade path: [(root column, length), ...]} made on the branch above each node
+        tree = [()]
+        levels = [[()]]
+        insertions = {(): []}
+        for level in range(self.depth):
+            children = [path + (k,) for path in levels[-1] for k in range(self.branching)]
+            for path in children:
+                number = self.rng.poisson(self.indel * self.insertion * root_length)
+                insertions[path] = list(zip(self.rng.randint(0, root_length, number).tolist(),
+                                            self.indel_lengths(number).tolist()))
+            levels.append(children)
+            tree.extend(children)
+        # alignment columns: root column i has key (i,), the j-th base inserted after it by node path has key
+        # (i, path, j): inserted columns follow their root column, in node order.
+        keys = [(i,) for i in range(root_length)]
+        for path in tree[1:]:
+            for column, length in insertions[path]:
+                keys.extend((column, path, j) for j in range(length))
+        keys.sort()
+        index = {key: k for k, key in enumerate(keys)}
+        self.length = len(keys)
+        nodes = {(): np.full(self.length, GAP, dtype=np.uint8)}
+        nodes[()][[index[(i,)] for i in range(root_length)]] = root
+        for path in tree[1:]:
+            sequence = nodes[path[:-1]].copy()
+            for column, length in insertions[path]:
+                sequence[[index[(column, path, j)] for j in range(length)]] = self.rng.randint(0, 4, length)
+            self.evolve(sequence, deletions=self.indel * (1 - self.insertion))
+            nodes[path] = sequence
+        return {path: nodes[path] for path in levels[-1]}
+
+    def sample(self, bases, rate):
+        # about rate * len(bases) sites drawn from bases (positions)
+        return bases[self.rng.randint(0, len(bases), self.rng.binomial(len(bases), rate))]
+
+    def evolve(self, sequence, deletions):
+        # substitutions and deletions of one branch, in place
+        bases = np.nonzero(sequence != GAP)[0]
+        if not len(bases):
+            return
+        sites = self.sample(bases, self.substitution)
+        sequence[sites] = (sequence[sites] + self.rng.randint(1, 4, len(sites))) % 4
+        number = self.rng.poisson(deletions * len(bases))
+        for start, length in zip(self.rng.randint(0, len(bases), number).tolist(),
+                                 self.indel_lengths(number).tolist()):
+            sequence[bases[start:start + length]] = GAP
+
+    def leaves(self):
+        # yield (ID, aligned sequence (bytes)) of each sequence
+        paths = sorted(self.nodes)
+        weights = self.rng.gamma(0.5, size=len(paths))
+        parents = self.rng.choice(len(paths), size=self.number, p=weights / weights.sum())
+        for number, parent in enumerate(parents.tolist()):
+            path = paths[parent]
+            sequence = self.nodes[path].copy()
+            # the leaf branch has no insertion: its share of indels are deletions
+            self.evolve(sequence, deletions=self.indel)
+            bases = np.nonzero(sequence != GAP)[0]
+            if len(bases):
+                sites = self.sample(bases, self.ambiguity)
+                sequence[sites] = AMBIGUITY[sequence[sites], self.rng.randint(0, AMBIGUITY.shape[1], len(sites))]
+            if self.rng.random_sample() < self.partial:
+                head, tail = (self.rng.random_sample(2) * self.truncation * self.length).astype(int).tolist()
+                sequence[:head] = GAP
+                sequence[self.length - tail:] = GAP
+            seq_id = "S{:07d}_{}".format(number, ".".join(map(str, path)))
+            yield seq_id, ALPHABET[sequence].tobytes()
+
+    def write(self, prefix):
+        with open(prefix + ".msa", "wb") as msa, open(prefix + ".fa", "wb") as fa:
+            for seq_id, sequence in self.leaves():
+                header = ">{}\n".format(seq_id).encode("ascii")
+                msa.write(header + sequence + b"\n")
+                fa.write(header + sequence.replace(b"-", b"") + b"\n")
+
+
+def main():
+    options, args = argsParse()
+    root = read_seed(options.input) if options.input else options.length
+    family = SyntheticFamily(root, number=options.number, branching=options.branching, depth=options.depth,
+                             substitution=options.substitution, indel=options.indel, insertion=options.insertion,
+                             indel_length=options.indel_length, ambiguity=options.ambiguity,
+                             partial=options.partial, truncation=options.truncation, seed=options.seed)
+    family.write(options.out)
+    print("INFO {} sequences, alignment of {} columns: {}.msa, {}.fa".format(options.number, family.length,
+                                                                             options.out, options.out))
+
+
+if __name__ == "__main__":
+    main()
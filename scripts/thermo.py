@@ -0,0 +1,145 @@
+#!/bin/python
+"""
+Nearest-neighbor (NN) Tm, delta H and delta S of many primers at once.
+Primers of the same length are given as a (primers x length) uint8 array of base codes (A=0, C=1, G=2, T=3),
+see encode_primers. Salt and Mg2+ corrections only depend on the PCR buffer, so they are computed once per
+Thermodynamics object instead of once per primer.
+Results are the same as Calc_Tm_v2 of multiPrime-core (monovalent cations: Owczarzy et al., 2004;
+divalent cations: Owczarzy et al., 2008).
+"""
+__date__ = "2026-10-17"
+__license__ = "MIT"
+
+import math
+import numpy as np
+
+##############################################################################################
+base2bit = {"A": 0, "C": 1, "G": 2, "T": 3, "#": 4}
+
+# ASCII code ==> base code. Characters other than A, C, G and T ==> 4, which contributes nothing.
+BASE_CODE_TABLE = np.full(256, 4, dtype=np.uint8)
+for base, code in base2bit.items():
+    BASE_CODE_TABLE[ord(base)] = code
+
+##############################################################################################
+# 37°C and 1 M NaCl. Row: 3' base of the NN pair, column: 5' base.
+Htable2 = np.array([[-7.9, -8.5, -8.2, -7.2, 0],
+                    [-8.4, -8, -9.8, -8.2, 0],
+                    [-7.8, -10.6, -8, -8.5, 0],
+                    [-7.2, -7.8, -8.4, -7.9, 0],
+                    [0, 0, 0, 0, 0]])
+Stable2 = np.array([[-22.2, -22.7, -22.2, -21.3, 0],
+                    [-22.4, -19.9, -24.4, -22.2, 0],
+                    [-21, -27.2, -19.9, -22.7, 0],
+                    [-20.4, -21, -22.4, -22.2, 0],
+                    [0, 0, 0, 0, 0]])
+# A, C, G, T, #
+H_adjust_initiation = np.array([2.3, 0.1, 0.1, 2.3, 0])
+S_adjust_initiation = np.array([4.1, -2.8, -2.8, 4.1, 0])
+S_symmetry_correction = -1.4
+Kelvin = 273.15
+# reference (Owczarzy et al.,2008)
+crossover_point = 0.22
+# A <=> T, C <=> G
+COMPLEMENT_CODE = np.array([3, 2, 1, 0, 4], dtype=np.uint8)
+
+
+def encode_primers(primers):
+    # primers of the same length ==> (primers x length) uint8 base codes
+    primers = list(primers)
+    if not primers:
+        return np.zeros((0, 0), dtype=np.uint8)
+    codes = BASE_CODE_TABLE[np.frombuffer("".join(primers).encode("ascii"), dtype=np.uint8)]
+    return codes.reshape(len(primers), -1)
+
+
+def symmetry_array(codes):
+    # The first half equals the complement of the second half (same rule as symmetry() in multiPrime-core).
+    length = codes.shape[1]
+    if length % 2 == 1:
+        return np.zeros(codes.shape[0], dtype=bool)
+    half = length // 2
+    return (codes[:, :half] == COMPLEMENT_CODE[codes[:, half:]]).all(axis=1)
+
+
+def deltaH_deltaS_array(codes):
+    # (primers x length) ==> delta H (cal/mol), delta S (cal/K/mol)
+    n, length = codes.shape
+    delta_H = np.zeros(n)
+    delta_S = np.zeros(n)
+    # accumulated NN by NN, so the rounding is the same as a scalar loop over the primer
+    for idx in range(length - 1):
+        delta_H += Htable2[codes[:, idx + 1], codes[:, idx]]
+        delta_S += Stable2[codes[:, idx + 1], codes[:, idx]]
+    delta_H += H_adjust_initiation[codes[:, 0]] + H_adjust_initiation[codes[:, -1]]
+    delta_S += S_adjust_initiation[codes[:, 0]] + S_adjust_initiation[codes[:, -1]]
+    delta_S[symmetry_array(codes)] += S_symmetry_correction
+    return delta_H * 1000, delta_S
+
+
+def GC_fraction_array(codes):
+    # GC fraction rounded to 3 decimals, as GC_fraction in multiPrime-core
+    length = codes.shape[1]
+    gc_number = ((codes == 1) | (codes == 2)).sum(axis=1)
+    gc_table = np.array([round(gc / length, 3) for gc in range(length + 1)])
+    return gc_table[gc_number]
+
+
+class Thermodynamics(object):
+    # concentrations: primer (ng/ul), monovalent, divalent cations and dNTP (mmol/L)
+    def __init__(self, Mo_concentration=50, Di_concentration=1.5, dNTP_concentration=0.25,
+                 primer_concentration=100):
+        self.Mo_concentration = Mo_concentration
+        self.Di_concentration = Di_concentration
+        self.dNTP_concentration = dNTP_concentration
+        self.primer_concentration = primer_concentration
+        # Monovalent cations are typically present as K+ and Tris+ in PCR buffer,
+        # K+ is similar to Na+ in regard to duplex stabilization
+        Tm_Na_adjust = Mo_concentration
+        salt_adjust = math.log(Tm_Na_adjust / 1000.0, math.e)
+        if dNTP_concentration >= Di_concentration:
+            free_divalent = 0.00000000001
+        else:
+            free_divalent = (Di_concentration - dNTP_concentration) / 1000.0
+        R_div_monov_ratio = (math.sqrt(free_divalent)) / (Mo_concentration / 1000)
+        self.monovalent = R_div_monov_ratio < crossover_point
+        if self.monovalent:
+            # use only monovalent salt correction, [equation 22] (Owczarzy et al., 2004).
+            # correction = (4.29 * GC - 3.95) * 10^-5 * salt_adjust + correction_constant
+            self.salt_adjust = salt_adjust
+            self.correction_constant = 9.40 * pow(10, -6) * (pow(salt_adjust, 2))
+        else:
+            # magnesium effects are dominant, [equation 16] (Owczarzy et al., 2008) is used
+            a = 3.92 * pow(10, -5)
+            b = - 9.11 * pow(10, -6)
+            if R_div_monov_ratio < 6.0:
+                a = 3.92 * pow(10, -5) * (0.843 - (0.352 * math.sqrt(Tm_Na_adjust / 1000.0) * salt_adjust))
+            # Eq 16 as evaluated by Calc_Tm_v2: its GC and length terms stand on their own lines and are
+            # not part of the correction, so the correction does not depend on the primer.
+            self.correction_constant = a + (b * math.log(free_divalent, math.e))
+        # Equation A (self-complementary) and Equation B
+        self.entropy_symmetry = 1.9872 * math.log(primer_concentration / (1 * pow(10, 9)), math.e)
+        self.entropy = 1.9872 * math.log(primer_concentration / (4 * pow(10, 9)), math.e)
+
+    def calc(self, codes):
+        # (primers x length) uint8 ==> Tm (rounded to 2 decimals), delta H, delta S, GC fraction
+        codes = np.asarray(codes, dtype=np.uint8)
+        delta_H, delta_S = deltaH_deltaS_array(codes)
+        GC = GC_fraction_array(codes)
+        if self.monovalent:
+            correction = (((4.29 * GC) - 3.95) * pow(10, -5) * self.salt_adjust) + self.correction_constant
+        else:
+            correction = self.correction_constant
+        entropy = np.where(symmetry_array(codes), self.entropy_symmetry, self.entropy)
+        Tm = 1 / ((1 / (delta_H / (delta_S + entropy))) + correction) - Kelvin
+        # python round (not np.round) to get the same decimals as Calc_Tm_v2
+        Tm = np.array([round(t, 2) for t in Tm.tolist()])
+        return Tm, delta_H, delta_S, GC
+
+    def Tm(self, primers):
+        # Tm of each primer (same length), as a list
+        return self.calc(encode_primers(primers))[0].tolist()
+
+
+# buffer of multiPrime: 50 mM monovalent, 1.5 mM Mg2+, 0.25 mM dNTP, 100 ng/ul primer
+default_thermodynamics = Thermodynamics()
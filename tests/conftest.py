@@ -0,0 +1,5 @@
+# The scripts import their sibling modules directly: run the tests with scripts/ on the path.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
@@ -0,0 +1,42 @@
+# HairpinDetector (hairpin.py) against the expansion-based search of get_multiPrime / multiPrime-core:
+# a 5-mer expansion of [n, n + 5) whose reverse complement is found in an expansion of [n + 5 + distance:].
+import re
+
+import numpy as np
+import pytest
+
+from degenerate import RC, degenerate_seq
+from hairpin import HairpinDetector
+
+adaptor = "TCTTTCCCTACACGACGCTCTTCCGATCT"
+
+
+def reference(primer, distance):
+    for n in range(len(primer) - 5 - 5 - distance + 1):
+        for k in degenerate_seq(primer[n:n + 5]):
+            for l in degenerate_seq(primer[n + 5 + distance:]):
+                if re.search(RC(k), l):
+                    return True
+    return False
+
+
+def primers(length, number=400):
+    rng = np.random.RandomState(length)
+    codes = list("ACGTRYMKSWHBVDN")
+    p = [0.2] * 4 + [0.2 / 11] * 11
+    for i in range(number):
+        primer = "".join(rng.choice(codes, length, p=p))
+        if i % 2 == 0:
+            # a stem and its reverse complement downstream
+            n = rng.randint(0, length - 13)
+            j = rng.randint(n + 9, length - 4)
+            primer = (primer[:j] + RC(primer[n:n + 5]) + primer[j + 5:])[:length]
+        yield primer
+
+
+@pytest.mark.parametrize("length", [14, 18, 20])
+def test_hairpin(length):
+    detector = HairpinDetector(4)
+    for primer in primers(length):
+        for prefix in ["", adaptor[-10:]]:
+            assert detector.check(primer, prefix) == reference(prefix + primer, 4), (prefix, primer)
@@ -0,0 +1,63 @@
+# Matching rule of the (n)-nt variation coverage (mismatch.py, mis_primer_check of multiPrime-core):
+# a variant base matches a primer base if it is one of the bases of the IUPAC code; a gap is a mismatch.
+import numpy as np
+import pytest
+
+from degenerate import degenerate_base
+from mismatch import MismatchKernel
+
+codes = "ACGTRYMKSWHBVDN"
+
+
+def bases_of(code):
+    return set(degenerate_base.get(code, [code]))
+
+
+def reference(primer, variant, Y_strict, Y_strict_R):
+    positions = [i for i, (p, v) in enumerate(zip(primer, variant)) if v not in bases_of(p)]
+    return len(positions), bool(set(positions) & set(Y_strict)), bool(set(positions) & set(Y_strict_R))
+
+
+@pytest.mark.parametrize("code", list(codes))
+def test_single_base(code):
+    kernel = MismatchKernel(1, [0], [])
+    variants = ["A", "C", "G", "T", "-"]
+    mismatch_number, F_strict, R_strict = kernel.check(code, variants)
+    expected = [0 if v in bases_of(code) else 1 for v in variants]
+    assert mismatch_number.tolist() == expected
+    assert F_strict.tolist() == [bool(e) for e in expected]
+    assert not R_strict.any()
+
+
+def test_pinned_pairs():
+    # pairs the former score-difference rule (Y_distance) got wrong, and gaps
+    kernel = MismatchKernel(1, [], [])
+    matches = [("R", "A"), ("R", "G"), ("K", "G"), ("K", "T"), ("S", "G"), ("S", "C"), ("B", "G"), ("B", "C"),
+               ("B", "T"), ("D", "G"), ("N", "A"), ("N", "G")]
+    mismatches = [("H", "G"), ("V", "T"), ("D", "C"), ("N", "-"), ("A", "-"), ("A", "G")]
+    for primer, variant in matches:
+        assert kernel.check(primer, [variant])[0].tolist() == [0], (primer, variant)
+    for primer, variant in mismatches:
+        assert kernel.check(primer, [variant])[0].tolist() == [1], (primer, variant)
+
+
+@pytest.mark.parametrize("length", [6, 16, 18, 33])
+def test_random_windows(length):
+    # several uint64 words and forbidden 3'-end positions of primer-F (Y_strict) and primer-R (Y_strict_R)
+    rng = np.random.RandomState(length)
+    Y_strict = [length - 1, length - 2, length - 4]
+    Y_strict_R = [0, 1, 3]
+    kernel = MismatchKernel(length, Y_strict, Y_strict_R)
+    for i in range(50):
+        primer = "".join(rng.choice(list(codes), length, p=[0.2] * 4 + [0.2 / 11] * 11))
+        variants = ["".join(rng.choice(list("ACGT-"), length, p=[0.24] * 4 + [0.04])) for j in range(20)]
+        # variants close to the primer
+        for j in range(20):
+            variant = [rng.choice(sorted(bases_of(p))) for p in primer]
+            for site in rng.randint(0, length, rng.randint(0, 3)):
+                variant[site] = rng.choice(list("ACGT-"))
+            variants.append("".join(variant))
+        mismatch_number, F_strict, R_strict = kernel.check(primer, variants)
+        for idx, variant in enumerate(variants):
+            assert (mismatch_number[idx], F_strict[idx], R_strict[idx]) == \
+                   reference(primer, variant, Y_strict, Y_strict_R), (primer, variant)
@@ -0,0 +1,95 @@
+# Regression test of nn_matrix.py against the pandas state_matrix / trans_matrix of multiPrime-core_V16.py
+# (baseline version, kept below as the reference).
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dprime import load_core
+from nn_matrix import bases, variant_codes, frequency_matrix, transition_tensor
+
+di_bases = [i + j for i in bases for j in bases]
+
+
+def reference_state_matrix(cover):
+    primers_db = []
+    for sequence, number in cover.items():
+        primers_db.extend(repeat(list(sequence), number))
+    primers_db = pd.DataFrame(primers_db)
+    pieces = []
+    for col in primers_db.columns.values:
+        tmp_series = primers_db[col].value_counts()
+        tmp_series.name = col
+        pieces.append(tmp_series)
+    nodes = pd.concat(pieces, axis=1)
+    nodes.fillna(0, inplace=True)
+    nodes = nodes.sort_index(ascending=True)
+    nodes = nodes.astype(int)
+    row_names = nodes.index.values.tolist()
+    if "-" in row_names:
+        nodes.drop("-", inplace=True, axis=0)
+    return nodes
+
+
+def reference_trans_matrix(primers):
+    primers_trans = []
+    for i in primers.keys():
+        primers_trans.extend(repeat([i[j:j + 2] for j in range(len(i) - 1)], primers[i]))
+    primers_di_db = pd.DataFrame(primers_trans)
+    pieces = []
+    for col in primers_di_db.columns.values:
+        pieces.append([list(primers_di_db[col]).count(i) for i in di_bases])
+    a, b = primers_di_db.shape
+    return np.array(pieces).reshape(b, 4, 4)
+
+
+def random_cover(rng, alphabet, p, length=18):
+    # {sequence: number} of a window: a few variants of one seed sequence
+    seed = rng.choice(alphabet, length, p=p)
+    cover = {}
+    for i in range(rng.randint(1, 30)):
+        variant = seed.copy()
+        sites = rng.randint(0, length, rng.randint(0, 4))
+        variant[sites] = rng.choice(alphabet, len(sites), p=p)
+        cover["".join(variant)] = cover.get("".join(variant), 0) + int(rng.randint(1, 50))
+    return cover
+
+
+def windows():
+    rng = np.random.RandomState(0)
+    covers = []
+    for i in range(100):
+        covers.append(random_cover(rng, list("ACGT"), None))
+        # gapped windows
+        covers.append(random_cover(rng, list("ACGT-"), [0.22, 0.22, 0.22, 0.22, 0.12]))
+        # GC-only windows: missing rows of the frequency matrix
+        covers.append(random_cover(rng, list("GC"), None))
+    return covers
+
+
+@pytest.fixture(scope="module")
+def core():
+    return load_core()
+
+
+@pytest.mark.parametrize("cover", windows())
+def test_state_matrix(core, cover):
+    expected = reference_state_matrix(cover)
+    codes, counts = variant_codes(cover)
+    freq = frequency_matrix(codes, counts)
+    # NN_degenerate.state_matrix does not use the instance
+    nodes = core.NN_degenerate.state_matrix(None, cover)
+    assert nodes.index.tolist() == expected.index.tolist()
+    assert nodes.columns.tolist() == expected.columns.tolist()
+    assert np.array_equal(nodes.values, expected.values)
+    assert np.array_equal(freq[:4][freq[:4].sum(axis=1) > 0], expected.values)
+
+
+@pytest.mark.parametrize("cover", windows())
+def test_trans_matrix(cover):
+    expected = reference_trans_matrix(cover)
+    codes, counts = variant_codes(cover)
+    trans = transition_tensor(codes, counts)
+    assert trans.shape == expected.shape
+    assert np.array_equal(trans, expected)
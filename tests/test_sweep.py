@@ -0,0 +1,30 @@
+# Parameter sweep (-w, NN_degenerate.run_sweep) against separate designs: the same outputs and filter reports,
+# also for grid points with different start / stop regions (coverage).
+import os
+import re
+
+from dprime import DEFAULTS, NN_degenerate
+
+alignment = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data", "comparison",
+                         "1000_fasta.msa")
+
+
+def reports(output):
+    # outfile ==> filter report line without the time
+    return dict(re.findall(r"INFO \S+ \S+ (\S+): (.*)", output))
+
+
+def test_sweep_coverage(tmp_path, capsys):
+    parameters = dict(DEFAULTS, nproc=1)
+    coverages = [0.5, 0.99]
+    sweep = NN_degenerate(alignment, outfile=str(tmp_path / "sweep"), **parameters)
+    sweep.run_sweep([{"coverage": coverage} for coverage in coverages])
+    sweep_reports = reports(capsys.readouterr().out)
+    for k, coverage in enumerate(coverages):
+        single = NN_degenerate(alignment, outfile=str(tmp_path / "single_{}".format(k)),
+                               **dict(parameters, coverage=coverage))
+        single.run()
+        single_reports = reports(capsys.readouterr().out)
+        assert sweep_reports[sweep.outfile + ".sweep_{}".format(k)] == single_reports[single.outfile]
+        with open(sweep.outfile + ".sweep_{}".format(k)) as f1, open(single.outfile) as f2:
+            assert f1.read() == f2.read()